@@ -0,0 +1,561 @@
+import argparse
+import array
+import contextlib
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+from multiprocessing.connection import Client, Listener, wait
+
+from clock_engine import (Alarm, ClockStore, InvalidAlarmError, SystemClock, TimingWheel, 
+                          local_seconds, next_alarm_seconds, validate_alarm)
+
+logger = logging.getLogger("alarm_daemon")
+
+# Alarm daemon for very large alarm sets. Alarms are sharded over worker
+# processes by ID (id % workers); each worker loads its own shard straight
+# from the database and files it on a one-second TimingWheel, so adding and
+# expiring an alarm are O(1) and the workers share nothing but their pipes.
+# The semantics are the engine's: 12-hour times and repeat days, one-shot
+# alarms switch off once they have rung, and a snoozed alarm rings again
+# `minutes` later.
+#
+# Workers report to the parent as packed int64 arrays sent with
+# send_bytes(), one message per tick that fired anything:
+#
+#   [FIRED, detected_us, n, key_1 .. key_n, due_1 .. due_n]
+#   [SWITCHED_OFF, 0, n, id_1 .. id_n]
+#
+# Times are local_seconds() (microseconds for detected_us) and a negative
+# key is a snoozed alarm ringing again. Decoding a batch is one frombytes()
+# copy, so the parent keeps up with every core firing at once.
+#
+# A running daemon takes changes on a Unix socket that only its user can
+# open, one JSON object per message, answered by {"ok": true, ...} or
+# {"ok": false, "error": "..."}:
+#
+#   {"op": "add", "alarms": [{"hour": 7, "minute": 30, "ampm": "AM",
+#                             "label": "Wake", "repeat": ["Mon"]}]}
+#   {"op": "remove", "ids": [12, 13]}
+#   {"op": "snooze", "id": 12, "minutes": 5}
+#
+# `alarm_daemon.py --add 7:30 AM --label Wake`, `--remove 12 13` and
+# `--snooze 12` send them from the command line.
+
+READY, FIRED, SWITCHED_OFF, DONE = range(4)
+
+def default_control_path():
+    return os.path.join(os.path.expanduser("~"), ".alarm_daemon.sock")
+
+def pack(kind, stamp, *columns):
+    message = array.array('q', (kind, stamp, len(columns[0]) if columns else 0))
+    for column in columns:
+        message.extend(column)
+    return message.tobytes()
+
+def unpack(data):
+    message = array.array('q')
+    message.frombytes(data)
+    return message[0], message[1], message[2], message[3:]
+
+def percentile(values, p):
+    # Nearest-rank percentile of a sorted list, or None if it is empty
+    if not values:
+        return None
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+def local_now_us(clock):
+    now = clock.now()
+    return local_seconds(now) * 1000000 + now.microsecond
+
+class AlarmShard:
+    # One worker's alarms on a timing wheel keyed by alarm ID. A snoozed
+    # alarm waits under its negated ID, so it rings again without disturbing
+    # its regular schedule.
+    def __init__(self, now):
+        self.alarms = {}
+        self.wheel = TimingWheel(now)
+
+    def add(self, alarms):
+        now = self.wheel.now
+        for alarm in alarms:
+            self.alarms[alarm.id] = alarm
+            if alarm.active:
+                self.wheel.push(alarm.id, next_alarm_seconds(alarm, now))
+            else:
+                self.wheel.discard(alarm.id)
+
+    def remove(self, alarm_ids):
+        for alarm_id in alarm_ids:
+            self.alarms.pop(alarm_id, None)
+            self.wheel.discard(alarm_id)
+            self.wheel.discard(-alarm_id)
+
+    def snooze(self, alarm_id, minutes):
+        if alarm_id in self.alarms:
+            self.wheel.push(-alarm_id, self.wheel.now + int(minutes * 60))
+
+    def advance(self, now):
+        # Fire everything due by `now`: returns the fired (key, due) columns
+        # and the IDs of one-shot alarms that switched off
+        keys = array.array('q')
+        dues = array.array('q')
+        switched_off = array.array('q')
+        for deadline, key in self.wheel.pop_due(now):
+            keys.append(key)
+            dues.append(deadline)
+            if key < 0:
+                continue
+            alarm = self.alarms[key]
+            if alarm.repeat_mask:
+                self.wheel.push(key, next_alarm_seconds(alarm, max(deadline, now)))
+            else:
+                alarm.active = False
+                switched_off.append(key)
+        return keys, dues, switched_off
+
+def send_fired(events, shard, clock):
+    keys, dues, switched_off = shard.advance(local_seconds(clock.now()))
+    if keys:
+        events.send_bytes(pack(FIRED, local_now_us(clock), keys, dues))
+    if switched_off:
+        events.send_bytes(pack(SWITCHED_OFF, 0, switched_off))
+    return len(keys)
+
+def serve_shard(shard, clock, commands, events):
+    # Tick just after each second boundary, applying commands in between
+    while True:
+        send_fired(events, shard, clock)
+        if commands.poll(1.001 - clock.now().microsecond / 1e6):
+            while commands.poll():
+                command = commands.recv()
+                if command[0] == 'stop':
+                    return
+                getattr(shard, command[0])(*command[1:])
+
+def run_worker(db_path, shards, index, commands, events):
+    # Worker process entry point
+    clock = SystemClock()
+    store = ClockStore(db_path)
+    shard = AlarmShard(local_seconds(clock.now()))
+    shard.add(store.load_alarms(shards, index))
+    store.conn.close()
+    events.send_bytes(pack(READY, len(shard.alarms)))
+    try:
+        serve_shard(shard, clock, commands, events)
+    except (EOFError, BrokenPipeError, KeyboardInterrupt):
+        pass
+
+class AlarmDaemon:
+    # Parent side: starts one worker per shard, routes changes to the shard
+    # that owns each alarm, persists one-shot alarms switching off and keeps
+    # fire latency statistics, measured from each alarm's due second to the
+    # moment its event reaches the parent.
+    REPORT_SECONDS = 60
+
+    def __init__(self, db_path, workers=None, on_fired=None):
+        self.db_path = db_path
+        self.workers = workers or os.cpu_count() or 1
+        self.on_fired = on_fired
+        self.clock = SystemClock()
+        self.store = None
+        self.processes = []
+        self.commands = []
+        self.events = []
+        self.loaded = 0
+        self.fired = 0
+        self.latencies_ms = []
+        self.listener = None
+        self._accepted = queue.SimpleQueue()
+        self._wakeup = None
+        self._running = False
+
+    def start(self, target=run_worker, args=()):
+        self.store = ClockStore(self.db_path)
+        for index in range(self.workers):
+            commands, worker_commands = multiprocessing.Pipe(duplex=False)
+            worker_events, events = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(
+                target=target, args=(self.db_path, self.workers, index, commands, events) + args,
+                name=f"alarm-shard-{index}", daemon=True)
+            process.start()
+            events.close()
+            commands.close()
+            self.processes.append(process)
+            self.commands.append(worker_commands)
+            self.events.append(worker_events)
+        # Wait for every shard to load
+        for conn in self.events:
+            kind, count, _, _ = unpack(conn.recv_bytes())
+            self.loaded += count
+        return self
+
+    def shard_of(self, alarm_id):
+        return alarm_id % self.workers
+
+    def add(self, alarms):
+        # Store new alarms and hand them to their shards
+        alarms = list(alarms)
+        self.store.add_alarms(alarms)
+        shards = [[] for _ in range(self.workers)]
+        for alarm in alarms:
+            shards[self.shard_of(alarm.id)].append(alarm)
+        for index, batch in enumerate(shards):
+            if batch:
+                self.commands[index].send(('add', batch))
+        return alarms
+
+    def remove(self, alarm_ids):
+        self.store.delete_alarm_ids(alarm_ids)
+        shards = [[] for _ in range(self.workers)]
+        for alarm_id in alarm_ids:
+            shards[self.shard_of(alarm_id)].append(alarm_id)
+        for index, batch in enumerate(shards):
+            if batch:
+                self.commands[index].send(('remove', batch))
+
+    def snooze(self, alarm_id, minutes=5):
+        self.commands[self.shard_of(alarm_id)].send(('snooze', alarm_id, minutes))
+
+    def listen(self, path):
+        # Accept control clients on a Unix socket. Connections are accepted
+        # on a thread and handed to run(), which owns the store and pipes.
+        # A socket left behind by an earlier run is replaced, unless another
+        # daemon is still answering on it.
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX)
+            try:
+                probe.connect(path)
+            except OSError:
+                os.unlink(path)
+            else:
+                raise OSError(f"Another daemon is listening on {path}")
+            finally:
+                probe.close()
+        old_umask = os.umask(0o077)
+        try:
+            self.listener = Listener(path, 'AF_UNIX')
+        finally:
+            os.umask(old_umask)
+        self._wakeup, notify = multiprocessing.Pipe(duplex=False)
+        threading.Thread(target=self._accept, args=(notify,), name="alarm-control", 
+                         daemon=True).start()
+        return self
+
+    def _accept(self, notify):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                return
+            self._accepted.put(conn)
+            notify.send_bytes(b'')
+
+    def control(self, request):
+        # Apply one control request and return the reply
+        try:
+            op = request['op']
+            if op == 'add':
+                alarms = []
+                for fields in request['alarms']:
+                    hour, minute = int(fields['hour']), int(fields['minute'])
+                    ampm = str(fields.get('ampm', "AM")).upper()
+                    repeat = list(fields.get('repeat', ()))
+                    validate_alarm(hour, minute, ampm, repeat)
+                    alarms.append(Alarm.from_12h(hour, minute, ampm, 
+                                                 str(fields.get('label', "Alarm")), 
+                                                 str(fields.get('tone', "Classic Alarm")), repeat))
+                return {'ok': True, 'ids': [alarm.id for alarm in self.add(alarms)]}
+            if op == 'remove':
+                self.remove([int(alarm_id) for alarm_id in request['ids']])
+                return {'ok': True}
+            if op == 'snooze':
+                alarm_id = int(request['id'])
+                minutes = float(request.get('minutes', 5))
+                if not self.store.has_alarm(alarm_id):
+                    return {'ok': False, 'error': f"No alarm with id {alarm_id}"}
+                if not 0 < minutes < float('inf'):
+                    return {'ok': False, 'error': "'minutes' must be a positive number"}
+                self.snooze(alarm_id, minutes)
+                return {'ok': True}
+            return {'ok': False, 'error': f"Unknown op: {op!r}"}
+        except KeyError as exc:
+            return {'ok': False, 'error': f"Missing field: {exc.args[0]}"}
+        except (InvalidAlarmError, TypeError, ValueError) as exc:
+            return {'ok': False, 'error': str(exc)}
+
+    def _serve_client(self, conn, clients):
+        try:
+            data = conn.recv_bytes()
+        except (EOFError, OSError):
+            clients.remove(conn)
+            conn.close()
+            return
+        try:
+            request = json.loads(data)
+            if not isinstance(request, dict):
+                raise ValueError("A request is a JSON object")
+        except ValueError as exc:
+            reply = {'ok': False, 'error': str(exc)}
+        else:
+            reply = self.control(request)
+        try:
+            conn.send_bytes(json.dumps(reply).encode('utf-8'))
+        except OSError:
+            clients.remove(conn)
+            conn.close()
+
+    def receive(self, data):
+        kind, stamp, count, columns = unpack(data)
+        if kind == FIRED:
+            keys, dues = columns[:count], columns[count:]
+            received_us = local_now_us(self.clock)
+            self.fired += count
+            self.latencies_ms.extend((received_us - due * 1000000) / 1000 for due in dues)
+            if self.on_fired is not None:
+                self.on_fired(keys, dues)
+        elif kind == SWITCHED_OFF:
+            self.store.set_alarms_active(columns, False)
+        return kind, count
+
+    def latency_report(self):
+        latencies = sorted(self.latencies_ms)
+        if not latencies:
+            return "no alarms fired"
+        return (f"{len(latencies)} fired, latency p50 {percentile(latencies, 0.5):.1f} ms, "
+                f"p99 {percentile(latencies, 0.99):.1f} ms, max {latencies[-1]:.1f} ms")
+
+    def run(self):
+        # Serve worker events until stop() or every worker has exited
+        self._running = True
+        next_report = time.monotonic() + self.REPORT_SECONDS
+        events = list(self.events)
+        clients = []
+        wakeup = [self._wakeup] if self._wakeup is not None else []
+        while self._running and events:
+            for conn in wait(events + clients + wakeup, timeout=1):
+                if conn is self._wakeup:
+                    conn.recv_bytes()
+                    clients.append(self._accepted.get())
+                elif conn in clients:
+                    self._serve_client(conn, clients)
+                else:
+                    try:
+                        self.receive(conn.recv_bytes())
+                    except EOFError:
+                        events.remove(conn)
+            if time.monotonic() >= next_report:
+                if self.latencies_ms:
+                    logger.info("%s", self.latency_report())
+                    self.latencies_ms = []
+                next_report += self.REPORT_SECONDS
+
+    def stop(self):
+        self._running = False
+        if self.listener is not None:
+            path = self.listener.address
+            self.listener.close()
+            self.listener = None
+            with contextlib.suppress(OSError):
+                os.unlink(path)
+        for conn in self.commands:
+            try:
+                conn.send(('stop',))
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        if self.store is not None:
+            self.store.conn.close()
+
+def send_command(path, request):
+    # Send one control request to a running daemon and return its reply
+    with Client(path, 'AF_UNIX') as conn:
+        conn.send_bytes(json.dumps(request).encode('utf-8'))
+        return json.loads(conn.recv_bytes())
+
+def parse_time(text):
+    # "7:30 AM" or "19:30" as (hour, minute, ampm)
+    clock, _, ampm = text.strip().partition(' ')
+    hour, _, minute = clock.partition(':')
+    hour, minute = int(hour), int(minute or 0)
+    if not ampm:
+        ampm = "AM" if hour < 12 else "PM"
+        hour = hour % 12 or 12
+    return hour, minute, ampm.strip().upper()
+
+def log_fired(keys, dues):
+    for key, due in zip(keys, dues):
+        when = datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=due)
+        logger.debug("Alarm %d%s rang, due %s", abs(key), " (snoozed)" if key < 0 else "", when)
+
+# Benchmark: each worker files `count / workers` random alarms and then
+# sweeps a simulated week as fast as it can, streaming its fire batches to
+# the parent; then every worker fires a burst due on the same real second
+# to measure latency under load.
+
+BENCH_BURST = 10000
+BENCH_REPEAT_MASKS = (0, 31, 96, 127, None)
+MASK64 = (1 << 64) - 1
+
+def bench_alarm(seed, alarm_id):
+    # The alarm with `alarm_id` in the benchmark set: a splitmix64 hash of
+    # the seed and the ID picks its time and repeat days, so the set is the
+    # same whatever the number of workers it is sharded over
+    x = (seed * 0x9E3779B97F4A7C15 + alarm_id) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    x ^= x >> 31
+    x, minute_of_day = divmod(x, 1440)
+    x, pick = divmod(x, len(BENCH_REPEAT_MASKS))
+    repeat_mask = BENCH_REPEAT_MASKS[pick]
+    if repeat_mask is None:
+        repeat_mask = x % 128
+    return Alarm(minute_of_day, repeat_mask=repeat_mask, id=alarm_id)
+
+def bench_worker(db_path, shards, index, commands, events, count, seed):
+    start = local_seconds(datetime.datetime(2024, 1, 1))
+    shard = AlarmShard(start)
+    alarms = [bench_alarm(seed, alarm_id) for alarm_id in range(index or shards, count + 1, shards)]
+    shard.add(alarms)
+    events.send_bytes(pack(READY, len(shard.alarms)))
+
+    # Sweep one simulated minute per step, as a live worker would see it
+    commands.recv()
+    fired = 0
+    for now in range(start + 60, start + 7 * 86400 + 1, 60):
+        keys, dues, switched_off = shard.advance(now)
+        if keys:
+            events.send_bytes(pack(FIRED, 0, keys, dues))
+            fired += len(keys)
+    events.send_bytes(pack(DONE, fired))
+
+    # Latency burst on the real clock
+    clock = SystemClock()
+    _, due = commands.recv()
+    shard = AlarmShard(local_seconds(clock.now()))
+    shard.wheel.push_many((-alarm_id, due) for alarm_id in range(1, BENCH_BURST // shards + 1))
+    while shard.wheel:
+        send_fired(events, shard, clock)
+        time.sleep(max(0.0, 1.0005 - clock.now().microsecond / 1e6))
+    events.send_bytes(pack(DONE, 0))
+    commands.recv()
+
+def bench(count, worker_counts, seed=1):
+    results = []
+    for workers in worker_counts:
+        daemon = AlarmDaemon(":memory:", workers)
+        daemon.start(bench_worker, (count, seed))
+
+        started = time.perf_counter()
+        for conn in daemon.commands:
+            conn.send(('go',))
+        fired = 0
+        pending = set(daemon.events)
+        while pending:
+            for conn in wait(list(pending)):
+                kind, _, count_or_total, columns = unpack(conn.recv_bytes())
+                if kind == FIRED:
+                    fired += count_or_total
+                elif kind == DONE:
+                    pending.discard(conn)
+        sweep = time.perf_counter() - started
+
+        due = local_seconds(daemon.clock.now()) + 2
+        for conn in daemon.commands:
+            conn.send(('burst', due))
+        daemon.latencies_ms = []
+        pending = set(daemon.events)
+        while pending:
+            for conn in wait(list(pending)):
+                data = conn.recv_bytes()
+                if unpack(data)[0] == DONE:
+                    pending.discard(conn)
+                else:
+                    daemon.receive(data)
+        latencies = sorted(daemon.latencies_ms)
+        daemon.stop()
+
+        # A burst that fired nothing has no latencies to report
+        result = {'workers': workers, 'alarms': count, 'fired': fired,
+                  'sweep_seconds': round(sweep, 3),
+                  'fires_per_second': round(fired / sweep),
+                  'burst': len(latencies)}
+        for name, p in (('p50', 0.5), ('p99', 0.99), ('max', 1.0)):
+            value = percentile(latencies, p)
+            result[f'latency_{name}_ms'] = None if value is None else round(value, 2)
+        results.append(result)
+        logger.info("%s", results[-1])
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sharded multi-process alarm daemon")
+    parser.add_argument('--db', default=ClockStore.default_path(), help="alarm database path")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: one per core)")
+    parser.add_argument('--bench', type=int, metavar='ALARMS',
+                        help="measure fire throughput and latency with this many alarms, then exit")
+    parser.add_argument('--control', default=default_control_path(), metavar='PATH',
+                        help="Unix socket the daemon takes changes on")
+    parser.add_argument('--add', metavar='TIME', help="add an alarm, e.g. '7:30 AM', to a running daemon")
+    parser.add_argument('--label', default="Alarm", help="label of the alarm added with --add")
+    parser.add_argument('--repeat', default="", help="repeat days of --add, e.g. Mon,Tue")
+    parser.add_argument('--remove', type=int, nargs='+', metavar='ID', 
+                        help="delete alarms from a running daemon")
+    parser.add_argument('--snooze', type=int, metavar='ID', help="snooze an alarm of a running daemon")
+    parser.add_argument('--minutes', type=float, default=5, help="snooze length for --snooze")
+    parser.add_argument('-v', '--verbose', action='store_true', help="log every alarm that rings")
+    args = parser.parse_args(argv)
+    
+    request = None
+    if args.add:
+        try:
+            hour, minute, ampm = parse_time(args.add)
+        except ValueError:
+            parser.error(f"Not a time: {args.add!r}")
+        repeat = [day for day in args.repeat.split(',') if day]
+        request = {'op': 'add', 'alarms': [{'hour': hour, 'minute': minute, 'ampm': ampm, 
+                                            'label': args.label, 'repeat': repeat}]}
+    elif args.remove:
+        request = {'op': 'remove', 'ids': args.remove}
+    elif args.snooze is not None:
+        request = {'op': 'snooze', 'id': args.snooze, 'minutes': args.minutes}
+    if request is not None:
+        try:
+            reply = send_command(args.control, request)
+        except OSError as exc:
+            parser.exit(1, f"No daemon on {args.control}: {exc}\n")
+        print(json.dumps(reply))
+        return 0 if reply.get('ok') else 1
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="%(asctime)s %(message)s")
+    if args.bench:
+        counts = sorted({1, args.workers} | {n for n in (2, 4, 8, 16) if n < args.workers})
+        bench(args.bench, counts)
+        return
+
+    daemon = AlarmDaemon(args.db, args.workers, on_fired=log_fired).start()
+    logger.info("Loaded %d alarms from %s into %d workers", daemon.loaded, args.db, daemon.workers)
+    try:
+        daemon.listen(args.control)
+        logger.info("Taking changes on %s", args.control)
+    except OSError as exc:
+        logger.warning("Control socket not opened: %s", exc)
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.stop()
+
+if __name__ == "__main__":
+    sys.exit(main())
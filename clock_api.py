@@ -0,0 +1,563 @@
+import asyncio
+import collections
+import contextlib
+import ipaddress
+import itertools
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+
+from clock_engine import DAY_NAMES, Alarm, InvalidAlarmError, validate_alarm
+
+logger = logging.getLogger("clock_api")
+
+# Local control API for scripting alarms and timers. An asyncio loop in its
+# own thread serves JSON over HTTP, on a Unix socket or a localhost port:
+#
+#   curl --unix-socket ~/.alarm_clock.sock localhost/ \
+#        -H 'Content-Type: application/json' \
+#        -d '[{"op": "alarms.create", "hour": 7, "minute": 30, "ampm": "AM"}]'
+#
+# A request body is one call or a list of calls, answered by one result or
+# a list of results in the same order, each {"ok": true, "result": ...} or
+# {"ok": false, "error": "..."}. Parsing and socket work stay on the server
+# thread; the calls themselves are queued to the thread that owns the engine
+# (the Tk thread), which drains them in time-boxed slices and runs runs of
+# the same operation as one bulk engine call. A burst of 10k calls therefore
+# costs a few bulk inserts and one list redraw per slice rather than 10k
+# separate redraws, and the clock keeps ticking in between.
+#
+# Web pages can send requests to localhost too, so any request carrying an
+# Origin header is refused, and a POST must be declared application/json,
+# which a browser cannot send cross-origin without a preflight.
+
+DEFAULT_PORT = 8765
+# Largest request body accepted, in bytes
+MAX_BODY = 16 * 1024 * 1024
+# Most header lines accepted per request; each line is also bounded by the
+# stream's 64 KiB line limit
+MAX_HEADER_LINES = 100
+
+class ApiError(Exception):
+    pass
+
+def default_socket_path():
+    return os.path.join(os.path.expanduser("~"), ".alarm_clock.sock")
+
+def parse_address(text):
+    # "unix:PATH" or anything containing a path separator is a Unix socket;
+    # otherwise "[HOST:]PORT" on the loopback interface
+    if text.startswith('unix:'):
+        return ('unix', os.path.expanduser(text[5:]) or default_socket_path())
+    if os.sep in text or '/' in text:
+        return ('unix', os.path.expanduser(text))
+    host, _, port = text.rpartition(':')
+    host = host.strip('[]') or '127.0.0.1'
+    try:
+        port = int(port)
+    except ValueError:
+        raise ApiError(f"Not a socket path or port: {text!r}") from None
+    if host != 'localhost':
+        try:
+            loopback = ipaddress.ip_address(host).is_loopback
+        except ValueError:
+            loopback = False
+        if not loopback:
+            raise ApiError(f"Only loopback addresses are served, not {host!r}")
+    return ('tcp', (host, port))
+
+def alarm_dict(alarm):
+    return {'id': alarm.id, 'hour': alarm.hour, 'minute': alarm.minute, 'ampm': alarm.ampm,
+            'label': alarm.label, 'tone': alarm.tone, 'repeat': alarm.repeat,
+            'active': alarm.active}
+
+def timer_dict(timer, now_ns):
+    if timer.finished:
+        state = 'finished'
+    elif timer.running:
+        state = 'running'
+    else:
+        state = 'paused'
+    return {'name': timer.name, 'seconds': timer.total_ns / 1e9,
+            'remaining': timer.remaining_ns(now_ns) / 1e9, 'state': state}
+
+def _int(args, name, default=None):
+    value = args.get(name, default)
+    if value is None:
+        raise ApiError(f"Missing {name!r}")
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ApiError(f"{name!r} must be an integer")
+    try:
+        return int(value)
+    except ValueError:
+        raise ApiError(f"{name!r} must be an integer") from None
+
+def _str(args, name, default=None):
+    value = args.get(name, default)
+    if not isinstance(value, str) or not value:
+        raise ApiError(f"{name!r} must be a non-empty string")
+    return value
+
+def _bool(args, name, default=None):
+    value = args.get(name, default)
+    if not isinstance(value, bool):
+        raise ApiError(f"{name!r} must be true or false")
+    return value
+
+class ApiCall:
+    __slots__ = ('op', 'args', 'request', 'index')
+
+    def __init__(self, op, args, request, index):
+        self.op = op
+        self.args = args
+        self.request = request
+        self.index = index
+
+class ApiRequest:
+    # One HTTP request's calls and results. Results are filled in on the
+    # engine thread; the last one resolves the server's future.
+    def __init__(self, body, ops):
+        self.single = isinstance(body, dict)
+        calls = [body] if self.single else body
+        if not isinstance(calls, list):
+            raise ApiError("Expected a call object or a list of calls")
+        self.results = [None] * len(calls)
+        self.calls = []
+        for index, args in enumerate(calls):
+            op = args.get('op') if isinstance(args, dict) else None
+            if op in ops:
+                self.calls.append(ApiCall(op, args, self, index))
+            else:
+                self.results[index] = {'ok': False, 'error': f"Unknown op: {op!r}"}
+        self.remaining = len(self.calls)
+        self.loop = None
+        self.future = None
+
+    def set_result(self, index, result):
+        if isinstance(result, Exception):
+            self.results[index] = {'ok': False, 'error': str(result)}
+        else:
+            self.results[index] = {'ok': True, 'result': result}
+        self.remaining -= 1
+        if self.remaining == 0 and self.future is not None:
+            try:
+                self.loop.call_soon_threadsafe(self._resolve)
+            except RuntimeError:
+                # The server stopped while the call was queued
+                pass
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(self.response())
+
+    def response(self):
+        return self.results[0] if self.single else self.results
+
+class AlarmControl:
+    # Runs API calls against an AlarmEngine and a TimerEngine on the thread
+    # that owns them. submit() may be called from any thread; the calls are
+    # picked up by a root.after() poll, so `root` is a Tk root or an
+    # EventLoop as for the engines. The change callbacks run at most once
+    # per drained slice, after the engine has been updated.
+    OPS = {
+        'alarms.create': 'create_alarms',
+        'alarms.list': 'list_alarms',
+        'alarms.toggle': 'toggle_alarms',
+        'alarms.delete': 'delete_alarms',
+        'timers.start': 'start_timers',
+        'timers.stop': 'stop_timers',
+        'timers.pause': 'pause_timers',
+        'timers.resume': 'resume_timers',
+        'timers.list': 'list_timers',
+    }
+    # Poll intervals while calls are arriving and once the queue has been
+    # quiet for IDLE_AFTER_MS
+    POLL_MS = 20
+    IDLE_POLL_MS = 250
+    IDLE_AFTER_MS = 2000
+    # Engine time per slice before the queue yields back to the UI, and the
+    # most calls run as one bulk operation
+    SLICE_MS = 8
+    MAX_GROUP = 1000
+
+    def __init__(self, root, engine, timers, on_alarms_changed=None, on_timers_changed=None):
+        self.root = root
+        self.engine = engine
+        self.timers = timers
+        self.on_alarms_changed = on_alarms_changed
+        self.on_timers_changed = on_timers_changed
+        self.requests = queue.SimpleQueue()
+        self.backlog = collections.deque()
+        self.calls = 0
+        self._after_id = None
+        self._last_call = 0
+
+    def submit(self, request):
+        self.requests.put(request)
+
+    def start(self):
+        if self._after_id is None:
+            self._after_id = self.root.after(self.IDLE_POLL_MS, self._poll)
+
+    def stop(self):
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+
+    def _poll(self):
+        self._after_id = None
+        busy = self.drain()
+        now = time.monotonic()
+        if busy:
+            # More queued than one slice runs: yield just long enough for
+            # Tk to handle input and redraw
+            delay = 1
+        elif now - self._last_call < self.IDLE_AFTER_MS / 1000:
+            delay = self.POLL_MS
+        else:
+            delay = self.IDLE_POLL_MS
+        self._after_id = self.root.after(delay, self._poll)
+
+    def drain(self):
+        # Run queued calls for up to SLICE_MS; returns whether any are left
+        while True:
+            try:
+                request = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            self.backlog.extend(request.calls)
+        if not self.backlog:
+            return False
+        self._last_call = time.monotonic()
+
+        deadline = time.perf_counter() + self.SLICE_MS / 1000
+        changed = set()
+        while self.backlog and time.perf_counter() < deadline:
+            # Consecutive calls to the same op run as one group
+            op = self.backlog[0].op
+            group = []
+            while self.backlog and self.backlog[0].op == op and len(group) < self.MAX_GROUP:
+                group.append(self.backlog.popleft())
+            changed.add(op.partition('.')[0])
+            self.run_group(op, group)
+
+        if 'alarms' in changed and self.on_alarms_changed is not None:
+            self.on_alarms_changed()
+        if 'timers' in changed and self.on_timers_changed is not None:
+            self.on_timers_changed()
+        return bool(self.backlog)
+
+    def run_group(self, op, group):
+        self.calls += len(group)
+        try:
+            results = getattr(self, self.OPS[op])([call.args for call in group])
+        except Exception as exc:
+            logger.exception("API %s failed", op)
+            results = [exc] * len(group)
+        for call, result in zip(group, results):
+            call.request.set_result(call.index, result)
+
+    # Alarms. Each handler takes the arguments of a group of calls and
+    # returns one result or exception per call.
+
+    def alarm_arg(self, args):
+        alarm = self.engine.alarms.get(_int(args, 'id'))
+        if alarm is None:
+            raise ApiError(f"No alarm with id {args['id']}")
+        return alarm
+
+    def create_alarms(self, group):
+        results = []
+        alarms = []
+        for args in group:
+            try:
+                hour = _int(args, 'hour')
+                minute = _int(args, 'minute')
+                ampm = _str(args, 'ampm').upper()
+                repeat = args.get('repeat', [])
+                if not isinstance(repeat, list) or not all(isinstance(day, str) for day in repeat):
+                    raise ApiError("'repeat' must be a list of day names")
+                validate_alarm(hour, minute, ampm, repeat)
+                alarm = Alarm.from_12h(hour, minute, ampm, _str(args, 'label', "Alarm"),
+                                       _str(args, 'tone', "Classic Alarm"),
+                                       [day for day in DAY_NAMES if day in repeat],
+                                       _bool(args, 'active', True))
+            except (ApiError, InvalidAlarmError) as exc:
+                results.append(exc)
+            else:
+                alarms.append(alarm)
+                results.append(alarm)
+        self.engine.add_alarms(alarms)
+        return [result if isinstance(result, Exception) else alarm_dict(result)
+                for result in results]
+
+    def list_alarms(self, group):
+        results = []
+        for args in group:
+            try:
+                offset = _int(args, 'offset', 0)
+                limit = None if args.get('limit') is None else _int(args, 'limit')
+                alarms = self.engine.alarms.values()
+                if args.get('active') is not None:
+                    active = _bool(args, 'active')
+                    alarms = (alarm for alarm in alarms if alarm.active == active)
+                listed = [alarm_dict(alarm) for alarm in
+                          itertools.islice(alarms, max(offset, 0),
+                                           None if limit is None else max(offset, 0) + max(limit, 0))]
+                results.append(listed)
+            except ApiError as exc:
+                results.append(exc)
+        return results
+
+    def toggle_alarms(self, group):
+        # Without "active" an alarm flips; the state of alarms named more
+        # than once in the group carries over from call to call
+        results = []
+        states = {}
+        for args in group:
+            try:
+                alarm = self.alarm_arg(args)
+                current = states.get(alarm.id, (alarm, alarm.active))[1]
+                active = _bool(args, 'active') if 'active' in args else not current
+            except ApiError as exc:
+                results.append(exc)
+            else:
+                states[alarm.id] = (alarm, active)
+                results.append(alarm)
+        self.engine.set_states(list(states.values()))
+        return [result if isinstance(result, Exception) else alarm_dict(result)
+                for result in results]
+
+    def delete_alarms(self, group):
+        results = []
+        deleted = {}
+        for args in group:
+            try:
+                alarm = self.alarm_arg(args)
+                if alarm.id in deleted:
+                    raise ApiError(f"No alarm with id {alarm.id}")
+            except ApiError as exc:
+                results.append(exc)
+            else:
+                deleted[alarm.id] = alarm
+                results.append({'id': alarm.id})
+        self.engine.delete_many(list(deleted.values()))
+        return results
+
+    # Timers, by name. Starting a name that exists restarts it.
+
+    def timer_arg(self, args):
+        name = _str(args, 'name')
+        timer = self.timers.timers.get(name)
+        if timer is None:
+            raise ApiError(f"No timer named {name!r}")
+        return timer
+
+    def _each_timer(self, group, action):
+        results = []
+        for args in group:
+            try:
+                timer = self.timer_arg(args)
+                action(timer.name)
+                results.append(timer_dict(timer, self.timers.now_ns()))
+            except ApiError as exc:
+                results.append(exc)
+        return results
+
+    def start_timers(self, group):
+        results = []
+        for args in group:
+            try:
+                seconds = args.get('seconds')
+                if isinstance(seconds, bool) or not isinstance(seconds, (int, float)) or seconds <= 0:
+                    raise ApiError("'seconds' must be a positive number")
+                timer = self.timers.start(_str(args, 'name', "Timer"), int(seconds * 1e9))
+                results.append(timer_dict(timer, self.timers.now_ns()))
+            except ApiError as exc:
+                results.append(exc)
+        return results
+
+    def stop_timers(self, group):
+        return self._each_timer(group, self.timers.cancel)
+
+    def pause_timers(self, group):
+        return self._each_timer(group, self.timers.pause)
+
+    def resume_timers(self, group):
+        return self._each_timer(group, self.timers.resume)
+
+    def list_timers(self, group):
+        now = self.timers.now_ns()
+        listed = [timer_dict(timer, now) for timer in self.timers.timers.values()]
+        return [listed] * len(group)
+
+class ControlServer:
+    # Serves an AlarmControl over HTTP from an asyncio loop on a daemon
+    # thread. Only POST carries calls; GET / lists the supported ops.
+    def __init__(self, control, address):
+        self.control = control
+        self.kind, self.address = address
+        self.loop = None
+        self.thread = None
+        self._server = None
+        self._ready = threading.Event()
+        self._error = None
+
+    def describe(self):
+        if self.kind == 'unix':
+            return self.address
+        return "http://%s:%d/" % self.address
+
+    def start(self):
+        # Returns once the server is listening; bind errors are raised here
+        self.thread = threading.Thread(target=self._run, name="clock-api", daemon=True)
+        self.thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+        self.control.start()
+        logger.info("Control API listening on %s", self.describe())
+        return self
+
+    def stop(self):
+        self.control.stop()
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=2)
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self._server = self.loop.run_until_complete(self._listen())
+        except OSError as exc:
+            self._error = exc
+            self._ready.set()
+            self.loop.close()
+            return
+        self._ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self._server.close()
+            # Let connections still open finish their coroutines before the
+            # loop closes under them
+            tasks = asyncio.all_tasks(self.loop)
+            if tasks:
+                for task in tasks:
+                    task.cancel()
+                self.loop.run_until_complete(asyncio.wait(tasks))
+            if self.kind == 'unix':
+                with contextlib.suppress(OSError):
+                    os.unlink(self.address)
+            self.loop.close()
+
+    async def _listen(self):
+        if self.kind == 'tcp':
+            host, port = self.address
+            return await asyncio.start_server(self._serve, host, port)
+        # Replace a socket left behind by an earlier run, unless another
+        # instance is still answering on it
+        if os.path.exists(self.address):
+            probe = socket.socket(socket.AF_UNIX)
+            try:
+                probe.connect(self.address)
+            except OSError:
+                os.unlink(self.address)
+            else:
+                raise OSError(f"Another instance is listening on {self.address}")
+            finally:
+                probe.close()
+        old_umask = os.umask(0o177)
+        try:
+            return await asyncio.start_unix_server(self._serve, self.address)
+        finally:
+            os.umask(old_umask)
+
+    async def _serve(self, reader, writer):
+        # HTTP/1.1 with keep-alive, enough for curl, urllib and requests
+        try:
+            while True:
+                try:
+                    request_line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    await self._respond(writer, 400, {'error': "Request line too long"}, False)
+                    break
+                if not request_line:
+                    break
+                try:
+                    headers = await self._read_headers(reader)
+                except ValueError as exc:
+                    await self._respond(writer, 431, {'error': str(exc)}, False)
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    await self._respond(writer, 400, {'error': "Malformed request"}, False)
+                    break
+                if length > MAX_BODY:
+                    await self._respond(writer, 413, {'error': "Request body too large"}, False)
+                    break
+                body = await reader.readexactly(length)
+                keep_alive = (version == 'HTTP/1.1'
+                              and headers.get('connection', '').lower() != 'close')
+                status, payload = await self._dispatch(method, target, headers, body)
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_headers(self, reader):
+        headers = {}
+        for _ in range(MAX_HEADER_LINES + 1):
+            try:
+                line = await reader.readline()
+            except (asyncio.LimitOverrunError, ValueError):
+                raise ValueError("Header line too long") from None
+            if line in (b'\r\n', b'\n', b''):
+                return headers
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        raise ValueError("Too many header lines")
+
+    async def _dispatch(self, method, target, headers, body):
+        if 'origin' in headers:
+            return 403, {'error': "Requests from web pages are not accepted"}
+        if target.partition('?')[0] not in ('/', '/v1'):
+            return 404, {'error': f"No such path: {target}"}
+        if method == 'GET':
+            return 200, {'ops': sorted(self.control.OPS)}
+        if method != 'POST':
+            return 405, {'error': "Use POST"}
+        content_type = headers.get('content-type', '').partition(';')[0].strip().lower()
+        if content_type != 'application/json':
+            return 415, {'error': "Content-Type must be application/json"}
+        try:
+            request = ApiRequest(json.loads(body), self.control.OPS)
+        except (ValueError, ApiError) as exc:
+            return 400, {'error': str(exc)}
+        if request.remaining:
+            request.loop = self.loop
+            request.future = self.loop.create_future()
+            self.control.submit(request)
+            await request.future
+        return 200, request.response()
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode('utf-8')
+        reason = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 
+                  405: "Method Not Allowed", 413: "Payload Too Large", 
+                  415: "Unsupported Media Type", 431: "Request Header Fields Too Large"}[status]
+        writer.write(f"HTTP/1.1 {status} {reason}\r\n"
+                     f"Content-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\n"
+                     f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                     .encode('latin-1') + body)
+        await writer.drain()
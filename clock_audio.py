@@ -0,0 +1,569 @@
+import array
+import importlib.util
+import logging
+import math
+import mmap
+import os
+import queue
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from collections import OrderedDict
+
+logger = logging.getLogger("clock_audio")
+
+# numpy and the audio backends are optional and slow to import, so they are
+# imported the first time a tone is rendered or played, off the startup path
+_optional_modules = {}
+
+def optional_module(name):
+    # The named module, or None if it is not installed
+    if name not in _optional_modules:
+        try:
+            _optional_modules[name] = importlib.import_module(name)
+        except ImportError:
+            _optional_modules[name] = None
+    return _optional_modules[name]
+
+def installed(name):
+    # Whether an optional module could be imported, without importing it
+    if name in _optional_modules:
+        return _optional_modules[name] is not None
+    return importlib.util.find_spec(name) is not None
+
+# Alarm tones are rendered once into 16-bit mono PCM and handed to a sink,
+# so an alarm starts with a dictionary lookup and a queue put rather than a
+# chain of blocking winsound.Beep calls.
+
+SAMPLE_RATE = 22050
+SAMPLE_WIDTH = 2
+PEAK = 0.8 * 32767
+# Ramp at both ends of every note so the note boundaries do not click
+FADE_SECONDS = 0.005
+# Silence between repetitions while an alarm keeps ringing
+LOOP_GAP_SECONDS = 0.5
+
+# Each tone is a list of (start Hz, end Hz, seconds) segments; 0 Hz is a rest
+# and a differing end frequency is a linear sweep
+BUILTIN_TONES = {
+    "Classic Alarm": [(800, 800, 0.5)],
+    "Beep Pattern": [segment for freq in (600, 800, 1000)
+                     for segment in ((freq, freq, 0.2), (0, 0, 0.1))],
+    "Chime": [(880, 880, 0.3), (0, 0, 0.2)] * 3,
+    "Melody": [segment for freq, seconds in ((659, 0.3), (587, 0.3), (523, 0.3), (587, 0.3),
+                                             (659, 0.3), (659, 0.3), (659, 0.6))
+               for segment in ((freq, freq, seconds), (0, 0, 0.05))],
+    "Siren": [(800, 1200, 1.0), (1200, 800, 1.0)]
+}
+DEFAULT_TONE = "Classic Alarm"
+
+def volume_gain(volume):
+    # Map the 0-100 volume setting to an amplitude factor; squaring it
+    # tracks loudness more closely than a linear scale
+    volume = min(max(volume, 0), 100) / 100
+    return volume * volume
+
+def _segment_numpy(start_hz, end_hz, count, phase):
+    numpy = optional_module('numpy')
+    if not start_hz and not end_hz:
+        return numpy.zeros(count), phase
+    freqs = numpy.linspace(start_hz, end_hz, count, endpoint=False)
+    phases = phase + 2 * math.pi * numpy.cumsum(freqs) / SAMPLE_RATE
+    samples = numpy.sin(phases)
+    fade = min(int(FADE_SECONDS * SAMPLE_RATE), count // 2)
+    if fade:
+        ramp = numpy.linspace(0.0, 1.0, fade, endpoint=False)
+        samples[:fade] *= ramp
+        samples[-fade:] *= ramp[::-1]
+    return samples, float(phases[-1])
+
+def _segment_python(start_hz, end_hz, count, phase):
+    if not start_hz and not end_hz:
+        return [0.0] * count, phase
+    fade = min(int(FADE_SECONDS * SAMPLE_RATE), count // 2)
+    step = (end_hz - start_hz) / count
+    samples = []
+    for i in range(count):
+        phase += 2 * math.pi * (start_hz + step * i) / SAMPLE_RATE
+        envelope = 1.0
+        if i < fade:
+            envelope = i / fade
+        elif i >= count - fade:
+            envelope = (count - 1 - i) / fade
+        samples.append(math.sin(phase) * envelope)
+    return samples, phase
+
+def synthesize(segments):
+    # Render a segment list at full scale. Returns a numpy int16 array when
+    # numpy is installed, otherwise an array('h').
+    counts = [int(seconds * SAMPLE_RATE) for _, _, seconds in segments]
+    phase = 0.0
+    numpy = optional_module('numpy')
+    if numpy is not None:
+        parts = []
+        for (start_hz, end_hz, _), count in zip(segments, counts):
+            samples, phase = _segment_numpy(start_hz, end_hz, count, phase)
+            parts.append(samples)
+        return (numpy.concatenate(parts) * PEAK).astype(numpy.int16)
+    pcm = array.array('h')
+    for (start_hz, end_hz, _), count in zip(segments, counts):
+        samples, phase = _segment_python(start_hz, end_hz, count, phase)
+        pcm.extend(int(sample * PEAK) for sample in samples)
+    return pcm
+
+def scale_pcm(samples, gain):
+    # Little-endian PCM bytes of `samples` scaled by `gain`. `samples` is a
+    # numpy array, an array('h') or a buffer of little-endian 16-bit PCM.
+    numpy = optional_module('numpy')
+    if numpy is not None:
+        if not isinstance(samples, numpy.ndarray):
+            samples = numpy.frombuffer(samples, '<i2' if isinstance(samples, memoryview) else 'h')
+        return (samples * gain).astype('<i2').tobytes()
+    if isinstance(samples, memoryview):
+        samples = decode_pcm(samples, 1, 2, SAMPLE_RATE)
+    scaled = array.array('h', [int(sample * gain) for sample in samples])
+    if sys.byteorder == 'big':
+        scaled.byteswap()
+    return scaled.tobytes()
+
+def pcm_seconds(pcm):
+    return len(pcm) / (SAMPLE_RATE * SAMPLE_WIDTH)
+
+def write_wav(target, pcm):
+    with wave.open(target, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(SAMPLE_WIDTH)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(pcm)
+
+def _temp_wav(pcm):
+    fd, path = tempfile.mkstemp(prefix="alarm-", suffix=".wav")
+    with os.fdopen(fd, 'wb') as f:
+        write_wav(f, pcm)
+    return path
+
+class NullSink:
+    # Plays nothing but remembers the last request; for headless runs and tests
+    def __init__(self):
+        self.plays = 0
+        self.last = None
+        self.playing = False
+
+    def play(self, pcm, loops):
+        self.plays += 1
+        self.last = (pcm, loops)
+        self.playing = True
+
+    def stop(self):
+        self.playing = False
+
+class WavFileSink:
+    # Writes each played sound, with its repetitions, to a WAV file on a
+    # background thread; `wait()` blocks until the last write is done
+    def __init__(self, path):
+        self.path = path
+        self._writer = None
+
+    def play(self, pcm, loops):
+        self.wait()
+        self._writer = threading.Thread(target=self._write, args=(pcm, loops), daemon=True)
+        self._writer.start()
+
+    def _write(self, pcm, loops):
+        with wave.open(self.path, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(SAMPLE_WIDTH)
+            wav.setframerate(SAMPLE_RATE)
+            for _ in range(loops):
+                wav.writeframes(pcm)
+
+    def stop(self):
+        pass
+
+    def wait(self):
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+
+class SimpleAudioBackend:
+    def start(self, pcm):
+        return optional_module('simpleaudio').play_buffer(pcm, 1, SAMPLE_WIDTH, SAMPLE_RATE)
+
+    def playing(self, handle):
+        return handle.is_playing()
+
+    def finish(self, handle):
+        handle.stop()
+
+class AplayBackend:
+    # ALSA's command line player, present on most Linux desktops
+    def __init__(self, command):
+        self.command = command
+
+    def start(self, pcm):
+        path = _temp_wav(pcm)
+        process = subprocess.Popen([self.command, '-q', path],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return process, path
+
+    def playing(self, handle):
+        return handle[0].poll() is None
+
+    def finish(self, handle):
+        process, path = handle
+        if process.poll() is None:
+            process.terminate()
+            process.wait()
+        os.unlink(path)
+
+class WinsoundBackend:
+    # winsound can only play asynchronously from a file, and cannot report
+    # when it is done, so the end is taken from the buffer length
+    def start(self, pcm):
+        path = _temp_wav(pcm)
+        winsound = optional_module('winsound')
+        winsound.PlaySound(path, winsound.SND_FILENAME | winsound.SND_ASYNC)
+        return path, time.monotonic() + pcm_seconds(pcm)
+
+    def playing(self, handle):
+        return time.monotonic() < handle[1]
+
+    def finish(self, handle):
+        winsound = optional_module('winsound')
+        winsound.PlaySound(None, winsound.SND_PURGE)
+        os.unlink(handle[0])
+
+class BellBackend:
+    # The terminal bell, once per repetition; what DeviceSink falls back to
+    # when its device fails, so an alarm is never silent
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+
+    def start(self, pcm):
+        self.stream.write('\a')
+        self.stream.flush()
+        return time.monotonic() + pcm_seconds(pcm)
+
+    def playing(self, handle):
+        return time.monotonic() < handle
+
+    def finish(self, handle):
+        pass
+
+class DeviceSink:
+    # Plays through a sound device from one worker thread, so play() and
+    # stop() return immediately. A new play() or stop() cuts off whatever
+    # is sounding. If the device fails, the failure is logged and the sink
+    # rings the terminal bell from then on.
+    POLL_SECONDS = 0.02
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.generation = 0
+        self.requests = queue.Queue()
+        self._worker = None
+
+    @classmethod
+    def available(cls):
+        # A DeviceSink for the first backend that works here, or None
+        if installed('simpleaudio'):
+            return cls(SimpleAudioBackend())
+        if installed('winsound'):
+            return cls(WinsoundBackend())
+        command = shutil.which('aplay')
+        if command:
+            return cls(AplayBackend(command))
+        return None
+
+    def play(self, pcm, loops):
+        self.generation += 1
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, daemon=True)
+            self._worker.start()
+        self.requests.put((pcm, loops, self.generation))
+
+    def stop(self):
+        self.generation += 1
+
+    def start(self, pcm):
+        try:
+            return self.backend.start(pcm)
+        except Exception:
+            if isinstance(self.backend, BellBackend):
+                raise
+            logger.exception("Sound device failed, ringing the bell instead")
+            self.backend = BellBackend()
+            return self.backend.start(pcm)
+
+    def _run(self):
+        while True:
+            pcm, loops, generation = self.requests.get()
+            for _ in range(loops):
+                if generation != self.generation:
+                    break
+                try:
+                    handle = self.start(pcm)
+                except Exception:
+                    logger.exception("Could not play the alarm sound")
+                    break
+                try:
+                    while generation == self.generation and self.backend.playing(handle):
+                        time.sleep(self.POLL_SECONDS)
+                finally:
+                    self.backend.finish(handle)
+
+def default_sink():
+    return DeviceSink.available() or NullSink()
+
+class WavFormatError(ValueError):
+    pass
+
+def read_wav_header(f):
+    # Walk the RIFF chunk headers of an open WAV file without reading the
+    # sample data. Returns (channels, sample width, rate, data offset, data size).
+    riff = f.read(12)
+    if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:] != b'WAVE':
+        raise WavFormatError("not a RIFF/WAVE file")
+    fmt = None
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            raise WavFormatError("no data chunk")
+        chunk_id, size = header[:4], int.from_bytes(header[4:], 'little')
+        if chunk_id == b'fmt ':
+            body = f.read(size + (size & 1))
+            tag, channels, rate = struct.unpack('<HHI', body[:8])
+            width = struct.unpack('<H', body[14:16])[0] // 8
+            if tag != 1 or width not in (1, 2) or not channels:
+                raise WavFormatError("only 8 and 16-bit PCM is supported")
+            fmt = (channels, width, rate)
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise WavFormatError("data chunk before fmt chunk")
+            return fmt + (f.tell(), size)
+        else:
+            f.seek(size + (size & 1), os.SEEK_CUR)
+
+def decode_pcm(data, channels, width, rate):
+    # Convert little-endian PCM to mono 16-bit at SAMPLE_RATE
+    numpy = optional_module('numpy')
+    if numpy is not None:
+        if width == 1:
+            samples = (numpy.frombuffer(data, numpy.uint8).astype(numpy.float64) - 128) * 256
+        else:
+            samples = numpy.frombuffer(data, '<i2').astype(numpy.float64)
+        samples = samples[:len(samples) - len(samples) % channels]
+        samples = samples.reshape(-1, channels).mean(axis=1)
+        if rate != SAMPLE_RATE and len(samples):
+            positions = numpy.arange(int(len(samples) * SAMPLE_RATE / rate)) * (rate / SAMPLE_RATE)
+            samples = numpy.interp(positions, numpy.arange(len(samples)), samples)
+        return samples.astype(numpy.int16)
+    if width == 1:
+        samples = [(sample - 128) * 256 for sample in data]
+    else:
+        samples = array.array('h')
+        samples.frombytes(bytes(data[:len(data) - len(data) % 2]))
+        if sys.byteorder == 'big':
+            samples.byteswap()
+    if channels > 1:
+        samples = [sum(samples[i:i + channels]) // channels
+                   for i in range(0, len(samples) - channels + 1, channels)]
+    if rate != SAMPLE_RATE and len(samples):
+        step = rate / SAMPLE_RATE
+        samples = [samples[int(i * step)] for i in range(int(len(samples) / step))]
+    return array.array('h', samples)
+
+class ToneFile:
+    # A WAV file known from its header alone until it is first played
+    def __init__(self, name, path, channels, width, rate, offset, size):
+        self.name = name
+        self.path = path
+        self.channels = channels
+        self.width = width
+        self.rate = rate
+        self.offset = offset
+        self.size = size
+        self._file = None
+        self._map = None
+
+    @property
+    def seconds(self):
+        return self.size / (self.channels * self.width * self.rate)
+
+    @property
+    def playable_as_is(self):
+        return (self.channels, self.width, self.rate) == (1, SAMPLE_WIDTH, SAMPLE_RATE)
+
+    def data(self):
+        # The sample bytes, memory-mapped so only the pages played are read
+        if self._map is None:
+            self._file = open(self.path, 'rb')
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(self._map)[self.offset:self.offset + self.size]
+
+    def samples(self):
+        # Mono 16-bit SAMPLE_RATE audio: the mapped bytes themselves when the
+        # file is already in that format, otherwise a decoded copy
+        if self.playable_as_is:
+            return self.data()
+        data = self.data()
+        try:
+            return decode_pcm(data, self.channels, self.width, self.rate)
+        finally:
+            data.release()
+
+    def close(self):
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # Still referenced by a cached buffer; dropped with it
+                pass
+            self._file.close()
+            self._map = self._file = None
+
+class ToneLibrary:
+    # Index of the user's WAV alarm sounds. Startup only reads file headers;
+    # the audio is mapped or decoded when a tone is first played.
+    def __init__(self, directory):
+        self.directory = directory
+        self.tones = {}
+
+    @staticmethod
+    def default_directory():
+        return os.environ.get('ALARM_CLOCK_TONES') or os.path.join(
+            os.path.expanduser('~'), '.ultimate_alarm_clock_tones')
+
+    def scan(self, reserved=()):
+        # Index every readable .wav file by name, skipping names in `reserved`
+        self.close()
+        self.tones = {}
+        try:
+            entries = sorted(os.scandir(self.directory), key=lambda entry: entry.name.lower())
+        except OSError:
+            return self.tones
+        for entry in entries:
+            name, ext = os.path.splitext(entry.name)
+            if ext.lower() != '.wav' or not entry.is_file():
+                continue
+            if name in reserved or name in self.tones:
+                logger.warning("Skipping %s: a tone named %r already exists", entry.path, name)
+                continue
+            try:
+                with open(entry.path, 'rb') as f:
+                    header = read_wav_header(f)
+            except (OSError, struct.error, WavFormatError) as e:
+                logger.warning("Skipping %s: %s", entry.path, e)
+                continue
+            self.tones[name] = ToneFile(name, entry.path, *header)
+        return self.tones
+
+    def close(self):
+        for tone in self.tones.values():
+            tone.close()
+
+class PcmCache:
+    # LRU of rendered buffers bounded by their total size in bytes
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            pcm = self._items.get(key)
+            if pcm is not None:
+                self._items.move_to_end(key)
+            return pcm
+
+    def put(self, key, pcm):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            if len(pcm) > self.max_bytes:
+                return
+            self._items[key] = pcm
+            self.bytes += len(pcm)
+            while self.bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.bytes -= len(evicted)
+
+    def __len__(self):
+        return len(self._items)
+
+class ToneAudioSink:
+    # The engine's audio plug-in. Built-in tones are rendered once at full
+    # scale; library tones are mapped or decoded on first use. Volume-scaled
+    # buffers for both are kept in a byte-bounded LRU.
+    CACHE_BYTES = 32 * 1024 * 1024
+
+    def __init__(self, sink=None, tones=None, library=None, cache_bytes=None):
+        self.sink = sink or NullSink()
+        self.tones = dict(tones or BUILTIN_TONES)
+        self.library = library
+        self.cache = PcmCache(cache_bytes or self.CACHE_BYTES)
+        self._samples = {}
+
+    def tone_names(self):
+        names = list(self.tones)
+        if self.library is not None:
+            names.extend(self.library.tones)
+        return names
+
+    def samples(self, tone):
+        if self.library is not None and tone in self.library.tones:
+            return self.library.tones[tone].samples()
+        if tone not in self.tones:
+            tone = DEFAULT_TONE
+        samples = self._samples.get(tone)
+        if samples is None:
+            segments = self.tones[tone] + [(0, 0, LOOP_GAP_SECONDS)]
+            samples = self._samples[tone] = synthesize(segments)
+        return samples
+
+    def pcm(self, tone, volume):
+        # One repetition of `tone` at `volume` as PCM bytes
+        volume = int(round(volume))
+        key = (tone, volume)
+        pcm = self.cache.get(key)
+        if pcm is not None:
+            return pcm
+        samples = self.samples(tone)
+        gain = volume_gain(volume)
+        if gain == 1 and isinstance(samples, memoryview):
+            # A mapped file at full volume is played straight from the mapping
+            return samples
+        if isinstance(samples, memoryview):
+            # Let go of the mapping once scaled, so ToneFile.close() can unmap it
+            with samples:
+                pcm = scale_pcm(samples, gain)
+        else:
+            pcm = scale_pcm(samples, gain)
+        self.cache.put(key, pcm)
+        return pcm
+
+    def warm(self, volume=None):
+        # Render every tone ahead of time, and scale them for `volume`
+        for tone in self.tones:
+            if volume is None:
+                self.samples(tone)
+            else:
+                self.pcm(tone, volume)
+
+    def play(self, tone, volume, duration):
+        # Repeat the tone for roughly `duration` seconds
+        pcm = self.pcm(tone, volume)
+        self.sink.play(pcm, max(1, math.ceil(duration / pcm_seconds(pcm))))
+
+    def play_once(self, tone, volume):
+        self.sink.play(self.pcm(tone, volume), 1)
+
+    def stop(self):
+        self.sink.stop()
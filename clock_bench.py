@@ -0,0 +1,474 @@
+import argparse
+import datetime
+import gc
+import importlib.util
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from clock_engine import (DAY_NAMES, Alarm, AlarmEngine, EventLoop, Stopwatch, TickScheduler, 
+                          VirtualClock, ZoneOffsetCache, local_seconds)
+
+# Benchmarks for the clock's hot paths at realistic scale. Widgets are
+# replaced by fakes that only record what they are asked to do, time comes
+# from a VirtualClock, and results are written as JSON so runs of different
+# versions can be compared with --compare.
+
+ALARM_SIZES = [10, 100, 1000, 10000, 100000, 1000000]
+ZONE_SIZES = [1, 10, 100, 500]
+LAP_SIZES = [10, 1000, 100000]
+QUICK_LIMIT = 10000
+
+class FakeWidget:
+    # Accepts configure() like a label and counts the calls
+    def __init__(self):
+        self.options = {}
+        self.updates = 0
+
+    def configure(self, **options):
+        self.options.update(options)
+        self.updates += 1
+
+    config = configure
+
+    def __setitem__(self, key, value):
+        self.configure(**{key: value})
+
+    def set(self, *args):
+        self.updates += 1
+
+class FakeVar:
+    def __init__(self, value=None):
+        self.value = value
+        self.updates = 0
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+        self.updates += 1
+
+class FakeCanvas:
+    # Tracks live item ids the way Tk does, so growth would show up
+    def __init__(self):
+        self.items = {}
+        self.next_id = 1
+        self.coords_calls = 0
+
+    def _create(self, *args, **options):
+        item = self.next_id
+        self.next_id += 1
+        self.items[item] = args
+        return item
+
+    create_line = create_oval = create_text = _create
+
+    def coords(self, item, *args):
+        self.items[item] = args
+        self.coords_calls += 1
+
+    def delete(self, *items):
+        if items == ("all",):
+            self.items.clear()
+        for item in items:
+            self.items.pop(item, None)
+
+class FakeTreeview:
+    def __init__(self):
+        self.rows = {}
+        self.next_id = 1
+
+    def insert(self, parent, index, iid=None, values=()):
+        if iid is None:
+            iid = f"I{self.next_id:03X}"
+            self.next_id += 1
+        self.rows[iid] = values
+        return iid
+
+    def move(self, iid, parent, index):
+        pass
+
+    def selection_set(self, items):
+        self.selected = list(items)
+
+    def item(self, iid, option=None, **options):
+        if 'values' in options:
+            self.rows[iid] = options['values']
+        elif option == 'values':
+            return self.rows[iid]
+
+    def delete(self, *iids):
+        for iid in iids:
+            del self.rows[iid]
+
+    def get_children(self, item=''):
+        return tuple(self.rows)
+
+    def exists(self, iid):
+        return iid in self.rows
+
+    def yview_moveto(self, fraction):
+        pass
+
+    def see(self, iid):
+        pass
+
+class FakeNotebook:
+    def __init__(self, selected):
+        self.selected = selected
+
+    def select(self, tab=None):
+        return self.selected
+
+def load_app_module():
+    # index-Clock.py is not importable by name because of the hyphen
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "index-Clock.py")
+    spec = importlib.util.spec_from_file_location("alarm_clock_app", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def make_view(app_module, engine, loop):
+    # An AlarmClock with fake widgets and no Tk root behind it
+    view = app_module.AlarmClock.__new__(app_module.AlarmClock)
+    view.root = loop
+    view.engine = engine
+    view.ticker = TickScheduler(loop, engine.clock)
+    view.clock_tab = "clock_tab"
+    view.alarm_tab = "alarm_tab"
+    view.notebook = FakeNotebook(view.clock_tab)
+    view.agenda_version = None
+    view.agenda_tree = FakeTreeview()
+    view.next_alarm_label = FakeWidget()
+    view.clock_label = FakeWidget()
+    view.date_label = FakeWidget()
+    view.world_clocks = []
+    view.rendered = {}
+    view.tab_builders = {}
+    return view
+
+def random_alarms(count, rng):
+    alarms = []
+    for alarm_id in range(1, count + 1):
+        repeat = rng.sample(DAY_NAMES, rng.choice((0, 0, 1, 5, 7)))
+        alarms.append(Alarm.from_12h(
+            rng.randint(1, 12), rng.randint(0, 59), rng.choice(("AM", "PM")), 
+            f"Alarm {alarm_id}", "Classic Alarm", repeat, rng.random() < 0.9, alarm_id))
+    return alarms
+
+def build_engine(size, seed):
+    clock = VirtualClock(datetime.datetime(2024, 1, 1))
+    loop = EventLoop(clock)
+    engine = AlarmEngine(loop, clock=clock)
+    engine.alarms = {alarm.id: alarm for alarm in random_alarms(size, random.Random(seed))}
+    now = clock.now()
+    engine.scheduler.add_many(engine.alarms.values(), now)
+    for alarm in engine.alarms.values():
+        engine.agenda.add(alarm, now)
+    return engine
+
+def traced(build, *args):
+    # Run `build` under tracemalloc and return (result, retained, peak bytes)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build(*args)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current, peak
+
+def summarize(bench, size, timings_ns, memory=None, extra=None):
+    timings = sorted(timings_ns)
+    count = len(timings)
+
+    def percentile(p):
+        return timings[min(count - 1, int(p / 100 * count))] / 1000
+
+    result = {
+        'bench': bench,
+        'size': size,
+        'samples': count,
+        'mean_us': sum(timings) / count / 1000,
+        'p50_us': percentile(50),
+        'p90_us': percentile(90),
+        'p99_us': percentile(99),
+        'max_us': timings[-1] / 1000
+    }
+    if memory is not None:
+        result['retained_bytes'], result['peak_bytes'] = memory
+    if extra:
+        result.update(extra)
+    return result
+
+def bench_check_alarms(size, samples, seed):
+    # One scheduler wakeup per sample, each at the next due deadline
+    engine, current, peak = traced(build_engine, size, seed)
+    clock = engine.clock
+    loop = engine.root
+    timings = []
+    for _ in range(samples):
+        head = engine.scheduler.queue.peek()
+        if head is None:
+            break
+        due_ns = int((head[0] - clock.start).total_seconds() * 1000000000)
+        clock.set_monotonic_ns(due_ns)
+        start = time.perf_counter_ns()
+        loop.run_due()
+        timings.append(time.perf_counter_ns() - start)
+        engine.pending.clear()
+        engine.current_alarm = None
+    return summarize('check_alarms', size, timings, (current, peak))
+
+def build_shard(size, seed):
+    from alarm_daemon import AlarmShard
+    shard = AlarmShard(local_seconds(datetime.datetime(2024, 1, 1)))
+    shard.add(random_alarms(size, random.Random(seed)))
+    return shard
+
+def bench_shard_tick(size, samples, seed):
+    # One daemon worker turning its timing wheel a simulated minute per sample
+    shard, current, peak = traced(build_shard, size, seed)
+    timings = []
+    fired = 0
+    for _ in range(samples):
+        now = shard.wheel.now + 60
+        start = time.perf_counter_ns()
+        fired += len(shard.advance(now)[0])
+        timings.append(time.perf_counter_ns() - start)
+    return summarize('shard_tick', size, timings, (current, peak), extra={
+        'fires_per_second': fired * 1e9 / max(sum(timings), 1)
+    })
+
+def bench_update_next_alarm(app_module, size, samples, seed):
+    # Per-second refresh of the next-alarm label and upcoming list
+    engine, current, peak = traced(build_engine, size, seed)
+    view = make_view(app_module, engine, engine.root)
+    view.notebook.selected = view.alarm_tab
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter_ns()
+        view.update_next_alarm()
+        timings.append(time.perf_counter_ns() - start)
+        engine.clock.advance(1)
+    return summarize('update_next_alarm', size, timings, (current, peak))
+
+def bench_alarm_list(app_module, size, samples, seed):
+    # Jump the virtualized alarm list to random offsets, re-sorting and
+    # re-filtering every tenth sample
+    engine = build_engine(size, seed)
+    view = make_view(app_module, engine, engine.root)
+    view.alarm_tree = FakeTreeview()
+    view.alarm_vsb = FakeWidget()
+    view.alarm_rows = {}
+    view.alarm_selection_label = FakeWidget()
+    view.selected_alarm_ids = set()
+    view.alarm_list_top = 0
+    view.alarm_list_rows = 25
+    _, current, peak = traced(lambda: engine.index)
+    rng = random.Random(seed)
+    sorts = [(field, descending) for field in engine.index.FIELDS for descending in (False, True)]
+    filters = [{}, {'status': 'active'}, {'repeat': 'once'}, {'time': (0, 719)}, {'label': 'alarm 1'}]
+    timings = []
+    for sample in range(samples):
+        start = time.perf_counter_ns()
+        if sample % 10 == 0:
+            engine.index.set_sort(*rng.choice(sorts))
+            engine.index.set_filters(**rng.choice(filters))
+        view.scroll_alarm_list(rng.randrange(max(len(engine.index), 1)))
+        timings.append(time.perf_counter_ns() - start)
+    return summarize('alarm_list', size, timings, (current, peak), 
+                     {'tree_rows': len(view.alarm_tree.rows)})
+
+def bench_draw_analog_clock(app_module, samples):
+    clock = VirtualClock(datetime.datetime(2024, 1, 1))
+    loop = EventLoop(clock)
+    view = make_view(app_module, AlarmEngine(loop, clock=clock), loop)
+    view.analog_canvas = FakeCanvas()
+    view.build_analog_face()
+    items_before = len(view.analog_canvas.items)
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter_ns()
+        view.draw_analog_clock()
+        timings.append(time.perf_counter_ns() - start)
+        clock.advance(1)
+    canvas = view.analog_canvas
+    return summarize('draw_analog_clock', 1, timings, extra={
+        'canvas_items': len(canvas.items),
+        'canvas_item_growth': len(canvas.items) - items_before,
+        'coords_calls': canvas.coords_calls
+    })
+
+def add_world_clocks(view, size):
+    import pytz
+    zones = [tz for tz in pytz.all_timezones if '/' in tz]
+    for tz_name in (zones * (size // len(zones) + 1))[:size]:
+        view.world_clocks.append({
+            'frame': None,
+            'tz': tz_name,
+            'zone': ZoneOffsetCache(pytz.timezone(tz_name)),
+            'day': None,
+            'time_var': FakeVar(),
+            'date_var': FakeVar()
+        })
+
+def bench_update_world_clocks(app_module, size, samples):
+    clock = VirtualClock(datetime.datetime(2024, 1, 1))
+    loop = EventLoop(clock)
+    view = make_view(app_module, AlarmEngine(loop, clock=clock), loop)
+    _, current, peak = traced(add_world_clocks, view, size)
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter_ns()
+        view.update_world_clocks()
+        timings.append(time.perf_counter_ns() - start)
+        clock.advance(1)
+    return summarize('update_world_clocks', size, timings, (current, peak))
+
+def bench_tick(app_module, samples):
+    # One simulated second of the whole display: digital clock, analog face
+    # and world clocks all ticking off the shared frame loop
+    clock = VirtualClock(datetime.datetime(2024, 1, 1, 0, 0, 0, 300000))
+    loop = EventLoop(clock)
+    view = make_view(app_module, AlarmEngine(loop, clock=clock), loop)
+    view.analog_canvas = FakeCanvas()
+    view.build_analog_face()
+    add_world_clocks(view, 10)
+    view.ticker.add('clock', view.update_time)
+    view.ticker.add('next_alarm', view.update_next_alarm)
+    view.ticker.add('analog', view.draw_analog_clock)
+    view.ticker.add('world', view.update_world_clocks)
+    view.ticker.wakeups = 0
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter_ns()
+        loop.advance(1)
+        timings.append(time.perf_counter_ns() - start)
+    labels = (view.clock_label, view.date_label, view.next_alarm_label)
+    return summarize('tick', 1, timings, extra={
+        'wakeups_per_second': view.ticker.wakeups / samples,
+        'ticks_per_second': view.ticker.ticks / samples,
+        'label_updates_per_second': sum(label.updates for label in labels) / samples
+    })
+
+def bench_record_lap(app_module, size, samples):
+    ticks = [0]
+
+    def fake_counter():
+        ticks[0] += 1234567
+        return ticks[0]
+
+    clock = VirtualClock(datetime.datetime(2024, 1, 1))
+    loop = EventLoop(clock)
+    view = make_view(app_module, AlarmEngine(loop, clock=clock), loop)
+    view.lap_tree = FakeTreeview()
+    view.lap_vsb = FakeWidget()
+    view.lap_stats_var = FakeVar()
+    view.lap_rows = {}
+    view.lap_list_top = 0
+    view.lap_list_rows = 25
+    view.stopwatch_digits = 2
+
+    def build():
+        view.stopwatch = Stopwatch(fake_counter)
+        view.stopwatch.start()
+        for _ in range(size):
+            view.record_lap()
+
+    _, current, peak = traced(build)
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter_ns()
+        view.record_lap()
+        timings.append(time.perf_counter_ns() - start)
+    return summarize('record_lap', size, timings, (current, peak))
+
+def compare(results, baseline_path, threshold):
+    # Print p50/p99 ratios against a saved run; return the regressions
+    with open(baseline_path) as f:
+        baseline = {(r['bench'], r['size']): r for r in json.load(f)['results']}
+    regressions = []
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        old = baseline.get((result['bench'], result['size']))
+        if old is None:
+            continue
+        ratios = {key: result[key] / old[key] if old[key] else float('inf')
+                  for key in ('p50_us', 'p99_us')}
+        flag = ""
+        if ratios['p50_us'] > threshold:
+            flag = "  REGRESSION"
+            regressions.append(result)
+        print(f"  {result['bench']:<20} {result['size']:>8}  p50 x{ratios['p50_us']:.2f}  "
+              f"p99 x{ratios['p99_us']:.2f}{flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the clock's hot paths")
+    parser.add_argument('--output', default="bench-results.json", help="where to write JSON results")
+    parser.add_argument('--compare', metavar='BASELINE', help="JSON results of a previous run")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="p50 slowdown ratio reported as a regression")
+    parser.add_argument('--samples', type=int, default=200, help="timed calls per benchmark")
+    parser.add_argument('--quick', action='store_true',
+                        help=f"skip sizes above {QUICK_LIMIT} for a fast smoke run")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--only', nargs='*', help="run only these benchmarks")
+    args = parser.parse_args(argv)
+
+    def sizes(all_sizes):
+        return [size for size in all_sizes if not args.quick or size <= QUICK_LIMIT]
+
+    def wanted(name):
+        return not args.only or name in args.only
+
+    app_module = load_app_module()
+    results = []
+
+    def record(result):
+        results.append(result)
+        print(f"{result['bench']:<20} {result['size']:>8}  p50 {result['p50_us']:10.1f}us  "
+              f"p99 {result['p99_us']:10.1f}us  max {result['max_us']:10.1f}us  "
+              f"mem {result.get('retained_bytes', 0) / 1048576:8.1f}MiB")
+
+    for size in sizes(ALARM_SIZES):
+        if wanted('check_alarms'):
+            record(bench_check_alarms(size, args.samples, args.seed))
+        if wanted('shard_tick'):
+            record(bench_shard_tick(size, args.samples, args.seed))
+        if wanted('update_next_alarm'):
+            record(bench_update_next_alarm(app_module, size, args.samples, args.seed))
+        if wanted('alarm_list'):
+            record(bench_alarm_list(app_module, size, args.samples, args.seed))
+    if wanted('draw_analog_clock'):
+        record(bench_draw_analog_clock(app_module, args.samples))
+    if wanted('update_world_clocks'):
+        for size in ZONE_SIZES:
+            record(bench_update_world_clocks(app_module, size, args.samples))
+    if wanted('tick'):
+        record(bench_tick(app_module, args.samples))
+    if wanted('record_lap'):
+        for size in sizes(LAP_SIZES):
+            record(bench_record_lap(app_module, size, args.samples))
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'results': results
+        }, f, indent=2)
+    print(f"\nWrote {len(results)} results to {args.output}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1883 @@
+import time
+import datetime
+import os
+import heapq
+import itertools
+import bisect
+import contextlib
+import sqlite3
+import threading
+import logging
+import array
+import math
+from collections import deque
+
+DAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+# Unix epoch as a naive UTC datetime and as a proleptic day ordinal
+EPOCH = datetime.datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+# The shortest interval between two rings of a repeating alarm
+ONE_DAY = datetime.timedelta(days=1)
+
+class SystemClock:
+    # Real time: local wall-clock datetimes, UTC epoch seconds and a
+    # monotonic counter for measuring intervals
+    def now(self):
+        return datetime.datetime.now()
+
+    def time(self):
+        return time.time()
+
+    def monotonic_ns(self):
+        return time.monotonic_ns()
+
+class VirtualClock:
+    # A clock that only moves when told to, for tests, benchmarks and
+    # simulations. Local and UTC time are taken to be the same.
+    def __init__(self, start=None):
+        self.start = start or datetime.datetime(2024, 1, 1)
+        self.elapsed_ns = 0
+
+    def now(self):
+        return self.start + datetime.timedelta(microseconds=self.elapsed_ns // 1000)
+
+    def time(self):
+        return (self.start - EPOCH).total_seconds() + self.elapsed_ns / 1e9
+
+    def monotonic_ns(self):
+        return self.elapsed_ns
+
+    def set_monotonic_ns(self, ns):
+        self.elapsed_ns = max(ns, self.elapsed_ns)
+
+    def advance(self, seconds):
+        self.elapsed_ns += int(seconds * 1000000000)
+
+def repeat_mask(days):
+    # Day names to a 7-bit mask, Monday in bit 0 like date.weekday()
+    mask = 0
+    for day in days:
+        mask |= 1 << DAY_NAMES.index(day)
+    return mask
+
+# DAYS_UNTIL[mask][weekday]: days from `weekday` to the first day in `mask`,
+# counting `weekday` itself as 0
+DAYS_UNTIL = [[next((offset for offset in range(7) if mask >> (weekday + offset) % 7 & 1), 0)
+               for weekday in range(7)] for mask in range(1 << 7)]
+
+class Alarm:
+    # One alarm as a slotted record: the time is a minute of the day and the
+    # repeat days a bitmask, so matching is integer arithmetic and an alarm
+    # costs a few machine words. The 12-hour fields the UI and the database
+    # use are derived on demand.
+    __slots__ = ('id', 'minute_of_day', 'repeat_mask', 'label', 'tone', 'active')
+
+    def __init__(self, minute_of_day, label="Alarm", tone="Classic Alarm", repeat_mask=0, 
+                 active=True, id=None):
+        self.id = id
+        self.minute_of_day = minute_of_day
+        self.repeat_mask = repeat_mask
+        self.label = label
+        self.tone = tone
+        self.active = active
+
+    @classmethod
+    def from_12h(cls, hour, minute, ampm, label="Alarm", tone="Classic Alarm", repeat=(), 
+                 active=True, id=None):
+        hour_24 = hour % 12 + (12 if ampm == "PM" else 0)
+        return cls(hour_24 * 60 + minute, label, tone, repeat_mask(repeat), active, id)
+
+    @property
+    def hour(self):
+        return (self.minute_of_day // 60) % 12 or 12
+
+    @property
+    def minute(self):
+        return self.minute_of_day % 60
+
+    @property
+    def ampm(self):
+        return "AM" if self.minute_of_day < 720 else "PM"
+
+    @property
+    def repeat(self):
+        return [day for i, day in enumerate(DAY_NAMES) if self.repeat_mask >> i & 1]
+
+    def __repr__(self):
+        return (f"Alarm(id={self.id}, {format_alarm_time(self)}, {self.label!r}, "
+                f"repeat={self.repeat}, active={self.active})")
+
+def next_alarm_times(alarms, after):
+    # Earliest time strictly after `after` at which each alarm rings,
+    # honouring repeat days. The reference day is worked out once, so bulk
+    # callers pay only integer arithmetic per alarm. There are at most a
+    # week of minutes to return, so each datetime is built once.
+    midnight = after.replace(hour=0, minute=0, second=0, microsecond=0)
+    elapsed = (after - midnight).total_seconds()
+    weekday = after.weekday()
+    times = {}
+    for alarm in alarms:
+        seconds = alarm.minute_of_day * 60
+        days = 1 if seconds <= elapsed else 0
+        if alarm.repeat_mask:
+            days += DAYS_UNTIL[alarm.repeat_mask][(weekday + days) % 7]
+        offset = days * 86400 + seconds
+        when = times.get(offset)
+        if when is None:
+            when = times[offset] = midnight + datetime.timedelta(seconds=offset)
+        yield when
+
+def next_alarm_time(alarm, after):
+    return next(next_alarm_times((alarm,), after))
+
+def local_seconds(when):
+    # A naive local datetime as whole seconds since 1970-01-01 00:00 local time
+    return ((when.toordinal() - EPOCH_ORDINAL) * 86400 + when.hour * 3600 
+            + when.minute * 60 + when.second)
+
+def next_alarm_seconds(alarm, after):
+    # next_alarm_time() in local_seconds() units, without building datetimes;
+    # day 0 of the count was a Thursday
+    day, elapsed = divmod(after, 86400)
+    seconds = alarm.minute_of_day * 60
+    days = 1 if seconds <= elapsed else 0
+    if alarm.repeat_mask:
+        days += DAYS_UNTIL[alarm.repeat_mask][(day + 3 + days) % 7]
+    return (day + days) * 86400 + seconds
+
+def format_alarm_time(alarm):
+    return f"{alarm.hour:02d}:{alarm.minute:02d} {alarm.ampm}"
+
+def alarm_occurrences(alarm, after):
+    # Lazily yield every ring time of the alarm strictly after `after`
+    when = next_alarm_time(alarm, after)
+    yield when
+    while alarm.repeat_mask:
+        when = next_alarm_time(alarm, when)
+        yield when
+
+class AlarmAgenda:
+    # The next `limit` firings within `horizon`. Each active alarm's next
+    # firing past the cached prefix waits in a DeadlineQueue, so the prefix
+    # is topped up one firing at a time as firings pass and alarms change,
+    # at O(log n) each; the whole queue is only built again after
+    # configure() or a large bulk add.
+    def __init__(self, limit=20, horizon=datetime.timedelta(days=7)):
+        self.limit = limit
+        self.horizon = horizon
+        self.alarms = {}
+        self.version = 0
+        self._items = []
+        self._queue = None
+
+    def configure(self, limit, horizon):
+        if (limit, horizon) != (self.limit, self.horizon):
+            self.limit = limit
+            self.horizon = horizon
+            self._invalidate()
+
+    def add(self, alarm, now):
+        if not alarm.active:
+            return
+        key = alarm.id
+        self.alarms[key] = alarm
+        if self._queue is None:
+            return
+
+        # Merge the new alarm's firings into the prefix up to its last
+        # firing; upcoming() tops up anything beyond that
+        self._queue.push(key, next_alarm_time(alarm, now))
+        if self._items:
+            self._fill(now, self._items[-1][0], 2 * self.limit)
+            self._trim()
+
+    def add_many(self, alarms, now):
+        # A batch that is large next to the agenda is cheaper to queue in one
+        # rebuild on next use than alarm by alarm
+        if len(alarms) <= len(self.alarms) // 16:
+            for alarm in alarms:
+                self.add(alarm, now)
+            return
+        for alarm in alarms:
+            if alarm.active:
+                self.alarms[alarm.id] = alarm
+        self._invalidate()
+
+    def remove(self, alarm):
+        key = alarm.id
+        if self.alarms.pop(key, None) is None:
+            return
+        if self._queue is not None:
+            self._queue.discard(key)
+        items = [item for item in self._items if item[1] != key]
+        if len(items) != len(self._items):
+            self._items = items
+            self.version += 1
+
+    def update(self, alarm, now):
+        self.remove(alarm)
+        self.add(alarm, now)
+
+    def upcoming(self, now):
+        # Return [(when, alarm), ...] for the next firings after `now`
+        end = now + self.horizon
+
+        # Drop firings that have already passed
+        expired = bisect.bisect_right(self._items, (now, float('inf')))
+        if expired:
+            del self._items[:expired]
+            self.version += 1
+
+        if self._queue is None:
+            self._rebuild(now)
+        elif len(self._items) < self.limit:
+            self._fill(now, end, self.limit)
+
+        return [(when, self.alarms[key]) for when, key in self._items if when <= end]
+
+    def _fill(self, now, until, limit):
+        # Move firings up to `until` from the queue into the prefix, queueing
+        # each alarm's following firing in its place
+        queue = self._queue
+        changed = False
+        while len(self._items) < limit:
+            head = queue.peek()
+            if head is None or head[0] > until:
+                break
+            when, key = queue.pop()
+            alarm = self.alarms[key]
+            if when <= now:
+                # Passed unseen, as when the clock jumps forward
+                queue.push(key, next_alarm_time(alarm, now))
+                continue
+            bisect.insort(self._items, (when, key))
+            changed = True
+            if alarm.repeat_mask:
+                queue.push(key, next_alarm_time(alarm, when))
+        if changed:
+            self.version += 1
+
+    def _trim(self):
+        # Hand firings past `limit` back to the queue, the earliest of each
+        # alarm last so it is the one kept
+        if len(self._items) > self.limit:
+            for when, key in reversed(self._items[self.limit:]):
+                self._queue.push(key, when)
+            del self._items[self.limit:]
+
+    def _invalidate(self):
+        self._items = []
+        self._queue = None
+        self.version += 1
+
+    def _rebuild(self, now):
+        self._items = []
+        self._queue = DeadlineQueue()
+        self._queue.push_many(zip(self.alarms, next_alarm_times(self.alarms.values(), now)))
+        self._fill(now, now + self.horizon, self.limit)
+        self.version += 1
+
+class AlarmIndex:
+    # Alarms kept presorted by time, label, repeat days and status, for a
+    # list view that shows one window of rows at a time. Each field's index
+    # is a sorted list of (key, alarm id) patched with bisect on every change.
+    # Filters are key ranges in those indexes, so the filtered, sorted view is
+    # read off an index instead of sorting, and is then also patched in place.
+    FIELDS = ('time', 'label', 'repeat', 'status')
+
+    def __init__(self, alarms=()):
+        self.alarms = {}
+        self.keys = {}
+        self.sorted = {field: [] for field in self.FIELDS}
+        self.sort_field = 'time'
+        self.descending = False
+        self.filters = {}
+        self.version = 0
+        for alarm in alarms:
+            self.alarms[alarm.id] = alarm
+            self.keys[alarm.id] = self.key_of(alarm)
+        for i, field in enumerate(self.FIELDS):
+            self.sorted[field] = sorted((keys[i], alarm_id) for alarm_id, keys in self.keys.items())
+        self._view = None
+
+    @staticmethod
+    def key_of(alarm):
+        return (alarm.minute_of_day, alarm.label.casefold(), alarm.repeat_mask, 
+                0 if alarm.active else 1)
+
+    def filter_range(self, field, value):
+        # (low, high) key bounds, high exclusive, that `value` selects in `field`
+        if field == 'time':
+            start, end = value
+            return start, end + 1
+        if field == 'label':
+            prefix = value.casefold()
+            return prefix, prefix + '\U0010ffff'
+        if field == 'repeat':
+            return (0, 1) if value == 'once' else (1, 1 << len(DAY_NAMES))
+        return (0, 1) if value == 'active' else (1, 2)
+
+    def set_sort(self, field, descending=False):
+        if (field, descending) != (self.sort_field, self.descending):
+            self.sort_field = field
+            self.descending = descending
+            self._changed(rebuild=True)
+
+    def set_filters(self, **filters):
+        # Filters: time=(first, last minute of day), label=prefix,
+        # repeat='once'|'repeating', status='active'|'inactive'. None clears.
+        filters = {field: value for field, value in filters.items() if value}
+        if filters != self.filters:
+            self.filters = filters
+            self._changed(rebuild=True)
+
+    def _changed(self, rebuild=False):
+        self.version += 1
+        if rebuild:
+            self._view = None
+
+    def _ranges(self):
+        return {self.FIELDS.index(field): self.filter_range(field, value) 
+                for field, value in self.filters.items()}
+
+    def _matches(self, keys, ranges):
+        return all(low <= keys[i] < high for i, (low, high) in ranges.items())
+
+    def _build_view(self):
+        sort_i = self.FIELDS.index(self.sort_field)
+        ranges = self._ranges()
+        index = self.sorted[self.sort_field]
+        if not ranges:
+            return list(index)
+        
+        # Drive from the narrowest filter's slice of its own index. When that
+        # slice is small, sorting it beats a pass over the whole sort index.
+        spans = []
+        for i, (low, high) in ranges.items():
+            field_index = self.sorted[self.FIELDS[i]]
+            spans.append((bisect.bisect_left(field_index, (high,)) - 
+                          bisect.bisect_left(field_index, (low,)), i, low, high))
+        count, driver, low, high = min(spans)
+        if driver == sort_i:
+            start = bisect.bisect_left(index, (low,))
+            end = bisect.bisect_left(index, (high,))
+            return [item for item in index[start:end] if self._matches(self.keys[item[1]], ranges)]
+        if count * max(count.bit_length(), 1) < len(index):
+            field_index = self.sorted[self.FIELDS[driver]]
+            start = bisect.bisect_left(field_index, (low,))
+            end = bisect.bisect_left(field_index, (high,))
+            view = [(self.keys[alarm_id][sort_i], alarm_id) for _, alarm_id in field_index[start:end]
+                    if self._matches(self.keys[alarm_id], ranges)]
+            view.sort()
+            return view
+        return [item for item in index if self._matches(self.keys[item[1]], ranges)]
+
+    @property
+    def view(self):
+        if self._view is None:
+            self._view = self._build_view()
+        return self._view
+
+    def __len__(self):
+        return len(self.view)
+
+    def page(self, start, count):
+        # Alarms at display rows start .. start + count - 1
+        view = self.view
+        if self.descending:
+            end = len(view) - start
+            items = view[max(end - count, 0):max(end, 0)][::-1]
+        else:
+            items = view[start:start + count]
+        return [self.alarms[alarm_id] for _, alarm_id in items]
+
+    def position(self, alarm):
+        # Display row of `alarm`, or None if it is filtered out
+        keys = self.keys.get(alarm.id)
+        if keys is None:
+            return None
+        view = self.view
+        item = (keys[self.FIELDS.index(self.sort_field)], alarm.id)
+        i = bisect.bisect_left(view, item)
+        if i == len(view) or view[i] != item:
+            return None
+        return len(view) - 1 - i if self.descending else i
+
+    def add(self, alarm):
+        alarm_id = alarm.id
+        keys = self.keys[alarm_id] = self.key_of(alarm)
+        self.alarms[alarm_id] = alarm
+        for i, field in enumerate(self.FIELDS):
+            bisect.insort(self.sorted[field], (keys[i], alarm_id))
+        if self._view is not None and self._matches(keys, self._ranges()):
+            bisect.insort(self._view, (keys[self.FIELDS.index(self.sort_field)], alarm_id))
+        self._changed()
+
+    def remove(self, alarm):
+        alarm_id = alarm.id
+        keys = self.keys.pop(alarm_id, None)
+        if keys is None:
+            return
+        del self.alarms[alarm_id]
+        for i, field in enumerate(self.FIELDS):
+            self._discard(self.sorted[field], (keys[i], alarm_id))
+        if self._view is not None:
+            self._discard(self._view, (keys[self.FIELDS.index(self.sort_field)], alarm_id))
+        self._changed()
+
+    def update(self, alarm):
+        # Re-file `alarm` if any of its keys changed; otherwise only bump
+        # the version so its row is redrawn
+        if self.keys.get(alarm.id) == self.key_of(alarm):
+            self._changed()
+            return
+        self.remove(alarm)
+        self.add(alarm)
+
+    @staticmethod
+    def _discard(items, item):
+        i = bisect.bisect_left(items, item)
+        if i < len(items) and items[i] == item:
+            del items[i]
+
+class DeadlineQueue:
+    # Min-heap of [deadline, seq, key] entries. Removing or rescheduling a key
+    # only marks its old entry as dead; dead entries are dropped when they
+    # reach the top of the heap, so every operation stays O(log n).
+    def __init__(self):
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def push(self, key, deadline):
+        self.discard(key)
+        entry = [deadline, next(self._counter), key]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+
+    def push_many(self, items):
+        # Bulk insert of (key, deadline) pairs: one heapify for a batch that
+        # is large next to the heap, one sift per entry otherwise
+        entries = []
+        for key, deadline in items:
+            if key in self._entries:
+                self.discard(key)
+            entry = [deadline, next(self._counter), key]
+            self._entries[key] = entry
+            entries.append(entry)
+        if len(entries) > len(self._heap) // 4:
+            self._heap.extend(entries)
+            heapq.heapify(self._heap)
+        else:
+            for entry in entries:
+                heapq.heappush(self._heap, entry)
+
+    def discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry[2] = None
+            # Rebuild once dead entries dominate so the heap cannot grow
+            # without bound under repeated toggling
+            if len(self._heap) > 2 * len(self._entries) + 64:
+                self._heap = [e for e in self._heap if e[2] is not None]
+                heapq.heapify(self._heap)
+
+    def deadline(self, key):
+        entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def peek(self):
+        # Return (deadline, key) of the earliest live entry, or None
+        heap = self._heap
+        while heap and heap[0][2] is None:
+            heapq.heappop(heap)
+        if not heap:
+            return None
+        return heap[0][0], heap[0][2]
+
+    def pop(self):
+        # Remove and return (deadline, key) of the earliest live entry, or None
+        head = self.peek()
+        if head is not None:
+            heapq.heappop(self._heap)
+            del self._entries[head[1]]
+        return head
+
+    def pop_due(self, now):
+        # Yield (deadline, key) for every live entry due at or before `now`
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            deadline, _, key = heapq.heappop(heap)
+            if key is None:
+                continue
+            del self._entries[key]
+            yield deadline, key
+
+class TimingWheel:
+    # Hierarchical timing wheel of integer deadlines: LEVELS wheels of
+    # 2**SLOT_BITS slots, each slot of a level spanning one full turn of the
+    # level below. push() and discard() are O(1), and an entry moves down a
+    # level at most LEVELS - 1 times before it expires, so expiry is O(1)
+    # amortised however many entries wait. Deadlines beyond the top level's
+    # span wait in its furthest slot and are filed again as it comes round.
+    # Same interface as DeadlineQueue, for schedulers that tick in whole
+    # units and hold far more entries than a heap handles comfortably.
+    SLOT_BITS = 6
+    LEVELS = 4
+
+    def __init__(self, now=0):
+        self.now = now
+        self._mask = (1 << self.SLOT_BITS) - 1
+        self._span = 1 << self.SLOT_BITS * self.LEVELS
+        self._wheels = [[{} for _ in range(1 << self.SLOT_BITS)] for _ in range(self.LEVELS)]
+        self._counts = [0] * self.LEVELS
+        # key -> (slot, level); entries already due wait in _overdue
+        self._where = {}
+        self._overdue = {}
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def _file(self, key, deadline):
+        delta = deadline - self.now
+        if delta <= 0:
+            slot = self._overdue
+            level = None
+        else:
+            if delta < self._span:
+                level = (delta.bit_length() - 1) // self.SLOT_BITS
+                position = deadline
+            else:
+                level = self.LEVELS - 1
+                position = self.now + self._span - 1
+            slot = self._wheels[level][position >> level * self.SLOT_BITS & self._mask]
+            self._counts[level] += 1
+        slot[key] = deadline
+        self._where[key] = (slot, level)
+
+    def push(self, key, deadline):
+        self.discard(key)
+        self._file(key, deadline)
+
+    def push_many(self, items):
+        for key, deadline in items:
+            self.push(key, deadline)
+
+    def discard(self, key):
+        entry = self._where.pop(key, None)
+        if entry is not None:
+            slot, level = entry
+            del slot[key]
+            if level is not None:
+                self._counts[level] -= 1
+
+    def deadline(self, key):
+        entry = self._where.get(key)
+        return entry[0][key] if entry is not None else None
+
+    def _expire(self, slot, due):
+        for key, deadline in slot.items():
+            del self._where[key]
+            due.append((deadline, key))
+        slot.clear()
+
+    def pop_due(self, now):
+        # Turn the wheel to `now` and return (deadline, key) for every entry
+        # due at or before it, in tick order
+        due = []
+        bits = self.SLOT_BITS
+        mask = self._mask
+        lowest = self._wheels[0]
+        while True:
+            if self._overdue:
+                self._expire(self._overdue, due)
+            if self.now >= now:
+                return due
+            if not self._where:
+                self.now = now
+                return due
+            # Jump straight to the next tick that has work: the next occupied
+            # slot of the lowest wheel in this turn, or else the next slot of
+            # the lowest level holding anything
+            if self._counts[0]:
+                tick = self.now + 1
+                end = (self.now | mask) + 1
+                while tick < end and not lowest[tick & mask]:
+                    tick += 1
+            else:
+                level = 1
+                while not self._counts[level] and level < self.LEVELS - 1:
+                    level += 1
+                shift = level * bits
+                tick = (self.now >> shift) + 1 << shift
+            tick = self.now = min(now, tick)
+            # Cascade every level whose turn starts at this tick, top first
+            if not tick & mask:
+                for upper in range(self.LEVELS - 1, 0, -1):
+                    if tick & (1 << upper * bits) - 1 == 0:
+                        slot = self._wheels[upper][tick >> upper * bits & mask]
+                        if slot:
+                            entries = list(slot.items())
+                            slot.clear()
+                            self._counts[upper] -= len(entries)
+                            for key, deadline in entries:
+                                self._file(key, deadline)
+            slot = lowest[tick & mask]
+            if slot:
+                self._counts[0] -= len(slot)
+                self._expire(slot, due)
+
+class EventLoop:
+    # Minimal stand-in for Tk's after()/after_cancel() so the engine can run
+    # without a display, in real time or against a VirtualClock. Callbacks
+    # must be scheduled from the thread that runs the loop.
+    def __init__(self, clock=None):
+        self.clock = clock or SystemClock()
+        self.queue = DeadlineQueue()
+        self._callbacks = {}
+        self._ids = itertools.count(1)
+        self._wakeup = threading.Event()
+        self._running = False
+
+    def after(self, ms, callback, *args):
+        after_id = f"after#{next(self._ids)}"
+        self._callbacks[after_id] = (callback, args)
+        self.queue.push(after_id, self.clock.monotonic_ns() + int(ms) * 1000000)
+        return after_id
+
+    def after_idle(self, callback, *args):
+        return self.after(0, callback, *args)
+
+    def after_cancel(self, after_id):
+        if self._callbacks.pop(after_id, None) is not None:
+            self.queue.discard(after_id)
+
+    def run_due(self):
+        # Run every callback that is due, including ones they schedule for now
+        count = 0
+        while True:
+            head = self.queue.peek()
+            if head is None or head[0] > self.clock.monotonic_ns():
+                return count
+            self.queue.pop()
+            callback, args = self._callbacks.pop(head[1])
+            callback(*args)
+            count += 1
+
+    def advance(self, seconds):
+        # Move a VirtualClock forward, running callbacks at their due times
+        target = self.clock.monotonic_ns() + int(seconds * 1000000000)
+        while True:
+            head = self.queue.peek()
+            if head is None or head[0] > target:
+                break
+            self.clock.set_monotonic_ns(head[0])
+            self.run_due()
+        self.clock.set_monotonic_ns(target)
+
+    def run(self):
+        # Serve callbacks in real time until stop() is called
+        self._running = True
+        while self._running:
+            self._wakeup.clear()
+            self.run_due()
+            head = self.queue.peek()
+            timeout = None
+            if head is not None:
+                timeout = max(head[0] - self.clock.monotonic_ns(), 0) / 1e9
+            self._wakeup.wait(timeout)
+
+    def stop(self):
+        self._running = False
+        self._wakeup.set()
+
+class DeadlineScheduler:
+    # Arms a single after() wakeup on a Tk root or EventLoop for the earliest
+    # entry of a DeadlineQueue and calls `callback` when it is due. Sleeps are
+    # capped so wall-clock jumps are noticed within a minute.
+    MAX_SLEEP_MS = 60000
+    # Label of the wakeup callback in callback_seconds
+    METRIC_NAME = 'wakeup'
+
+    def __init__(self, root, callback, clock=None):
+        self.root = root
+        self.callback = callback
+        self.clock = clock or SystemClock()
+        self.queue = DeadlineQueue()
+        # A clock_metrics.Metrics while instrumentation is on
+        self.metrics = None
+        self._after_id = None
+        self._armed_for = None
+
+    def now_ns(self):
+        return self.clock.monotonic_ns()
+
+    def delay_ms(self, deadline):
+        # Deadlines are monotonic nanoseconds unless a subclass says
+        # otherwise; rounded up so the wakeup is never early
+        return -(-(deadline - self.now_ns()) // 1000000)
+
+    def _rearm(self):
+        head = self.queue.peek()
+        deadline = head[0] if head else None
+        if deadline == self._armed_for and self._after_id is not None:
+            return
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+        self._armed_for = deadline
+        if deadline is None:
+            return
+        delay_ms = min(max(self.delay_ms(deadline), 0), self.MAX_SLEEP_MS)
+        self._after_id = self.root.after(delay_ms, self._wakeup)
+
+    def _wakeup(self):
+        self._after_id = None
+        self._armed_for = None
+        if self.metrics is None:
+            self.callback()
+        else:
+            self.metrics.timed(self.METRIC_NAME, self.callback)
+        self._rearm()
+
+class AlarmScheduler(DeadlineScheduler):
+    # Keeps the active alarms ordered by next fire time so only the earliest
+    # one is waited on, instead of polling every alarm each second
+    METRIC_NAME = 'check_alarms'
+
+    def __init__(self, root, callback, clock=None):
+        DeadlineScheduler.__init__(self, root, callback, clock)
+        self.alarms = {}
+
+    def add(self, alarm, now=None):
+        if not alarm.active:
+            return
+        now = now or self.clock.now()
+        key = alarm.id
+        self.alarms[key] = alarm
+        self.queue.push(key, next_alarm_time(alarm, now))
+        self._rearm()
+
+    def add_many(self, alarms, now=None):
+        # Bulk load with a single re-arm at the end
+        now = now or self.clock.now()
+        active = [alarm for alarm in alarms if alarm.active]
+        for alarm in active:
+            self.alarms[alarm.id] = alarm
+        self.queue.push_many(zip((alarm.id for alarm in active), next_alarm_times(active, now)))
+        self._rearm()
+
+    def remove(self, alarm):
+        key = alarm.id
+        if self.alarms.pop(key, None) is not None:
+            self.queue.discard(key)
+            self._rearm()
+
+    def update(self, alarm, now=None):
+        if alarm.active:
+            self.add(alarm, now)
+        else:
+            self.remove(alarm)
+
+    def next_fire_time(self, alarm):
+        return self.queue.deadline(alarm.id)
+
+    def pop_due(self, now):
+        # Yield (deadline, alarm) for alarms whose fire time has passed;
+        # repeating alarms are rescheduled for their next occurrence after
+        # `now`, one-shot alarms are dropped
+        due = []
+        for deadline, key in self.queue.pop_due(now):
+            due.append((deadline, key))
+        for deadline, key in due:
+            alarm = self.alarms[key]
+            if alarm.repeat_mask:
+                self.queue.push(key, next_alarm_time(alarm, max(deadline, now)))
+            else:
+                del self.alarms[key]
+            yield deadline, alarm
+
+    def delay_ms(self, deadline):
+        # Alarm deadlines are wall-clock datetimes
+        delay = (deadline - self.clock.now()).total_seconds()
+        return int(delay * 1000) + 1
+
+class CountdownTimer:
+    # A named countdown. While running it is defined by an absolute monotonic
+    # deadline; while paused by the exact nanoseconds that were left.
+    def __init__(self, name, total_ns, deadline_ns):
+        self.name = name
+        self.total_ns = total_ns
+        self.deadline_ns = deadline_ns
+        self.remaining_at_pause_ns = total_ns
+        self.finished = False
+
+    @property
+    def running(self):
+        return self.deadline_ns is not None
+
+    def remaining_ns(self, now_ns):
+        if self.deadline_ns is None:
+            return self.remaining_at_pause_ns
+        return max(self.deadline_ns - now_ns, 0)
+
+class TimerEngine(DeadlineScheduler):
+    # Runs any number of named countdowns off one shared deadline queue and a
+    # single root.after wakeup, with no thread per timer. Deadlines are
+    # absolute, so late wakeups never accumulate into drift.
+    METRIC_NAME = 'check_timers'
+    # Finished timers stay listed until they are reset; beyond this many the
+    # ones started first are dropped
+    FINISHED_LIMIT = 20
+
+    def __init__(self, root, callback, clock=None):
+        DeadlineScheduler.__init__(self, root, callback, clock)
+        self.timers = {}
+
+    def start(self, name, total_ns):
+        self.cancel(name)
+        timer = CountdownTimer(name, total_ns, self.now_ns() + total_ns)
+        self.timers[name] = timer
+        self.queue.push(name, timer.deadline_ns)
+        self._rearm()
+        return timer
+
+    def pause(self, name):
+        timer = self.timers.get(name)
+        if timer is None or not timer.running:
+            return
+        timer.remaining_at_pause_ns = timer.remaining_ns(self.now_ns())
+        timer.deadline_ns = None
+        self.queue.discard(name)
+        self._rearm()
+
+    def resume(self, name):
+        timer = self.timers.get(name)
+        if timer is None or timer.running or timer.finished:
+            return
+        timer.deadline_ns = self.now_ns() + timer.remaining_at_pause_ns
+        self.queue.push(name, timer.deadline_ns)
+        self._rearm()
+
+    def cancel(self, name):
+        if self.timers.pop(name, None) is not None:
+            self.queue.discard(name)
+            self._rearm()
+
+    def pop_finished(self):
+        # Return every running timer whose deadline has passed
+        finished = []
+        now = self.now_ns()
+        for deadline, name in self.queue.pop_due(now):
+            if self.metrics is not None:
+                self.metrics.observe('timer_fire_latency_seconds', 'timer', (now - deadline) / 1e9)
+            timer = self.timers[name]
+            timer.deadline_ns = None
+            timer.remaining_at_pause_ns = 0
+            timer.finished = True
+            finished.append(timer)
+        if finished:
+            done = [name for name, timer in self.timers.items() if timer.finished]
+            for name in done[:-self.FINISHED_LIMIT or None]:
+                del self.timers[name]
+        return finished
+
+class TickScheduler(DeadlineScheduler):
+    # The one frame loop behind every periodic display. Each subsystem
+    # registers a tick callback that redraws it and returns how many ms until
+    # it next needs a tick, or None to go idle until refreshed. Ticks due
+    # within BATCH_NS of each other run in the same wakeup, so everything
+    # that follows the wall-clock second shares one wakeup a second.
+    BATCH_NS = 4000000
+    # Land just after the second boundary so a slightly early wakeup never
+    # redraws the old second
+    SECOND_MARGIN_MS = 2
+    METRIC_NAME = 'ticks'
+
+    def __init__(self, root, clock=None):
+        DeadlineScheduler.__init__(self, root, self._tick, clock)
+        self.subscribers = {}
+        self.wakeups = 0
+        self.ticks = 0
+
+    def ms_to_next_second(self):
+        # Re-read the wall clock on every tick so late wakeups and clock
+        # slewing are corrected each second instead of accumulating
+        return 1000 - int(self.clock.time() * 1000) % 1000 + self.SECOND_MARGIN_MS
+
+    def add(self, name, callback):
+        self.subscribers[name] = callback
+        self.refresh(name)
+
+    def remove(self, name):
+        if self.subscribers.pop(name, None) is not None:
+            self.queue.discard(name)
+            self._rearm()
+
+    def schedule(self, name, delay_ms):
+        if delay_ms is None:
+            self.queue.discard(name)
+        else:
+            self.queue.push(name, self.now_ns() + max(delay_ms, 0) * 1000000)
+        self._rearm()
+
+    def refresh(self, name):
+        # Tick `name` right now, e.g. after user input, and reschedule it
+        self.schedule(name, self.subscribers[name]())
+
+    def _tick(self):
+        self.wakeups += 1
+        due = list(self.queue.pop_due(self.now_ns() + self.BATCH_NS))
+        metrics = self.metrics
+        for deadline, name in due:
+            callback = self.subscribers.get(name)
+            if callback is None:
+                continue
+            self.ticks += 1
+            if metrics is None:
+                delay_ms = callback()
+            else:
+                # Lateness of each loop's tick, and the tick's own cost
+                metrics.observe('tick_lag_seconds', name, (self.now_ns() - deadline) / 1e9)
+                delay_ms = metrics.timed(name, callback)
+            if delay_ms is not None:
+                self.queue.push(name, self.now_ns() + max(delay_ms, 0) * 1000000)
+
+def format_duration_ns(ns, digits=2):
+    # HH:MM:SS with `digits` fractional digits, using integer arithmetic only
+    total_seconds, fraction = divmod(ns, 1000000000)
+    minutes, seconds = divmod(total_seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    text = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+    if digits:
+        text += f".{fraction // 10 ** (9 - digits):0{digits}d}"
+    return text
+
+class LapLog:
+    # Lap split times as cumulative nanoseconds in an array('q'), 8 bytes a
+    # lap. Lap durations are differences of neighbours; fastest, slowest and
+    # the exact integer sums behind mean and standard deviation are kept up
+    # to date as laps are added.
+    def __init__(self):
+        self.totals = array.array('q')
+        self.fastest = None
+        self.slowest = None
+        self._sum = 0
+        self._sum_squares = 0
+
+    def __len__(self):
+        return len(self.totals)
+
+    def append(self, total_ns):
+        # Record a split at `total_ns` and return the lap's duration
+        lap_ns = total_ns - self.totals[-1] if self.totals else total_ns
+        self.totals.append(total_ns)
+        number = len(self.totals)
+        if self.fastest is None or lap_ns < self.fastest[1]:
+            self.fastest = (number, lap_ns)
+        if self.slowest is None or lap_ns > self.slowest[1]:
+            self.slowest = (number, lap_ns)
+        self._sum += lap_ns
+        self._sum_squares += lap_ns * lap_ns
+        return lap_ns
+
+    def lap_ns(self, index):
+        return self.totals[index] - self.totals[index - 1] if index else self.totals[0]
+
+    def rows(self, start=0, count=None):
+        # (lap number, total ns, lap ns) for laps start .. start + count - 1
+        end = len(self.totals) if count is None else min(start + count, len(self.totals))
+        previous = self.totals[start - 1] if start > 0 else 0
+        for index in range(start, end):
+            total = self.totals[index]
+            yield index + 1, total, total - previous
+            previous = total
+
+    def mean_ns(self):
+        return self._sum // len(self.totals) if self.totals else None
+
+    def stddev_ns(self):
+        # Sample standard deviation, from exact integer sums
+        n = len(self.totals)
+        if n < 2:
+            return None
+        return math.isqrt((n * self._sum_squares - self._sum * self._sum) // (n * (n - 1)))
+
+    def stats(self):
+        return {
+            'laps': len(self.totals),
+            'fastest': self.fastest,
+            'slowest': self.slowest,
+            'mean_ns': self.mean_ns(),
+            'stddev_ns': self.stddev_ns()
+        }
+
+    def write_csv(self, f, digits=2):
+        # One row per lap, written as it is formatted
+        import csv
+        writer = csv.writer(f)
+        writer.writerow(["lap", "total", "lap_time", "total_ns", "lap_ns"])
+        for number, total, lap_ns in self.rows():
+            writer.writerow([number, format_duration_ns(total, digits), 
+                             format_duration_ns(lap_ns, digits), total, lap_ns])
+
+    def write_json(self, f):
+        # {"laps": [...], "stats": {...}}, with the laps written one by one
+        import json
+        f.write('{"laps": [')
+        separator = "\n  "
+        for number, total, lap_ns in self.rows():
+            f.write(separator + json.dumps({'lap': number, 'total_ns': total, 'lap_ns': lap_ns}))
+            separator = ",\n  "
+        f.write('\n], "stats": ' + json.dumps(self.stats()) + '}\n')
+
+class Stopwatch:
+    # Elapsed time is kept in integer nanoseconds from a monotonic clock, so
+    # wall-clock adjustments cannot corrupt it. Rendering is left to the
+    # caller, which can refresh at whatever rate suits the display.
+    def __init__(self, clock=time.perf_counter_ns):
+        self.clock = clock
+        self.running = False
+        self.laps = LapLog()
+        self._started = 0
+        self._accumulated = 0
+
+    def start(self):
+        if not self.running:
+            self._started = self.clock()
+            self.running = True
+
+    def stop(self):
+        if self.running:
+            self._accumulated += self.clock() - self._started
+            self.running = False
+
+    def reset(self):
+        self.running = False
+        self.laps = LapLog()
+        self._accumulated = 0
+
+    def elapsed_ns(self):
+        if self.running:
+            return self._accumulated + self.clock() - self._started
+        return self._accumulated
+
+    def lap(self):
+        # Record a lap and return (total, lap) durations in nanoseconds
+        elapsed = self.elapsed_ns()
+        return elapsed, self.laps.append(elapsed)
+
+class PhaseTimer:
+    # Time spent in each named phase of a sequence such as startup. mark()
+    # closes the phase that has been running since the previous mark.
+    def __init__(self, started_ns=None, clock=time.perf_counter_ns):
+        self.clock = clock
+        self.started_ns = clock() if started_ns is None else started_ns
+        self.last_ns = self.started_ns
+        self.phases = []
+
+    def mark(self, phase):
+        now = self.clock()
+        self.phases.append((phase, now - self.last_ns))
+        self.last_ns = now
+
+    def total_ns(self):
+        return self.last_ns - self.started_ns
+
+    def report(self, title):
+        lines = [f"{title}: {self.total_ns() / 1000000:.1f} ms"]
+        for phase, ns in self.phases:
+            lines.append(f"  {phase:<16} {ns / 1000000:8.1f} ms")
+        return "\n".join(lines)
+
+def format_clock_time(local_seconds):
+    # "%I:%M:%S %p" for a local epoch time in whole seconds
+    minutes, seconds = divmod(local_seconds % 86400, 60)
+    hours, minutes = divmod(minutes, 60)
+    ampm = "AM" if hours < 12 else "PM"
+    return f"{hours % 12 or 12:02d}:{minutes:02d}:{seconds:02d} {ampm}"
+
+class ZoneOffsetCache:
+    # UTC offset of one timezone, resolved once and cached until the zone's
+    # next transition so a tick is a range check plus an addition
+    FALLBACK_VALIDITY = 900
+
+    def __init__(self, tz):
+        self.tz = tz
+        self.offset = 0
+        self.valid_from = 0
+        self.valid_until = -1
+
+    def offset_at(self, utc_seconds):
+        if not self.valid_from <= utc_seconds < self.valid_until:
+            self._load(utc_seconds)
+        return self.offset
+
+    def _load(self, utc_seconds):
+        utc_time = EPOCH + datetime.timedelta(seconds=utc_seconds)
+        transitions = getattr(self.tz, '_utc_transition_times', None)
+        if transitions:
+            # pytz zones carry their transition table; find the span we are in
+            index = max(bisect.bisect_right(transitions, utc_time) - 1, 0)
+            self.offset = int(self.tz._transition_info[index][0].total_seconds())
+            self.valid_from = self.epoch_seconds(transitions[index]) if index else utc_seconds
+            if index + 1 < len(transitions):
+                self.valid_until = self.epoch_seconds(transitions[index + 1])
+            else:
+                self.valid_until = float('inf')
+        else:
+            # Fixed-offset or unknown zones: ask once and re-check periodically
+            aware = utc_time.replace(tzinfo=datetime.timezone.utc).astimezone(self.tz)
+            self.offset = int(aware.utcoffset().total_seconds())
+            self.valid_from = utc_seconds - utc_seconds % self.FALLBACK_VALIDITY
+            self.valid_until = self.valid_from + self.FALLBACK_VALIDITY
+
+    @staticmethod
+    def epoch_seconds(utc_time):
+        return (utc_time - EPOCH).total_seconds()
+
+class TimezoneIndex:
+    # Search index over zone names, aliases and city/country names. Every
+    # word-boundary suffix of a normalised name is a key in one sorted list,
+    # so prefix lookups are a bisect. Typing more characters narrows the
+    # previous match range instead of searching again, and queries with no
+    # prefix hits fall back to fuzzy matching on city names.
+    def __init__(self, zone_names, aliases=()):
+        self.zones = set(zone_names)
+        entries = set()
+        cities = {}
+        for zone in zone_names:
+            words = self.normalize(zone).split()
+            for i in range(len(words)):
+                entries.add((" ".join(words[i:]), zone))
+            cities.setdefault(self.normalize(zone.split('/')[-1]), zone)
+        for alias, zone in aliases:
+            entries.add((self.normalize(alias), zone))
+            cities.setdefault(self.normalize(alias), zone)
+        self.entries = sorted(entries)
+        self.keys = [key for key, zone in self.entries]
+        self.cities = cities
+        self._last = ("", 0, len(self.entries))
+
+    @staticmethod
+    def normalize(text):
+        return " ".join(text.lower().replace('_', ' ').replace('/', ' ').split())
+
+    def search(self, query, limit=50):
+        query = self.normalize(query)
+        if not query:
+            return sorted(self.zones)[:limit]
+        
+        # Narrow the previous range when the user kept typing
+        last_query, lo, hi = self._last
+        if not query.startswith(last_query):
+            lo, hi = 0, len(self.keys)
+        lo = bisect.bisect_left(self.keys, query, lo, hi)
+        hi = bisect.bisect_left(self.keys, query + '\uffff', lo, hi)
+        self._last = (query, lo, hi)
+        
+        results = []
+        seen = set()
+        for key, zone in itertools.islice(self.entries, lo, hi):
+            if zone not in seen:
+                seen.add(zone)
+                results.append(zone)
+                if len(results) >= limit:
+                    return results
+        
+        # Nothing starts with the query, so it is probably a typo
+        if not results:
+            import difflib
+            for city in difflib.get_close_matches(query, self.cities, n=limit):
+                zone = self.cities[city]
+                if zone not in seen:
+                    seen.add(zone)
+                    results.append(zone)
+        return results
+
+    def resolve(self, text):
+        # Map an exact zone name, city or alias to its zone, or None
+        if text in self.zones:
+            return text
+        return self.cities.get(self.normalize(text))
+
+class ClockStore:
+    # Persistent alarms, world-clock zones and settings in SQLite (WAL mode).
+    # Every change is a single small statement, so nothing is rewritten on
+    # save and a crash loses at most the change in flight.
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS alarms (
+                id INTEGER PRIMARY KEY,
+                minute_of_day INTEGER NOT NULL,
+                repeat_mask INTEGER NOT NULL,
+                label TEXT NOT NULL,
+                tone TEXT NOT NULL,
+                active INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS world_clocks (
+                position INTEGER PRIMARY KEY,
+                tz TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+        self._migrate()
+
+    def _migrate(self):
+        # Databases written before alarms were stored as they are held in
+        # memory have 12-hour fields and comma-separated repeat days
+        columns = [name for _, name, *_ in self.conn.execute("PRAGMA table_info(alarms)")]
+        if 'hour' not in columns:
+            return
+        rows = self.conn.execute(
+            "SELECT id, hour, minute, ampm, label, tone, repeat, active FROM alarms").fetchall()
+        with self.transaction():
+            self.conn.execute("DROP TABLE alarms")
+            self.conn.execute("""
+                CREATE TABLE alarms (
+                    id INTEGER PRIMARY KEY,
+                    minute_of_day INTEGER NOT NULL,
+                    repeat_mask INTEGER NOT NULL,
+                    label TEXT NOT NULL,
+                    tone TEXT NOT NULL,
+                    active INTEGER NOT NULL
+                )""")
+            self.conn.executemany(
+                "INSERT INTO alarms (id, minute_of_day, repeat_mask, label, tone, active) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(alarm_id, (hour % 12 + (12 if ampm == "PM" else 0)) * 60 + minute,
+                  repeat_mask(repeat.split(',') if repeat else ()), label, tone, active)
+                 for alarm_id, hour, minute, ampm, label, tone, repeat, active in rows])
+
+    @staticmethod
+    def default_path():
+        return os.environ.get('ALARM_CLOCK_DB') or os.path.join(
+            os.path.expanduser("~"), ".ultimate_alarm_clock.db")
+
+    def load_alarms(self, shards=1, shard=0):
+        # All alarms, or those whose ID is `shard` modulo `shards`
+        query = "SELECT minute_of_day, label, tone, repeat_mask, active, id FROM alarms"
+        if shards > 1:
+            rows = self.conn.execute(query + " WHERE id % ? = ? ORDER BY id", (shards, shard))
+        else:
+            rows = self.conn.execute(query + " ORDER BY id")
+        return [Alarm(minute_of_day, label, tone, mask, bool(active), alarm_id)
+                for minute_of_day, label, tone, mask, active, alarm_id in rows]
+
+    def has_alarm(self, alarm_id):
+        return self.conn.execute("SELECT 1 FROM alarms WHERE id = ?", 
+                                 (alarm_id,)).fetchone() is not None
+
+    def add_alarm(self, alarm):
+        cursor = self.conn.execute(
+            "INSERT INTO alarms (minute_of_day, repeat_mask, label, tone, active) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (alarm.minute_of_day, alarm.repeat_mask, alarm.label, alarm.tone, int(alarm.active)))
+        alarm.id = cursor.lastrowid
+
+    def add_alarms(self, alarms):
+        with self.transaction():
+            for alarm in alarms:
+                self.add_alarm(alarm)
+
+    def update_alarm(self, alarm):
+        self.conn.execute(
+            "UPDATE alarms SET minute_of_day = ?, repeat_mask = ?, label = ?, tone = ?, "
+            "active = ? WHERE id = ?",
+            (alarm.minute_of_day, alarm.repeat_mask, alarm.label, alarm.tone, int(alarm.active),
+             alarm.id))
+
+    def update_alarms(self, alarms):
+        with self.transaction():
+            for alarm in alarms:
+                self.update_alarm(alarm)
+
+    def set_alarms_active(self, alarm_ids, active):
+        with self.transaction():
+            self.conn.executemany("UPDATE alarms SET active = ? WHERE id = ?",
+                                  [(int(active), alarm_id) for alarm_id in alarm_ids])
+
+    def delete_alarm(self, alarm):
+        self.conn.execute("DELETE FROM alarms WHERE id = ?", (alarm.id,))
+
+    def delete_alarms(self, alarms):
+        self.delete_alarm_ids([alarm.id for alarm in alarms])
+
+    def delete_alarm_ids(self, alarm_ids):
+        with self.transaction():
+            self.conn.executemany("DELETE FROM alarms WHERE id = ?", 
+                                  [(alarm_id,) for alarm_id in alarm_ids])
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # Group several statements into one commit
+        self.conn.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def load_world_clocks(self):
+        return [tz for tz, in self.conn.execute("SELECT tz FROM world_clocks ORDER BY position")]
+
+    def add_world_clock(self, tz_name):
+        self.conn.execute("INSERT INTO world_clocks (tz) VALUES (?)", (tz_name,))
+
+    def remove_world_clock(self, tz_name):
+        # Remove the first clock showing `tz_name`
+        self.conn.execute("DELETE FROM world_clocks WHERE position = (SELECT MIN(position) "
+                          "FROM world_clocks WHERE tz = ?)", (tz_name,))
+
+    def load_settings(self):
+        return dict(self.conn.execute("SELECT key, value FROM settings"))
+
+    def save_settings(self, settings):
+        self.conn.executemany("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                              [(key, str(value)) for key, value in settings.items()])
+
+class InvalidAlarmError(ValueError):
+    pass
+
+def validate_alarm(hour, minute, ampm, repeat):
+    if hour < 1 or hour > 12:
+        raise InvalidAlarmError("Hour must be between 1 and 12")
+    if minute < 0 or minute > 59:
+        raise InvalidAlarmError("Minute must be between 0 and 59")
+    if ampm not in ("AM", "PM"):
+        raise InvalidAlarmError("Period must be AM or PM")
+    unknown = set(repeat) - set(DAY_NAMES)
+    if unknown:
+        raise InvalidAlarmError("Unknown repeat day: " + ", ".join(sorted(unknown)))
+
+class Notifier:
+    # Receives alarm events from the engine. The Tk view implements these to
+    # keep its widgets in sync; headless services log or forward them.
+    def alarm_added(self, alarm):
+        pass
+
+    def alarms_added(self, alarms):
+        # A batch from a bulk import; reported one alarm at a time unless
+        # the notifier can take the whole batch at once
+        for alarm in alarms:
+            self.alarm_added(alarm)
+
+    def alarm_changed(self, alarm):
+        pass
+
+    def alarm_removed(self, alarm):
+        pass
+
+    def alarm_fired(self, alarm):
+        pass
+
+    def alarm_missed(self, alarm, due):
+        # Found more than the grace window after `due`; not rung
+        pass
+
+    def alarm_stopped(self, alarm):
+        pass
+
+class LogNotifier(Notifier):
+    def __init__(self, logger=None):
+        self.logger = logger or logging.getLogger("clock_engine")
+
+    def alarm_fired(self, alarm):
+        self.logger.info("Alarm %s - %s", format_alarm_time(alarm), alarm.label)
+
+    def alarm_missed(self, alarm, due):
+        self.logger.warning("Missed alarm %s - %s, due %s", format_alarm_time(alarm), 
+                            alarm.label, due.strftime('%a %Y-%m-%d %H:%M'))
+
+class Firing:
+    # One alarm occurrence as it was handled: rung `late` seconds after it
+    # was due, or missed
+    __slots__ = ('alarm_id', 'label', 'due', 'late', 'missed')
+
+    def __init__(self, alarm, due, late, missed=False):
+        self.alarm_id = alarm.id
+        self.label = alarm.label
+        self.due = due
+        self.late = late
+        self.missed = missed
+
+    def __str__(self):
+        if self.missed:
+            outcome = f"missed, found {format_duration_ns(int(self.late * 1e9), 0)} late"
+        else:
+            outcome = f"rang {self.late:.1f} s late"
+        return f"{self.due:%a %Y-%m-%d %H:%M}  {self.label}: {outcome}"
+
+class NullAudioSink:
+    # Plays nothing; the default when there is no audio device
+    def play(self, tone, volume, duration):
+        pass
+
+    def stop(self):
+        pass
+
+class AlarmEngine:
+    # Alarm scheduling without any UI. Owns the alarm registry, the deadline
+    # scheduler, the upcoming agenda and persistence, takes its notion of time
+    # from an injectable clock, and reports what happens through a Notifier
+    # and an audio sink. `root` is anything with after()/after_cancel(): a Tk
+    # root or an EventLoop. `alarms` maps each alarm's stable ID to the alarm,
+    # and every other structure is keyed by that ID too.
+    EDITABLE_FIELDS = ('hour', 'minute', 'ampm', 'label', 'tone', 'repeat', 'active')
+    # Bulk changes touching more than this share of the alarms rebuild the
+    # list index instead of patching it one alarm at a time
+    BULK_REINDEX_FRACTION = 16
+    # Settings key of the watermark: every alarm due up to this local time
+    # has been rung or reported missed
+    WATERMARK_KEY = 'last_evaluated'
+    # Settings key of the IDs of outstanding snooze alarms
+    SNOOZE_KEY = 'snooze_alarms'
+    HISTORY_SIZE = 200
+
+    def __init__(self, root, store=None, clock=None, notifier=None, audio=None):
+        self.root = root
+        self.store = store
+        self.clock = clock or SystemClock()
+        self.notifier = notifier or Notifier()
+        self.audio = audio or NullAudioSink()
+        self.alarms = {}
+        self.scheduler = AlarmScheduler(root, self.check_alarms, self.clock)
+        self.agenda = AlarmAgenda()
+        self.pending = []
+        self.current_alarm = None
+        self.volume = 50
+        self.snooze_minutes = 5
+        self.alarm_duration = 60
+        # Alarms found later than this, after a stall, a suspend or while the
+        # clock was not running, are reported missed instead of rung
+        self.grace_minutes = 60
+        self.watermark = None
+        self.history = deque(maxlen=self.HISTORY_SIZE)
+        # IDs of the one-shot alarms added by snooze(); each is deleted once
+        # it has rung or been missed, so snoozing never grows the alarm list
+        self.snoozes = set()
+        # A clock_metrics.Metrics while instrumentation is on
+        self.metrics = None
+        # Headless services stop a ringing alarm after alarm_duration seconds
+        self.auto_dismiss = False
+        self._ring_after_id = None
+        self._ids = itertools.count(1)
+        self._index = None
+
+    @property
+    def index(self):
+        # Sorted/filtered listing for list views, built on first use
+        if self._index is None:
+            self._index = AlarmIndex(self.alarms.values())
+        return self._index
+
+    def load(self):
+        if self.store is None:
+            return
+        self.alarms = {alarm.id: alarm for alarm in self.store.load_alarms()}
+        self._index = None
+        self._ids = itertools.count(max(self.alarms, default=0) + 1)
+        self.load_snoozes()
+        now = self.clock.now()
+        # Schedule from the persisted watermark, so alarms that came due
+        # while the clock was not running are caught up on the first wakeup
+        since = self.load_watermark(now)
+        self.watermark = since
+        self.scheduler.add_many(self.alarms.values(), since)
+        for alarm in self.alarms.values():
+            self.agenda.add(alarm, now)
+
+    def load_snoozes(self):
+        # Snooze alarms that rang before the last exit are deleted now
+        value = self.store.load_settings().get(self.SNOOZE_KEY, "")
+        snoozes = {int(alarm_id) for alarm_id in value.split(',') if alarm_id.isdigit()}
+        self.snoozes = {alarm_id for alarm_id in snoozes if alarm_id in self.alarms}
+        spent = [alarm_id for alarm_id in self.snoozes if not self.alarms[alarm_id].active]
+        if spent:
+            self.store.delete_alarm_ids(spent)
+            for alarm_id in spent:
+                del self.alarms[alarm_id]
+            self.snoozes.difference_update(spent)
+        if self.snoozes != snoozes:
+            self.save_snoozes()
+
+    def save_snoozes(self):
+        if self.store is not None:
+            self.store.save_settings({self.SNOOZE_KEY: ",".join(map(str, sorted(self.snoozes)))})
+
+    def discard_snoozes(self):
+        # Delete the snooze alarms that have rung or been missed
+        busy = {alarm.id for alarm, due in self.pending}
+        if self.current_alarm is not None:
+            busy.add(self.current_alarm.id)
+        spent = [self.alarms[alarm_id] for alarm_id in self.snoozes 
+                 if not self.alarms[alarm_id].active and alarm_id not in busy]
+        if spent:
+            self.delete_many(spent)
+
+    def load_watermark(self, now):
+        value = self.store.load_settings().get(self.WATERMARK_KEY)
+        try:
+            watermark = datetime.datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return now
+        # A watermark ahead of now means the clock was set back
+        return min(watermark, now)
+
+    def advance_watermark(self, now):
+        self.watermark = now
+        if self.store is not None:
+            self.store.save_settings({self.WATERMARK_KEY: now.isoformat()})
+
+    def schedule_from(self):
+        # New and changed alarms are scheduled from now, or from the
+        # watermark while the clock is behind it, so an occurrence already
+        # handled never rings again. Firing and advancing the watermark are
+        # left to the scheduler's wakeup.
+        now = self.clock.now()
+        if self.watermark is not None and self.watermark > now:
+            return self.watermark
+        return now
+
+    def add_alarm(self, hour, minute, ampm, label="Alarm", tone="Classic Alarm", repeat=(), 
+                  active=True):
+        validate_alarm(hour, minute, ampm, repeat)
+        alarm = Alarm.from_12h(hour, minute, ampm, label, tone, repeat, active)
+        if self.store is not None:
+            self.store.add_alarm(alarm)
+        else:
+            alarm.id = next(self._ids)
+        
+        self.alarms[alarm.id] = alarm
+        self.scheduler.add(alarm, self.schedule_from())
+        self.agenda.add(alarm, self.clock.now())
+        if self._index is not None:
+            self._index.add(alarm)
+        self.notifier.alarm_added(alarm)
+        return alarm
+
+    def add_alarms(self, alarms):
+        # Bulk insert of validated, not yet stored Alarm records: one
+        # transaction, one scheduler re-arm and one notification per batch
+        alarms = list(alarms)
+        if not alarms:
+            return alarms
+        if self.store is not None:
+            self.store.add_alarms(alarms)
+        else:
+            for alarm in alarms:
+                alarm.id = next(self._ids)
+        
+        self._bulk(alarms)
+        for alarm in alarms:
+            self.alarms[alarm.id] = alarm
+        self.scheduler.add_many(alarms, self.schedule_from())
+        self.agenda.add_many(alarms, self.clock.now())
+        if self._index is not None:
+            for alarm in alarms:
+                self._index.add(alarm)
+        self.notifier.alarms_added(alarms)
+        return alarms
+
+    def _changed(self, alarm):
+        # Re-file an alarm whose fields were changed in place
+        self.scheduler.update(alarm, self.schedule_from())
+        self.agenda.update(alarm, self.clock.now())
+        if self._index is not None:
+            self._index.update(alarm)
+        self.notifier.alarm_changed(alarm)
+
+    def _bulk(self, alarms):
+        # Drop the list index ahead of large bulk changes; it is rebuilt once
+        # on next use rather than patched per alarm
+        if len(alarms) > len(self.alarms) // self.BULK_REINDEX_FRACTION:
+            self._index = None
+
+    def edit_alarm(self, alarm, **changes):
+        # Change any of EDITABLE_FIELDS on an existing alarm
+        unknown = set(changes) - set(self.EDITABLE_FIELDS)
+        if unknown:
+            raise InvalidAlarmError("Unknown alarm field: " + ", ".join(sorted(unknown)))
+        edited = {field: getattr(alarm, field) for field in self.EDITABLE_FIELDS}
+        edited.update(changes)
+        validate_alarm(edited['hour'], edited['minute'], edited['ampm'], edited['repeat'])
+        updated = Alarm.from_12h(**edited)
+        for slot in ('minute_of_day', 'repeat_mask', 'label', 'tone', 'active'):
+            setattr(alarm, slot, getattr(updated, slot))
+        if self.store is not None:
+            self.store.update_alarm(alarm)
+        self._changed(alarm)
+
+    def set_active(self, alarm, active):
+        self.set_active_many([alarm], active)
+
+    def toggle(self, alarm):
+        self.set_active(alarm, not alarm.active)
+
+    def set_active_many(self, alarms, active):
+        self.set_states([(alarm, active) for alarm in alarms])
+
+    def toggle_many(self, alarms):
+        self.set_states([(alarm, not alarm.active) for alarm in alarms])
+
+    def set_states(self, states):
+        # Apply (alarm, active) pairs, persisting them in one transaction
+        changed = [alarm for alarm, active in states if alarm.active != active]
+        if not changed:
+            return
+        self._bulk(changed)
+        for alarm, active in states:
+            alarm.active = active
+        if self.store is not None:
+            self.store.update_alarms(changed)
+        for alarm in changed:
+            self._changed(alarm)
+
+    def delete(self, alarm):
+        self.delete_many([alarm])
+
+    def delete_many(self, alarms):
+        alarms = [alarm for alarm in alarms if alarm.id in self.alarms]
+        self._bulk(alarms)
+        if self.store is not None:
+            self.store.delete_alarms(alarms)
+        for alarm in alarms:
+            self.scheduler.remove(alarm)
+            self.agenda.remove(alarm)
+            if self._index is not None:
+                self._index.remove(alarm)
+            del self.alarms[alarm.id]
+            self.notifier.alarm_removed(alarm)
+        # The stored IDs must not outlive their alarms, as SQLite may reuse them
+        if self.snoozes and not self.snoozes.isdisjoint(alarm.id for alarm in alarms):
+            self.snoozes.difference_update(alarm.id for alarm in alarms)
+            self.save_snoozes()
+
+    def upcoming(self, now=None):
+        return self.agenda.upcoming(now or self.clock.now())
+
+    def check_alarms(self):
+        # Called by the scheduler when the earliest alarm is due and at least
+        # once a minute; the only place alarms ring and the watermark moves.
+        # Every alarm due since the watermark is handled exactly once: rung
+        # if it is within the grace window, reported missed if not. A
+        # repeating alarm that came due several times in a long gap rings at
+        # most once, for its latest time; the earlier ones are reported.
+        now = self.clock.now()
+        grace = datetime.timedelta(minutes=self.grace_minutes)
+        
+        for due, alarm in self.scheduler.pop_due(now):
+            if alarm.repeat_mask and now - due >= ONE_DAY:
+                # Every occurrence before the latest is a day or more late
+                for later in alarm_occurrences(alarm, due):
+                    if later > now:
+                        break
+                    self.report_missed(alarm, due, now)
+                    due = later
+            if now - due > grace:
+                self.report_missed(alarm, due, now)
+            else:
+                # Queue alarms that come due while another one is sounding
+                self.pending.append((alarm, due))
+            
+            if not alarm.repeat_mask:
+                # One-shot alarms switch off once they have rung
+                alarm.active = False
+                self.agenda.remove(alarm)
+                if self._index is not None:
+                    self._index.update(alarm)
+                if self.store is not None:
+                    self.store.update_alarm(alarm)
+                self.notifier.alarm_changed(alarm)
+        
+        self.advance_watermark(now)
+        if self.snoozes:
+            self.discard_snoozes()
+        self.fire_pending()
+
+    def report_missed(self, alarm, due, now):
+        self.history.append(Firing(alarm, due, (now - due).total_seconds(), True))
+        if self.metrics is not None:
+            self.metrics.count('alarms_missed_total', 
+                               'repeating' if alarm.repeat_mask else 'once')
+        self.notifier.alarm_missed(alarm, due)
+
+    @property
+    def sounding(self):
+        return self.current_alarm is not None
+
+    def fire_pending(self):
+        if not self.pending or self.current_alarm is not None:
+            return
+        alarm, due = self.pending.pop(0)
+        self.current_alarm = alarm
+        firing = Firing(alarm, due, (self.clock.now() - due).total_seconds())
+        self.history.append(firing)
+        if self.metrics is not None:
+            self.metrics.observe('alarm_fire_latency_seconds', 
+                                 'repeating' if alarm.repeat_mask else 'once', firing.late)
+        self.notifier.alarm_fired(alarm)
+        self.audio.play(alarm.tone, self.volume, self.alarm_duration)
+        if self.auto_dismiss:
+            self._ring_after_id = self.root.after(self.alarm_duration * 1000, self.dismiss)
+
+    def stop_ringing(self):
+        alarm = self.current_alarm
+        self.current_alarm = None
+        if self._ring_after_id is not None:
+            self.root.after_cancel(self._ring_after_id)
+            self._ring_after_id = None
+        self.audio.stop()
+        self.notifier.alarm_stopped(alarm)
+        if alarm.id in self.snoozes:
+            self.discard_snoozes()
+
+    def dismiss(self):
+        if self.current_alarm is None:
+            return
+        self.stop_ringing()
+        self.fire_pending()
+
+    def lateness_report(self, max_lines=20):
+        # The most recent handled alarms, newest first
+        if not self.history:
+            return "No alarms have rung yet"
+        firings = list(self.history)[::-1][:max_lines]
+        late = [firing.late for firing in self.history if not firing.missed]
+        lines = [f"{len(self.history)} alarms, {len(self.history) - len(late)} missed"]
+        if late:
+            lines[0] += f", worst rang {max(late):.1f} s late"
+        return "\n".join(lines + [str(firing) for firing in firings])
+
+    def snooze(self, minutes=None):
+        # Silence the ringing alarm and add a one-shot alarm `minutes` later
+        if self.current_alarm is None:
+            return None
+        self.stop_ringing()
+        
+        snooze_time = self.clock.now() + datetime.timedelta(minutes=minutes or self.snooze_minutes)
+        hour = snooze_time.hour % 12 or 12
+        ampm = "AM" if snooze_time.hour < 12 else "PM"
+        alarm = self.add_alarm(hour, snooze_time.minute, ampm, "Snooze", "Classic Alarm")
+        self.snoozes.add(alarm.id)
+        self.save_snoozes()
+        
+        self.fire_pending()
+        return alarm
+
+# How often services write their metrics file
+METRICS_DUMP_MS = 15000
+
+def main(argv=None):
+    # Run the alarm scheduler as a headless service
+    import argparse
+    parser = argparse.ArgumentParser(description="Headless alarm scheduler")
+    parser.add_argument('--db', default=ClockStore.default_path(), help="alarm database path")
+    parser.add_argument('--ring-seconds', type=int, default=60, 
+                        help="how long an alarm rings before it is dismissed")
+    parser.add_argument('--metrics', metavar='PATH', 
+                        help="write latency metrics here every 15 s (Prometheus text, or JSON "
+                             "for a .json path)")
+    parser.add_argument('--grace-minutes', type=int, default=60,
+                        help="ring alarms found up to this late after a stall or downtime")
+    parser.add_argument('--audio', choices=['none', 'device'], default='none',
+                        help="play alarm tones on the sound device")
+    parser.add_argument('--wav', metavar='PATH', help="write each alarm's sound to a WAV file")
+    parser.add_argument('--tones', metavar='DIR', help="directory of WAV alarm tones")
+    parser.add_argument('--import', dest='import_path', metavar='PATH', 
+                        help="add the alarms in a CSV or iCalendar file, then exit")
+    parser.add_argument('--export', dest='export_path', metavar='PATH', 
+                        help="write all alarms to a CSV or iCalendar file, then exit")
+    parser.add_argument('--api', metavar='ADDRESS', 
+                        help="serve the JSON control API on a Unix socket path or [HOST:]PORT")
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    if args.import_path or args.export_path:
+        from clock_io import AlarmImporter, export_alarms
+        engine = AlarmEngine(EventLoop(), store=ClockStore(args.db))
+        engine.load()
+        if args.import_path:
+            importer = AlarmImporter.open(engine, args.import_path).run()
+            logging.info("%s", importer.summary())
+        if args.export_path:
+            export_alarms(args.export_path, engine.alarms.values(), engine.clock.now())
+            logging.info("Wrote %d alarms to %s", len(engine.alarms), args.export_path)
+        return
+    
+    audio = None
+    if args.audio == 'device' or args.wav:
+        from clock_audio import NullSink, DeviceSink, ToneAudioSink, ToneLibrary, WavFileSink
+        if args.wav:
+            sink = WavFileSink(args.wav)
+        else:
+            sink = DeviceSink.available()
+            if sink is None:
+                logging.warning("No audio device found; alarms will be silent")
+                sink = NullSink()
+        library = ToneLibrary(args.tones or ToneLibrary.default_directory())
+        audio = ToneAudioSink(sink, library=library)
+        library.scan(reserved=audio.tones)
+        logging.info("Found %d tones in %s", len(library.tones), library.directory)
+    
+    loop = EventLoop()
+    engine = AlarmEngine(loop, store=ClockStore(args.db), notifier=LogNotifier(), audio=audio)
+    engine.alarm_duration = args.ring_seconds
+    engine.grace_minutes = args.grace_minutes
+    engine.auto_dismiss = True
+    metrics = None
+    if args.metrics:
+        from clock_metrics import Metrics
+        metrics = Metrics().attach(engine, engine.scheduler)
+        
+        def dump_metrics():
+            try:
+                metrics.dump(args.metrics)
+            except OSError as exc:
+                logging.warning("Could not write metrics: %s", exc)
+            loop.after(METRICS_DUMP_MS, dump_metrics)
+        
+        loop.after(METRICS_DUMP_MS, dump_metrics)
+    engine.load()
+    logging.info("Loaded %d alarms from %s", len(engine.alarms), args.db)
+    
+    server = None
+    if args.api:
+        from clock_api import AlarmControl, ControlServer, parse_address
+        
+        def timers_finished():
+            for timer in timers.pop_finished():
+                logging.info("Timer finished: %s", timer.name)
+        
+        timers = TimerEngine(loop, timers_finished)
+        if metrics is not None:
+            metrics.attach(timers)
+        server = ControlServer(AlarmControl(loop, engine, timers), parse_address(args.api)).start()
+    
+    try:
+        loop.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server is not None:
+            server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import bisect
+import json
+import os
+import time
+
+# Latency instrumentation for the clock's schedulers. A Metrics registry is
+# attached to the engines through their `metrics` attribute; while that is
+# None (the default) each instrumented site costs one attribute test and
+# no clock reads. Values are kept in fixed-bucket histograms, so recording
+# is a bisect and three additions and memory does not grow with uptime.
+# dump() writes the Prometheus text format, or JSON for a .json path.
+
+# Bucket upper bounds in seconds, from sub-millisecond callback times up to
+# alarms caught up minutes late
+BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5,
+           1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# name: (label, type, help)
+METRICS = {
+    'tick_lag_seconds': ('loop', 'histogram',
+                         "How long after its deadline each periodic tick ran"),
+    'callback_seconds': ('callback', 'histogram',
+                         "Time spent in each scheduler callback"),
+    'alarm_fire_latency_seconds': ('kind', 'histogram',
+                                   "How long after its due time an alarm started ringing"),
+    'timer_fire_latency_seconds': ('kind', 'histogram',
+                                   "How long after its deadline a countdown timer finished"),
+    'alarms_missed_total': ('kind', 'counter',
+                            "Alarms found past the grace window and not rung"),
+}
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count', 'max')
+
+    def __init__(self):
+        # One count per bucket plus the +Inf bucket; not cumulative
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-quantile; the largest
+        # value seen for the +Inf bucket
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+class Metrics:
+    def __init__(self, prefix="alarm_clock", clock=time.perf_counter_ns):
+        self.prefix = prefix
+        self.clock = clock
+        self.histograms = {}
+        self.counters = {}
+        self.started = time.time()
+
+    def observe(self, name, label, seconds):
+        histogram = self.histograms.get((name, label))
+        if histogram is None:
+            histogram = self.histograms[name, label] = Histogram()
+        histogram.observe(seconds if seconds > 0 else 0.0)
+
+    def count(self, name, label, amount=1):
+        self.counters[name, label] = self.counters.get((name, label), 0) + amount
+
+    def timed(self, label, callback, *args):
+        # Run callback(*args) and record its duration under callback_seconds
+        start = self.clock()
+        try:
+            return callback(*args)
+        finally:
+            self.observe('callback_seconds', label, (self.clock() - start) / 1e9)
+
+    def attach(self, *targets):
+        # Start recording from engines and schedulers
+        for target in targets:
+            target.metrics = self
+        return self
+
+    def _families(self):
+        families = {}
+        for (name, label), value in list(self.histograms.items()) + list(self.counters.items()):
+            families.setdefault(name, []).append((label, value))
+        for name in families:
+            families[name].sort()
+        return sorted(families.items())
+
+    def prometheus(self):
+        lines = []
+        for name, series in self._families():
+            label_name, kind, help_text = METRICS[name]
+            full = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            for label, value in series:
+                where = f'{label_name}="{label}"'
+                if kind == 'counter':
+                    lines.append(f"{full}{{{where}}} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS + (float('inf'),), value.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float('inf') else repr(bound)
+                    lines.append(f'{full}_bucket{{{where},le="{le}"}} {cumulative}')
+                lines.append(f"{full}_sum{{{where}}} {value.sum!r}")
+                lines.append(f"{full}_count{{{where}}} {value.count}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        metrics = {}
+        for name, series in self._families():
+            label_name, kind, help_text = METRICS[name]
+            entries = metrics[name] = {}
+            for label, value in series:
+                if kind == 'counter':
+                    entries[label] = value
+                    continue
+                entries[label] = {
+                    'count': value.count,
+                    'sum': value.sum,
+                    'max': value.max,
+                    'p50': value.quantile(0.5),
+                    'p90': value.quantile(0.9),
+                    'p99': value.quantile(0.99),
+                    'buckets': dict(zip([str(bound) for bound in BUCKETS] + ["+Inf"],
+                                        value.counts))
+                }
+        return {'prefix': self.prefix, 'started': self.started, 'written': time.time(),
+                'metrics': metrics}
+
+    def dump(self, path):
+        # Replace the file atomically so a scraper never reads half a dump
+        if path.endswith('.json'):
+            text = json.dumps(self.to_json(), indent=2)
+        else:
+            text = self.prometheus()
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as f:
+            f.write(text)
+        os.replace(temp_path, path)
@@ -0,0 +1,344 @@
+import argparse
+import ast
+import datetime
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+
+from clock_audio import NullSink
+from clock_bench import load_app_module
+from clock_engine import DAY_NAMES, ONE_DAY, EventLoop, VirtualClock
+
+# Long-run memory check for week-long sessions. The real AlarmClock runs on
+# a hidden Tk root with its engines on a VirtualClock, and days of alarms,
+# snoozes, missed alarms after a suspend, countdown timers, world-clock
+# changes and tab switches are simulated in seconds. At every simulated
+# midnight the size of each structure that could grow is recorded, and
+# tracemalloc snapshots attribute memory growth to the class that allocated
+# it. The exit status is 1 if anything still grows after the warm-up days.
+# Tk needs a display; use xvfb-run on a headless machine.
+
+STEP_SECONDS = 60
+SUSPEND_HOUR = 13
+SUSPEND_SECONDS = 2 * 3600
+WORLD_CLOCK_HOUR = 12
+ZONES = ['America/New_York', 'Europe/London', 'Asia/Tokyo', 'Australia/Sydney',
+         'America/Los_Angeles', 'Europe/Berlin', 'Asia/Kolkata', 'America/Sao_Paulo']
+# Frames kept by each tracemalloc trace; enough to reach the app's own code
+# from inside tkinter. More frames slow the run down further.
+TRACE_FRAMES = 8
+
+class SoakMessages:
+    # Stands in for tkinter.messagebox so dialogs do not block the run
+    def __init__(self):
+        self.shown = 0
+
+    def _show(self, *args, **kwargs):
+        self.shown += 1
+        return True
+
+    showinfo = showwarning = showerror = askyesno = _show
+
+class SiteMap:
+    # Maps a file and line of this package to its innermost class or
+    # function, found once per file from the source
+    def __init__(self, directory):
+        self.directory = directory
+        self.spans = {}
+
+    def _load(self, filename):
+        spans = []
+        try:
+            with open(filename) as f:
+                tree = ast.parse(f.read())
+        except (OSError, SyntaxError):
+            return spans
+
+        def visit(node, prefix):
+            for child in ast.iter_child_nodes(node):
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                    name = prefix + child.name
+                    spans.append((child.lineno, child.end_lineno, name))
+                    visit(child, name + ".")
+                else:
+                    visit(child, prefix)
+
+        visit(tree, "")
+        return spans
+
+    def name(self, filename, lineno):
+        spans = self.spans.get(filename)
+        if spans is None:
+            spans = self.spans[filename] = self._load(filename)
+        best = None
+        for start, end, name in spans:
+            if start <= lineno <= end and (best is None or end - start < best[1] - best[0]):
+                best = (start, end, name)
+        return best[2] if best else "<module>"
+
+    def site(self, traceback):
+        # The innermost frame in this package, skipping the soak itself
+        for frame in reversed(traceback):
+            filename = frame.filename
+            if (os.path.dirname(os.path.abspath(filename)) == self.directory
+                    and os.path.basename(filename) != os.path.basename(__file__)):
+                module = os.path.splitext(os.path.basename(filename))[0]
+                return module, self.name(filename, frame.lineno)
+        return "<outside>", "<outside>"
+
+def take_snapshot():
+    gc.collect()
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>")
+    ])
+
+def growth_by_subsystem(baseline, snapshot, sites):
+    # {subsystem: [bytes, blocks, {site: bytes}]}, a subsystem being a class
+    # or a module-level function
+    groups = {}
+    for stat in snapshot.compare_to(baseline, 'traceback'):
+        if not stat.size_diff and not stat.count_diff:
+            continue
+        module, name = sites.site(stat.traceback)
+        subsystem = f"{module}:{name.split('.')[0]}"
+        group = groups.setdefault(subsystem, [0, 0, {}])
+        group[0] += stat.size_diff
+        group[1] += stat.count_diff
+        group[2][name] = group[2].get(name, 0) + stat.size_diff
+    return groups
+
+def count_widgets(widget):
+    # (widgets, toplevels) under `widget`, itself excluded
+    widgets = toplevels = 0
+    for child in widget.winfo_children():
+        widgets += 1
+        if child.winfo_class() == 'Toplevel':
+            toplevels += 1
+        below = count_widgets(child)
+        widgets += below[0]
+        toplevels += below[1]
+    return widgets, toplevels
+
+def structure_limits(app):
+    # Structures that fill up to a fixed size and are not leaks before then
+    return {'alarm history': app.engine.history.maxlen}
+
+def structure_sizes(app, loop):
+    # Everything that lives as long as the app and could grow with uptime
+    engine = app.engine
+    tcl = app.root.tk
+    widgets, toplevels = count_widgets(app.root)
+    return {
+        'alarms': len(engine.alarms),
+        'alarm list rows': len(app.alarm_tree.get_children()),
+        'alarm queue entries': len(engine.scheduler.queue._heap),
+        'pending alarms': len(engine.pending),
+        'alarm history': len(engine.history),
+        'snooze alarms': len(engine.snoozes),
+        'missed alarm notices': len(app.missed_alarms),
+        'timers': len(app.timer_engine.timers),
+        'timer rows': len(app.timer_tree.get_children()),
+        'world clocks': len(app.world_clocks),
+        'rendered options': len(app.rendered),
+        'tick subscribers': len(app.ticker.subscribers),
+        'tick queue entries': len(app.ticker.queue._heap),
+        'loop callbacks': len(loop._callbacks),
+        'canvas items': len(app.analog_canvas.find_all()),
+        'widgets': widgets,
+        'toplevels': toplevels,
+        'tcl commands': len(tcl.splitlist(tcl.call('info', 'commands'))),
+        'tcl variables': len(tcl.splitlist(tcl.call('info', 'globals')))
+    }
+
+class Soak:
+    def __init__(self, app_module, clock, loop, alarms, seed):
+        self.clock = clock
+        self.loop = loop
+        self.rng = random.Random(seed)
+        self.timers_started = 0
+        self.rings = 0
+        self.snoozes = 0
+        self.missed = 0
+
+        root = app_module.tk.Tk()
+        root.withdraw()
+        self.messages = app_module.messagebox = SoakMessages()
+        self.app = app = app_module.AlarmClock(root, clock=clock, loop=loop)
+        app.audio.sink = NullSink()
+        self.tabs = [app.clock_tab, app.alarm_tab, app.stopwatch_tab, app.timer_tab,
+                     app.world_clock_tab, app.settings_tab]
+        for tab in self.tabs:
+            app.build_tab(tab)
+
+        # Daily alarms between 6:00 and 22:00, so every snooze has rung by
+        # midnight, when the sizes are taken
+        for number in range(alarms):
+            hour = self.rng.randint(6, 21)
+            app.engine.add_alarm(hour % 12 or 12, self.rng.randint(0, 59),
+                                 "AM" if hour < 12 else "PM", f"Soak {number + 1}",
+                                 repeat=DAY_NAMES)
+        self.settle()
+
+    def settle(self):
+        # Let Tk run the idle callbacks the simulated time has queued
+        self.app.root.update()
+
+    def select_tab(self, tab):
+        self.app.notebook.select(tab)
+        self.app.on_tab_changed()
+
+    def answer_alarm(self):
+        engine = self.app.engine
+        while engine.current_alarm is not None:
+            self.rings += 1
+            if self.rng.random() < 0.5:
+                self.snoozes += 1
+                self.app.snooze_alarm()
+            else:
+                self.app.dismiss_alarm()
+
+    def churn_world_clocks(self):
+        # Add a zone the way the World Clock tab does and drop the oldest
+        app = self.app
+        tz_name = self.rng.choice(ZONES)
+        app.add_clock_display(tz_name)
+        app.store.add_world_clock(tz_name)
+        app.remove_clock_display(app.world_clocks[0])
+
+    def start_timer(self):
+        # Timers started the way the control API does
+        self.timers_started += 1
+        name = f"Soak timer {self.timers_started}"
+        self.app.timer_engine.start(name, self.rng.randint(60, 3000) * 1000000000)
+        self.app.api_timers_changed()
+
+    def suspend(self):
+        # The machine sleeps: time jumps and the loop runs late, so alarms
+        # due meanwhile are caught up or reported missed
+        self.clock.advance(SUSPEND_SECONDS)
+        self.loop.run_due()
+        self.missed += len(self.app.missed_alarms)
+
+    def every_hour(self, hour):
+        self.select_tab(self.tabs[hour % len(self.tabs)])
+        self.start_timer()
+        if hour == WORLD_CLOCK_HOUR:
+            self.churn_world_clocks()
+        if hour == SUSPEND_HOUR:
+            self.suspend()
+
+    def run_day(self):
+        end = self.clock.now() + ONE_DAY
+        hour = None
+        while self.clock.now() < end:
+            now = self.clock.now()
+            if now.hour != hour:
+                hour = now.hour
+                self.every_hour(hour)
+            self.loop.advance(STEP_SECONDS)
+            self.settle()
+            self.answer_alarm()
+
+def growing(series, days):
+    # True if the value went up on each of the last `days` days
+    recent = series[-days - 1:]
+    return len(recent) > days and all(b > a for a, b in zip(recent, recent[1:]))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate days of operation and report "
+                                                 "memory growth")
+    parser.add_argument('--days', type=int, default=7, help="simulated days")
+    parser.add_argument('--warmup', type=int, default=1,
+                        help="days of caches filling up before growth is measured")
+    parser.add_argument('--alarms', type=int, default=24, help="daily alarms to ring")
+    parser.add_argument('--max-growth', type=float, default=64.0, metavar='KIB',
+                        help="traced memory growth per day reported as a leak")
+    parser.add_argument('--top', type=int, default=12, help="subsystems listed")
+    parser.add_argument('--frames', type=int, default=TRACE_FRAMES,
+                        help="stack frames kept per traced allocation")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="also write the results here as JSON")
+    args = parser.parse_args(argv)
+    if args.days <= args.warmup:
+        parser.error("--days must be larger than --warmup")
+
+    # A scratch database, so the run neither sees nor changes real alarms
+    directory = tempfile.mkdtemp(prefix="clock-soak-")
+    os.environ['ALARM_CLOCK_DB'] = os.path.join(directory, "soak.db")
+    app_module = load_app_module()
+    clock = VirtualClock(datetime.datetime(2024, 1, 1))
+    loop = EventLoop(clock)
+    sites = SiteMap(os.path.dirname(os.path.abspath(__file__)))
+
+    tracemalloc.start(args.frames)
+    soak = Soak(app_module, clock, loop, args.alarms, args.seed)
+    sizes = []
+    traced = []
+    baseline = None
+    for day in range(1, args.days + 1):
+        soak.run_day()
+        sizes.append(structure_sizes(soak.app, loop))
+        snapshot = take_snapshot()
+        traced.append(sum(stat.size for stat in snapshot.statistics('filename')))
+        if day == args.warmup:
+            baseline = snapshot
+        print(f"day {day:>3}  traced {traced[-1] / 1024:10.1f}KiB  rings {soak.rings:>6}  "
+              f"snoozes {soak.snoozes:>6}  missed {soak.missed:>5}  "
+              f"alarms {sizes[-1]['alarms']:>5}  widgets {sizes[-1]['widgets']:>5}")
+    groups = growth_by_subsystem(baseline, snapshot, sites)
+    tracemalloc.stop()
+
+    measured = args.days - args.warmup
+    per_day = (traced[-1] - traced[args.warmup - 1]) / measured / 1024
+    leaks = []
+
+    limits = structure_limits(soak.app)
+    print(f"\nStructures, after day {args.warmup} and day {args.days}:")
+    for name in sizes[0]:
+        series = [day_sizes[name] for day_sizes in sizes]
+        limit = limits.get(name)
+        flag = f"  (at most {limit})" if limit is not None else ""
+        if limit is None and growing(series[args.warmup - 1:], min(3, measured)):
+            flag = "  GROWING"
+            leaks.append(name)
+        print(f"  {name:<24} {series[args.warmup - 1]:>8} {series[-1]:>8}{flag}")
+
+    print(f"\nTraced memory growth: {per_day:+.1f}KiB/day")
+    ranked = sorted(groups.items(), key=lambda item: -abs(item[1][0]))[:args.top]
+    for subsystem, (size, blocks, by_site) in ranked:
+        site = max(by_site, key=lambda name: abs(by_site[name]))
+        print(f"  {subsystem:<36} {size / measured / 1024:+9.1f}KiB/day  "
+              f"{blocks / measured:+9.1f} blocks/day  top: {site}")
+    if per_day > args.max_growth:
+        leaks.append("traced memory")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'days': args.days,
+                'warmup': args.warmup,
+                'alarms': args.alarms,
+                'rings': soak.rings,
+                'snoozes': soak.snoozes,
+                'missed': soak.missed,
+                'traced_bytes': traced,
+                'sizes': sizes,
+                'growth_per_day': {subsystem: size / measured
+                                   for subsystem, (size, blocks, by_site) in groups.items()},
+                'leaks': leaks
+            }, f, indent=2)
+
+    if leaks:
+        print("\nStill growing: " + ", ".join(leaks))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,54 +1,188 @@
-import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
 import time
+# Taken before anything else is imported, for the startup report
+STARTUP_NS = time.perf_counter_ns()
+
+import tkinter as tk
+from tkinter import ttk, messagebox, filedialog
 import datetime
+import logging
 import threading
-import winsound
-import pytz
-from PIL import Image, ImageTk
 import os
 import math
-import random
 
-class AlarmClock:
-    def __init__(self, root):
+from clock_engine import (DAY_NAMES, EPOCH_ORDINAL, METRICS_DUMP_MS, AlarmEngine, ClockStore, 
+                          InvalidAlarmError, Notifier, PhaseTimer, Stopwatch, TickScheduler, 
+                          TimerEngine, TimezoneIndex, ZoneOffsetCache, format_alarm_time, 
+                          format_clock_time, format_duration_ns)
+
+logger = logging.getLogger("alarm_clock")
+
+class AlarmClock(Notifier):
+    # Fastest stopwatch refresh, roughly one display frame
+    STOPWATCH_FRAME_MS = 16
+    # The alarm and lap lists only hold the rows that fit on screen
+    LIST_ROW_HEIGHT = 20
+    LIST_HEADING_HEIGHT = 24
+    LIST_WHEEL_ROWS = 3
+    ALARM_SORT_COLUMNS = {'time': 'time', 'label': 'label', 'repeat': 'repeat', 'active': 'status'}
+    ALARM_COLUMN_TITLES = {'time': 'Time', 'label': 'Label', 'repeat': 'Repeat', 'active': 'Status'}
+    ALARM_TIME_FILTERS = {"Any time": None, "AM": (0, 719), "PM": (720, 1439)}
+    ALARM_REPEAT_FILTERS = {"Any repeat": None, "Once": 'once', "Repeating": 'repeating'}
+    ALARM_STATUS_FILTERS = {"Any status": None, "Active": 'active', "Inactive": 'inactive'}
+    DEFAULT_TIMEZONES = ['America/New_York', 'Europe/London', 'Asia/Tokyo', 'Australia/Sydney']
+    
+    def __init__(self, root, clock=None, loop=None):
+        # `clock` and `loop` (an EventLoop) let the soak test run the engines
+        # on simulated time; by default they use the system clock and `root`
+        # Time to first paint, phase by phase
+        self.startup = PhaseTimer(STARTUP_NS)
+        self.startup.mark('imports')
+        
         self.root = root
         self.root.title("Ultimate Alarm Clock")
         self.root.geometry("1000x700")
         self.root.configure(bg='#2c3e50')
         
         # Initialize variables
-        self.alarms = []
-        self.stopwatch_running = False
-        self.stopwatch_start_time = 0
-        self.stopwatch_elapsed = 0
-        self.lap_times = []
-        self.timer_running = False
-        self.timer_remaining = 0
-        self.timer_thread = None
-        self.alarm_sounding = False
-        self.current_alarm = None
+        self.store = ClockStore(ClockStore.default_path())
+        self.startup.mark('store')
+        # Imported here so the report counts it under the audio phase
+        from clock_audio import ToneAudioSink, ToneLibrary, default_sink
+        self.audio = ToneAudioSink(default_sink(), library=ToneLibrary(ToneLibrary.default_directory()))
+        self.startup.mark('audio')
+        loop = loop or root
+        self.engine = AlarmEngine(loop, store=self.store, clock=clock, notifier=self, audio=self.audio)
+        # Every periodic redraw is a subscriber of this one frame loop
+        self.ticker = TickScheduler(loop, self.engine.clock)
+        # Tick names per notebook tab, and the last value rendered into each
+        # widget option or variable
+        self.tab_tickers = {}
+        self.rendered = {}
+        self.alarm_list_top = 0
+        self.alarm_list_rows = 10
+        self.alarm_list_after_id = None
+        self.alarm_rows = {}
+        # Selected alarm IDs, including ones scrolled out of view
+        self.selected_alarm_ids = set()
+        self.editing_alarm = None
+        self.alarm_import = None
+        self.api_server = None
+        self.missed_alarms = []
+        # Built on the first alarm and reused for every later one
+        self.alarm_window = None
+        self.stopwatch = Stopwatch()
+        self.stopwatch_digits = 2
+        self.lap_list_top = 0
+        self.lap_list_rows = 10
+        self.lap_rows = {}
+        self.timer_engine = TimerEngine(loop, self.check_timers, self.engine.clock)
+        self.metrics = None
+        self.selected_timer = None
+        self.timer_rows = {}
+        self.agenda_version = None
+        self.create_settings_vars()
+        self.startup.mark('engine')
         
         # Create notebook for tabs
         self.notebook = ttk.Notebook(root)
         self.notebook.pack(fill='both', expand=True, padx=10, pady=10)
         
-        # Create tabs
-        self.create_clock_tab()
-        self.create_alarm_tab()
-        self.create_stopwatch_tab()
-        self.create_timer_tab()
-        self.create_world_clock_tab()
-        self.create_settings_tab()
+        # Every tab is added now but only the Digital Clock is filled in;
+        # the others are built the first time they are selected
+        self.tab_builders = {}
+        self.clock_tab = self.add_tab("Digital Clock", self.create_clock_tab)
+        self.alarm_tab = self.add_tab("Alarms", self.create_alarm_tab)
+        self.stopwatch_tab = self.add_tab("Stopwatch", self.create_stopwatch_tab)
+        self.timer_tab = self.add_tab("Timer", self.create_timer_tab)
+        self.world_clock_tab = self.add_tab("World Clock", self.create_world_clock_tab)
+        self.settings_tab = self.add_tab("Settings", self.create_settings_tab)
+        self.build_tab(self.clock_tab)
+        self.startup.mark('clock tab')
+        
+        # Restore saved alarms and settings
+        self.load_saved_state()
+        self.startup.mark('saved state')
+        
+        # Latency metrics are opt-in; while off the engines skip every clock read
+        metrics_path = os.environ.get('ALARM_CLOCK_METRICS')
+        if metrics_path:
+            self.start_metrics(metrics_path)
         
         # Start clock update
-        self.update_time()
-        
-        # Load alarm tones
-        self.load_alarm_tones()
+        self.add_tab_ticker('clock', self.update_time, self.clock_tab)
+        self.add_tab_ticker('next_alarm', self.update_next_alarm, self.clock_tab, self.alarm_tab)
         
         # Set dark theme
         self.set_theme()
+        self.startup.mark('theme')
+        
+        # The first Expose of the clock is followed by its redraw at idle time
+        self.clock_label.bind('<Expose>', self.on_first_expose)
+    
+    def on_first_expose(self, event=None):
+        self.clock_label.unbind('<Expose>')
+        self.root.after_idle(self.startup_finished)
+    
+    def startup_finished(self):
+        self.startup.mark('first paint')
+        logger.info("%s", self.startup.report("Startup"))
+        
+        # Render the tones off the UI thread so the first alarm starts at once
+        threading.Thread(target=self.audio.warm, args=(self.engine.volume,), daemon=True).start()
+        
+        # The scripting API is opt-in, and started after the first paint so
+        # asyncio is not imported on the startup path
+        address = os.environ.get('ALARM_CLOCK_API')
+        if address:
+            self.start_api(address)
+    
+    def start_api(self, address):
+        from clock_api import AlarmControl, ApiError, ControlServer, parse_address
+        control = AlarmControl(self.root, self.engine, self.timer_engine, 
+                               on_alarms_changed=self.api_alarms_changed, 
+                               on_timers_changed=self.api_timers_changed)
+        try:
+            self.api_server = ControlServer(control, parse_address(address)).start()
+        except (OSError, ApiError) as exc:
+            logger.warning("Control API not started: %s", exc)
+    
+    def start_metrics(self, path):
+        from clock_metrics import Metrics
+        self.metrics = Metrics().attach(self.engine, self.engine.scheduler, self.timer_engine, 
+                                        self.ticker)
+        self.metrics_path = path
+        self.ticker.add('metrics', self.dump_metrics)
+    
+    def dump_metrics(self):
+        try:
+            self.metrics.dump(self.metrics_path)
+        except OSError as exc:
+            logger.warning("Could not write metrics: %s", exc)
+        return METRICS_DUMP_MS
+    
+    def api_alarms_changed(self):
+        # The alarm list already redraws through the engine notifications
+        self.ticker.refresh('next_alarm')
+    
+    def api_timers_changed(self):
+        # The timer tab picks up timers started before it is built
+        if self.tab_built(self.timer_tab):
+            self.sync_timer_rows()
+            self.refresh_timers()
+    
+    def add_tab(self, text, builder):
+        tab = ttk.Frame(self.notebook)
+        self.notebook.add(tab, text=text)
+        self.tab_builders[str(tab)] = builder
+        return tab
+    
+    def build_tab(self, tab):
+        builder = self.tab_builders.pop(str(tab), None)
+        if builder is not None:
+            builder()
+    
+    def tab_built(self, tab):
+        return str(tab) not in self.tab_builders
     
     def set_theme(self):
         style = ttk.Style()
@@ -73,20 +207,16 @@ class AlarmClock:
         
         style.configure('Digital.TLabel', background='#2c3e50', foreground='#1abc9c', 
                         font=('Courier New', 36, 'bold'))
+        
+        # The virtualized lists work out how many rows fit from this height
+        style.configure('Treeview', rowheight=self.LIST_ROW_HEIGHT)
     
     def load_alarm_tones(self):
-        self.alarm_tones = [
-            {"name": "Classic Alarm", "func": self.play_classic_alarm},
-            {"name": "Beep Pattern", "func": self.play_beep_pattern},
-            {"name": "Chime", "func": self.play_chime},
-            {"name": "Melody", "func": self.play_melody},
-            {"name": "Siren", "func": self.play_siren}
-        ]
+        # Only WAV headers are read here; sounds are loaded when first played
+        self.audio.library.scan(reserved=self.audio.tones)
+        self.alarm_tones = [{"name": name} for name in self.audio.tone_names()]
     
     def create_clock_tab(self):
-        self.clock_tab = ttk.Frame(self.notebook)
-        self.notebook.add(self.clock_tab, text="Digital Clock")
-        
         # Main clock display
         self.clock_label = ttk.Label(self.clock_tab, font=('Courier New', 48, 'bold'), 
                                     background='#2c3e50', foreground='#1abc9c')
@@ -101,7 +231,11 @@ class AlarmClock:
         self.analog_canvas = tk.Canvas(self.clock_tab, width=300, height=300, 
                                       bg='#2c3e50', highlightthickness=0)
         self.analog_canvas.pack(pady=20)
-        self.draw_analog_clock()
+        self.build_analog_face()
+        self.add_tab_ticker('analog', self.draw_analog_clock, self.clock_tab)
+        
+        # Bring the hands up to date as soon as the tab is shown again
+        self.notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed, add='+')
         
         # Next alarm display
         ttk.Label(self.clock_tab, text="Next Alarm:", font=('Arial', 14), 
@@ -110,8 +244,8 @@ class AlarmClock:
                                         background='#2c3e50', foreground='#e74c3c')
         self.next_alarm_label.pack()
     
-    def draw_analog_clock(self):
-        self.analog_canvas.delete("all")
+    def build_analog_face(self):
+        # The face is static, so it is drawn once and only the hands move
         width = 300
         height = 300
         center_x = width // 2
@@ -142,43 +276,102 @@ class AlarmClock:
             y2 = center_y - outer_radius * math.cos(angle)
             self.analog_canvas.create_line(x1, y1, x2, y2, fill='#7f8c8d', width=1)
         
-        # Draw hands
-        now = datetime.datetime.now()
-        hour = now.hour % 12
-        minute = now.minute
-        second = now.second
-        
-        # Hour hand
-        hour_angle = math.radians((hour * 30) + (minute * 0.5))
-        hour_x = center_x + (radius * 0.5) * math.sin(hour_angle)
-        hour_y = center_y - (radius * 0.5) * math.cos(hour_angle)
-        self.analog_canvas.create_line(center_x, center_y, hour_x, hour_y, 
-                                      fill='#ecf0f1', width=4, tags="hour")
-        
-        # Minute hand
-        minute_angle = math.radians(minute * 6)
-        minute_x = center_x + (radius * 0.7) * math.sin(minute_angle)
-        minute_y = center_y - (radius * 0.7) * math.cos(minute_angle)
-        self.analog_canvas.create_line(center_x, center_y, minute_x, minute_y, 
-                                      fill='#3498db', width=3, tags="minute")
-        
-        # Second hand
-        second_angle = math.radians(second * 6)
-        second_x = center_x + (radius * 0.8) * math.sin(second_angle)
-        second_y = center_y - (radius * 0.8) * math.cos(second_angle)
-        self.analog_canvas.create_line(center_x, center_y, second_x, second_y, 
-                                      fill='#e74c3c', width=2, tags="second")
+        # Hands start at 12 and are moved in place with coords()
+        self.hour_hand = self.analog_canvas.create_line(center_x, center_y, center_x, center_y, 
+                                                       fill='#ecf0f1', width=4, tags="hour")
+        self.minute_hand = self.analog_canvas.create_line(center_x, center_y, center_x, center_y, 
+                                                         fill='#3498db', width=3, tags="minute")
+        self.second_hand = self.analog_canvas.create_line(center_x, center_y, center_x, center_y, 
+                                                         fill='#e74c3c', width=2, tags="second")
         
         # Center dot
         self.analog_canvas.create_oval(center_x-5, center_y-5, center_x+5, center_y+5, 
                                       fill='#e74c3c', outline='')
         
-        # Schedule next update
-        self.root.after(1000, self.draw_analog_clock)
+        # Lookup tables of hand end points: the hour hand moves in half-degree
+        # steps (720 positions), the minute and second hands in 6 degree steps
+        self.hour_hand_points = self.hand_points(center_x, center_y, radius * 0.5, 720)
+        self.minute_hand_points = self.hand_points(center_x, center_y, radius * 0.7, 60)
+        self.second_hand_points = self.hand_points(center_x, center_y, radius * 0.8, 60)
+        self.analog_hand_positions = (None, None, None)
+    
+    def hand_points(self, center_x, center_y, length, steps):
+        points = []
+        for i in range(steps):
+            angle = 2 * math.pi * i / steps
+            points.append((center_x, center_y, 
+                           center_x + length * math.sin(angle), 
+                           center_y - length * math.cos(angle)))
+        return points
+    
+    def draw_analog_clock(self):
+        self.update_analog_hands()
+        return self.ticker.ms_to_next_second()
+    
+    def update_analog_hands(self):
+        now = self.engine.clock.now()
+        positions = ((now.hour % 12) * 60 + now.minute, now.minute, now.second)
+        hour_pos, minute_pos, second_pos = positions
+        last_hour, last_minute, last_second = self.analog_hand_positions
+        
+        # Only move the hands whose position changed
+        if second_pos != last_second:
+            self.analog_canvas.coords(self.second_hand, *self.second_hand_points[second_pos])
+        if minute_pos != last_minute:
+            self.analog_canvas.coords(self.minute_hand, *self.minute_hand_points[minute_pos])
+        if hour_pos != last_hour:
+            self.analog_canvas.coords(self.hour_hand, *self.hour_hand_points[hour_pos])
+        
+        self.analog_hand_positions = positions
+    
+    def add_tab_ticker(self, name, callback, *tabs):
+        # Register a tick that only renders while one of `tabs` is selected.
+        # Hidden tabs go idle and are caught up when shown again.
+        tab_names = [str(tab) for tab in tabs]
+        for tab_name in tab_names:
+            self.tab_tickers.setdefault(tab_name, []).append(name)
+        
+        def tick():
+            if self.notebook.select() not in tab_names:
+                return None
+            return callback()
+        
+        self.ticker.add(name, tick)
+    
+    def on_tab_changed(self, event=None):
+        selected = self.notebook.select()
+        self.build_tab(selected)
+        
+        # Bring everything on the newly shown tab up to date in one pass
+        for name in self.tab_tickers.get(selected, ()):
+            self.ticker.refresh(name)
+        if selected == str(self.world_clock_tab):
+            self.get_timezone_index()
+    
+    def render(self, widget, **options):
+        # Configure only the options whose value differs from what was last
+        # rendered, skipping the Tcl round trip otherwise. Options drawn this
+        # way must not be configured directly elsewhere.
+        rendered = self.rendered
+        path = str(widget)
+        changed = {}
+        for option, value in options.items():
+            key = (path, option)
+            if rendered.get(key) != value:
+                rendered[key] = value
+                changed[option] = value
+        if changed:
+            widget.configure(**changed)
+    
+    def render_var(self, var, value):
+        key = (str(var), None)
+        if self.rendered.get(key) != value:
+            self.rendered[key] = value
+            var.set(value)
     
     def create_alarm_tab(self):
-        self.alarm_tab = ttk.Frame(self.notebook)
-        self.notebook.add(self.alarm_tab, text="Alarms")
+        # Load alarm tones
+        self.load_alarm_tones()
         
         # Alarm creation frame
         create_frame = ttk.Frame(self.alarm_tab, padding=10)
@@ -221,42 +414,88 @@ class AlarmClock:
                                  state="readonly", width=20)
         tone_combo.current(0)
         tone_combo.grid(row=3, column=1, columnspan=3, padx=5, sticky='w')
+        ttk.Button(create_frame, text="Preview", 
+                   command=self.preview_tone).grid(row=3, column=4, columnspan=2, padx=5, sticky='w')
         
         # Repeat options
         ttk.Label(create_frame, text="Repeat:").grid(row=4, column=0, padx=5, pady=10, sticky='e')
         self.repeat_vars = []
-        days = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
-        for i, day in enumerate(days):
+        for i, day in enumerate(DAY_NAMES):
             var = tk.BooleanVar()
             self.repeat_vars.append(var)
             cb = ttk.Checkbutton(create_frame, text=day, variable=var)
             cb.grid(row=4, column=i+1, padx=2)
         
-        # Add button
-        add_btn = ttk.Button(create_frame, text="Add Alarm", command=self.add_alarm)
-        add_btn.grid(row=5, column=0, columnspan=7, pady=15)
+        # Add button, which saves the alarm being edited in edit mode
+        self.add_btn = ttk.Button(create_frame, text="Add Alarm", command=self.add_alarm)
+        self.add_btn.grid(row=5, column=0, columnspan=7, pady=15)
+        self.cancel_edit_btn = ttk.Button(create_frame, text="Cancel", command=self.end_alarm_edit)
+        self.cancel_edit_btn.grid(row=5, column=7, pady=15)
+        self.cancel_edit_btn.grid_remove()
+        
+        # Alarm list filters
+        filter_frame = ttk.Frame(self.alarm_tab)
+        filter_frame.pack(fill='x', padx=10)
+        
+        ttk.Label(filter_frame, text="Show:").pack(side='left', padx=5)
+        self.alarm_time_filter_var = tk.StringVar(value="Any time")
+        self.alarm_repeat_filter_var = tk.StringVar(value="Any repeat")
+        self.alarm_status_filter_var = tk.StringVar(value="Any status")
+        for var, choices in ((self.alarm_time_filter_var, self.ALARM_TIME_FILTERS), 
+                             (self.alarm_repeat_filter_var, self.ALARM_REPEAT_FILTERS), 
+                             (self.alarm_status_filter_var, self.ALARM_STATUS_FILTERS)):
+            ttk.Combobox(filter_frame, textvariable=var, values=list(choices), 
+                         state="readonly", width=12).pack(side='left', padx=5)
+            var.trace_add('write', self.filter_alarm_list)
+        
+        ttk.Label(filter_frame, text="Label starts with:").pack(side='left', padx=5)
+        self.alarm_label_filter_var = tk.StringVar()
+        ttk.Entry(filter_frame, textvariable=self.alarm_label_filter_var, width=15).pack(side='left', padx=5)
+        self.alarm_label_filter_var.trace_add('write', self.filter_alarm_list)
         
         # Alarm list
         list_frame = ttk.Frame(self.alarm_tab)
         list_frame.pack(fill='both', expand=True, padx=10, pady=10)
         
-        # Create treeview with scrollbar
-        self.alarm_tree = ttk.Treeview(list_frame, columns=('time', 'label', 'repeat', 'active'), show='headings')
-        self.alarm_tree.heading('time', text='Time')
-        self.alarm_tree.heading('label', text='Label')
-        self.alarm_tree.heading('repeat', text='Repeat')
-        self.alarm_tree.heading('active', text='Status')
+        # The tree only ever holds the visible rows; the scrollbar moves a
+        # window over the sorted, filtered alarm index instead
+        self.alarm_tree = ttk.Treeview(list_frame, columns=('time', 'label', 'repeat', 'active'), 
+                                       show='headings', selectmode='extended')
+        for column, title in self.ALARM_COLUMN_TITLES.items():
+            self.alarm_tree.heading(column, text=title, 
+                                    command=lambda column=column: self.sort_alarm_list(column))
         self.alarm_tree.column('time', width=100, anchor='center')
         self.alarm_tree.column('label', width=150, anchor='center')
         self.alarm_tree.column('repeat', width=150, anchor='center')
         self.alarm_tree.column('active', width=80, anchor='center')
-        
-        vsb = ttk.Scrollbar(list_frame, orient="vertical", command=self.alarm_tree.yview)
-        self.alarm_tree.configure(yscrollcommand=vsb.set)
+        self.alarm_tree.bind('<Configure>', self.on_alarm_list_resize)
+        self.alarm_tree.bind('<MouseWheel>', self.on_alarm_list_wheel)
+        self.alarm_tree.bind('<Button-4>', self.on_alarm_list_wheel)
+        self.alarm_tree.bind('<Button-5>', self.on_alarm_list_wheel)
+        self.alarm_tree.bind('<ButtonPress-1>', self.on_alarm_list_click)
+        self.alarm_tree.bind('<<TreeviewSelect>>', self.on_alarm_select)
+        self.alarm_tree.bind('<Double-1>', lambda event: self.edit_alarm())
+        self.alarm_tree.bind('<Control-a>', lambda event: self.select_all_alarms())
+        
+        self.alarm_vsb = ttk.Scrollbar(list_frame, orient="vertical", command=self.on_alarm_scrollbar)
+        vsb = self.alarm_vsb
         
         self.alarm_tree.grid(row=0, column=0, sticky='nsew')
         vsb.grid(row=0, column=1, sticky='ns')
         
+        # Upcoming firings
+        agenda_frame = ttk.Frame(list_frame, padding=(10, 0, 0, 0))
+        agenda_frame.grid(row=0, column=2, sticky='nsew')
+        
+        ttk.Label(agenda_frame, text="Upcoming:", font=('Arial', 12, 'bold')).pack(anchor='w')
+        
+        self.agenda_tree = ttk.Treeview(agenda_frame, columns=('when', 'label'), show='headings')
+        self.agenda_tree.heading('when', text='When')
+        self.agenda_tree.heading('label', text='Label')
+        self.agenda_tree.column('when', width=170, anchor='center')
+        self.agenda_tree.column('label', width=120, anchor='center')
+        self.agenda_tree.pack(fill='both', expand=True)
+        
         # Configure grid weights
         list_frame.grid_rowconfigure(0, weight=1)
         list_frame.grid_columnconfigure(0, weight=1)
@@ -268,16 +507,34 @@ class AlarmClock:
         toggle_btn = ttk.Button(btn_frame, text="Toggle On/Off", command=self.toggle_alarm)
         toggle_btn.pack(side='left', padx=5)
         
+        edit_btn = ttk.Button(btn_frame, text="Edit Alarm", command=self.edit_alarm)
+        edit_btn.pack(side='left', padx=5)
+        
         delete_btn = ttk.Button(btn_frame, text="Delete Alarm", command=self.delete_alarm)
         delete_btn.pack(side='left', padx=5)
         
+        select_all_btn = ttk.Button(btn_frame, text="Select All", command=self.select_all_alarms)
+        select_all_btn.pack(side='left', padx=5)
+        
+        self.alarm_selection_label = ttk.Label(btn_frame, text="")
+        self.alarm_selection_label.pack(side='left', padx=5)
+        
         snooze_btn = ttk.Button(btn_frame, text="Snooze (5 min)", command=self.snooze_alarm)
         snooze_btn.pack(side='right', padx=5)
+        
+        export_btn = ttk.Button(btn_frame, text="Export...", command=self.export_alarms)
+        export_btn.pack(side='right', padx=5)
+        
+        self.import_btn = ttk.Button(btn_frame, text="Import...", command=self.import_alarms)
+        self.import_btn.pack(side='right', padx=5)
+        
+        self.alarm_import_label = ttk.Label(btn_frame, text="")
+        self.alarm_import_label.pack(side='right', padx=5)
+        
+        # Show the alarms loaded at startup
+        self.render_alarm_list()
     
     def create_stopwatch_tab(self):
-        self.stopwatch_tab = ttk.Frame(self.notebook)
-        self.notebook.add(self.stopwatch_tab, text="Stopwatch")
-        
         # Time display
         self.stopwatch_var = tk.StringVar(value="00:00:00.00")
         stopwatch_label = ttk.Label(self.stopwatch_tab, textvariable=self.stopwatch_var, 
@@ -303,6 +560,7 @@ class AlarmClock:
         lap_frame = ttk.Frame(self.stopwatch_tab)
         lap_frame.pack(fill='both', expand=True, padx=20, pady=10)
         
+        # Like the alarm list, the tree only holds the visible laps
         self.lap_tree = ttk.Treeview(lap_frame, columns=('number', 'time', 'lap_time'), show='headings')
         self.lap_tree.heading('number', text='Lap')
         self.lap_tree.heading('time', text='Total Time')
@@ -310,17 +568,32 @@ class AlarmClock:
         self.lap_tree.column('number', width=50, anchor='center')
         self.lap_tree.column('time', width=150, anchor='center')
         self.lap_tree.column('lap_time', width=150, anchor='center')
+        self.lap_tree.bind('<Configure>', self.on_lap_list_resize)
+        self.lap_tree.bind('<MouseWheel>', self.on_lap_list_wheel)
+        self.lap_tree.bind('<Button-4>', self.on_lap_list_wheel)
+        self.lap_tree.bind('<Button-5>', self.on_lap_list_wheel)
         
-        vsb = ttk.Scrollbar(lap_frame, orient="vertical", command=self.lap_tree.yview)
-        self.lap_tree.configure(yscrollcommand=vsb.set)
+        self.lap_vsb = ttk.Scrollbar(lap_frame, orient="vertical", command=self.on_lap_scrollbar)
         
         self.lap_tree.pack(side='left', fill='both', expand=True)
-        vsb.pack(side='right', fill='y')
+        self.lap_vsb.pack(side='right', fill='y')
+        
+        # Lap statistics and export
+        stats_frame = ttk.Frame(self.stopwatch_tab)
+        stats_frame.pack(fill='x', padx=20, pady=(0, 10))
+        
+        self.lap_stats_var = tk.StringVar()
+        ttk.Label(stats_frame, textvariable=self.lap_stats_var).pack(side='left')
+        
+        ttk.Button(stats_frame, text="Export JSON", 
+                   command=lambda: self.export_laps('json')).pack(side='right', padx=5)
+        ttk.Button(stats_frame, text="Export CSV", 
+                   command=lambda: self.export_laps('csv')).pack(side='right', padx=5)
+        
+        # Ticks at the display precision while running on screen
+        self.add_tab_ticker('stopwatch', self.update_stopwatch, self.stopwatch_tab)
     
     def create_timer_tab(self):
-        self.timer_tab = ttk.Frame(self.notebook)
-        self.notebook.add(self.timer_tab, text="Timer")
-        
         # Timer display
         self.timer_var = tk.StringVar(value="01:00:00")
         timer_label = ttk.Label(self.timer_tab, textvariable=self.timer_var, 
@@ -350,6 +623,11 @@ class AlarmClock:
                                   width=3, font=('Arial', 12))
         seconds_spin.grid(row=0, column=5, padx=5)
         
+        ttk.Label(time_frame, text="Name:").grid(row=1, column=0, padx=5, pady=10)
+        self.timer_name_var = tk.StringVar(value="Timer")
+        name_entry = ttk.Entry(time_frame, textvariable=self.timer_name_var, width=20)
+        name_entry.grid(row=1, column=1, columnspan=5, padx=5, pady=10, sticky='w')
+        
         # Button frame
         btn_frame = ttk.Frame(self.timer_tab)
         btn_frame.pack(pady=20)
@@ -368,11 +646,34 @@ class AlarmClock:
         self.timer_progress = ttk.Progressbar(self.timer_tab, orient='horizontal', 
                                             mode='determinate', length=400)
         self.timer_progress.pack(pady=20)
+        
+        # Running timers
+        list_frame = ttk.Frame(self.timer_tab)
+        list_frame.pack(fill='both', expand=True, padx=20, pady=10)
+        
+        self.timer_tree = ttk.Treeview(list_frame, columns=('name', 'remaining', 'status'), 
+                                      show='headings', selectmode='browse')
+        self.timer_tree.heading('name', text='Timer')
+        self.timer_tree.heading('remaining', text='Remaining')
+        self.timer_tree.heading('status', text='Status')
+        self.timer_tree.column('name', width=150, anchor='center')
+        self.timer_tree.column('remaining', width=150, anchor='center')
+        self.timer_tree.column('status', width=100, anchor='center')
+        self.timer_tree.bind('<<TreeviewSelect>>', self.on_timer_selected)
+        
+        vsb = ttk.Scrollbar(list_frame, orient="vertical", command=self.timer_tree.yview)
+        self.timer_tree.configure(yscrollcommand=vsb.set)
+        
+        self.timer_tree.pack(side='left', fill='both', expand=True)
+        vsb.pack(side='right', fill='y')
+        
+        # Timers started before the tab was first shown
+        self.sync_timer_rows()
+        
+        # Ticks once per displayed second while a timer counts down on screen
+        self.add_tab_ticker('timers', self.update_timers, self.timer_tab)
     
     def create_world_clock_tab(self):
-        self.world_clock_tab = ttk.Frame(self.notebook)
-        self.notebook.add(self.world_clock_tab, text="World Clock")
-        
         # Timezone selection
         top_frame = ttk.Frame(self.world_clock_tab)
         top_frame.pack(fill='x', padx=10, pady=10)
@@ -380,10 +681,14 @@ class AlarmClock:
         ttk.Label(top_frame, text="Add Timezone:").pack(side='left', padx=(0, 10))
         
         self.tz_var = tk.StringVar()
-        self.tz_combo = ttk.Combobox(top_frame, textvariable=self.tz_var, width=30)
-        self.tz_combo['values'] = pytz.all_timezones
+        self.tz_combo = ttk.Combobox(top_frame, textvariable=self.tz_var, width=30, 
+                                    postcommand=self.filter_timezones)
+        self.tz_combo.bind('<KeyRelease>', self.filter_timezones)
         self.tz_combo.pack(side='left', padx=(0, 10))
         
+        # The search index is built the first time the tab is opened
+        self.tz_index = None
+        
         add_btn = ttk.Button(top_frame, text="Add", command=self.add_timezone)
         add_btn.pack(side='left')
         
@@ -392,20 +697,36 @@ class AlarmClock:
         self.clocks_frame.pack(fill='both', expand=True, padx=10, pady=10)
         
         # Add some default timezones
-        default_timezones = ['America/New_York', 'Europe/London', 'Asia/Tokyo', 'Australia/Sydney']
-        for tz in default_timezones:
+        zones = self.store.load_world_clocks()
+        if not zones and 'world_clocks_seeded' not in self.store.load_settings():
+            zones = self.DEFAULT_TIMEZONES
+            for tz in zones:
+                self.store.add_world_clock(tz)
+            self.store.save_settings({'world_clocks_seeded': 1})
+        for tz in zones:
             self.add_clock_display(tz)
         
         # Start world clock updates
-        self.update_world_clocks()
+        self.add_tab_ticker('world', self.update_world_clocks, self.world_clock_tab)
+    
+    def create_settings_vars(self):
+        # Settings are needed before their tab is built, so the variables
+        # are created up front
+        self.volume_var = tk.IntVar(value=50)
+        self.snooze_var = tk.IntVar(value=5)
+        self.alarm_duration_var = tk.IntVar(value=60)
+        self.grace_var = tk.IntVar(value=self.engine.grace_minutes)
+        self.agenda_size_var = tk.IntVar(value=self.engine.agenda.limit)
+        self.agenda_days_var = tk.IntVar(value=self.engine.agenda.horizon.days)
+        self.agenda_size_var.trace_add('write', self.configure_agenda)
+        self.agenda_days_var.trace_add('write', self.configure_agenda)
+        self.stopwatch_digits_var = tk.IntVar(value=self.stopwatch_digits)
+        self.stopwatch_digits_var.trace_add('write', self.configure_stopwatch)
+        self.theme_var = tk.StringVar(value="Dark")
     
     def create_settings_tab(self):
-        self.settings_tab = ttk.Frame(self.notebook)
-        self.notebook.add(self.settings_tab, text="Settings")
-        
         ttk.Label(self.settings_tab, text="Alarm Volume:", font=('Arial', 12)).pack(pady=(20, 5))
         
-        self.volume_var = tk.IntVar(value=50)
         volume_scale = ttk.Scale(self.settings_tab, from_=0, to=100, 
                                 variable=self.volume_var, orient='horizontal')
         volume_scale.pack(fill='x', padx=50, pady=5)
@@ -413,7 +734,6 @@ class AlarmClock:
         ttk.Label(self.settings_tab, text="Snooze Duration (minutes):", 
                  font=('Arial', 12)).pack(pady=(20, 5))
         
-        self.snooze_var = tk.IntVar(value=5)
         snooze_spin = ttk.Spinbox(self.settings_tab, from_=1, to=30, 
                                  textvariable=self.snooze_var, width=5)
         snooze_spin.pack(pady=5)
@@ -421,15 +741,48 @@ class AlarmClock:
         ttk.Label(self.settings_tab, text="Alarm Duration (seconds):", 
                  font=('Arial', 12)).pack(pady=(20, 5))
         
-        self.alarm_duration_var = tk.IntVar(value=60)
         duration_spin = ttk.Spinbox(self.settings_tab, from_=10, to=300, 
                                    textvariable=self.alarm_duration_var, width=5)
         duration_spin.pack(pady=5)
         
+        ttk.Label(self.settings_tab, text="Ring Missed Alarms Up To (minutes late):", 
+                 font=('Arial', 12)).pack(pady=(20, 5))
+        
+        grace_frame = ttk.Frame(self.settings_tab)
+        grace_frame.pack(pady=5)
+        
+        grace_spin = ttk.Spinbox(grace_frame, from_=0, to=1440, 
+                                textvariable=self.grace_var, width=5)
+        grace_spin.pack(side='left', padx=5)
+        
+        history_btn = ttk.Button(grace_frame, text="Alarm History...", 
+                                command=self.show_alarm_history)
+        history_btn.pack(side='left', padx=5)
+        
+        ttk.Label(self.settings_tab, text="Upcoming Alarms (count / days ahead):", 
+                 font=('Arial', 12)).pack(pady=(20, 5))
+        
+        agenda_frame = ttk.Frame(self.settings_tab)
+        agenda_frame.pack(pady=5)
+        
+        size_spin = ttk.Spinbox(agenda_frame, from_=1, to=200, 
+                               textvariable=self.agenda_size_var, width=5)
+        size_spin.pack(side='left', padx=5)
+        
+        days_spin = ttk.Spinbox(agenda_frame, from_=1, to=366, 
+                               textvariable=self.agenda_days_var, width=5)
+        days_spin.pack(side='left', padx=5)
+        
+        ttk.Label(self.settings_tab, text="Stopwatch Decimal Places:", 
+                 font=('Arial', 12)).pack(pady=(20, 5))
+        
+        digits_spin = ttk.Spinbox(self.settings_tab, from_=0, to=3, 
+                                 textvariable=self.stopwatch_digits_var, width=5)
+        digits_spin.pack(pady=5)
+        
         # Theme selection
         ttk.Label(self.settings_tab, text="Theme:", font=('Arial', 12)).pack(pady=(20, 5))
         
-        self.theme_var = tk.StringVar(value="Dark")
         theme_frame = ttk.Frame(self.settings_tab)
         theme_frame.pack(pady=5)
         
@@ -444,60 +797,49 @@ class AlarmClock:
         save_btn.pack(pady=20)
     
     def update_time(self):
-        now = datetime.datetime.now()
+        now = self.engine.clock.now()
         current_time = now.strftime("%I:%M:%S %p")
         current_date = now.strftime("%A, %B %d, %Y")
         
-        self.clock_label.configure(text=current_time)
-        self.date_label.configure(text=current_date)
-        
-        # Update next alarm
-        self.update_next_alarm()
-        
-        # Check alarms
-        self.check_alarms()
-        
-        # Schedule next update
-        self.root.after(1000, self.update_time)
+        self.render(self.clock_label, text=current_time)
+        self.render(self.date_label, text=current_date)
+        return self.ticker.ms_to_next_second()
     
     def update_next_alarm(self):
-        if not self.alarms:
-            self.next_alarm_label.configure(text="No alarms set")
-            return
-        
-        next_alarm = None
-        now = datetime.datetime.now()
-        
-        for alarm in self.alarms:
-            if not alarm['active']:
-                continue
-                
-            # Create alarm time for today
-            alarm_time = datetime.datetime(now.year, now.month, now.day, 
-                                          alarm['hour'], alarm['minute'])
-            
-            # Convert to 24h format if needed
-            if alarm['ampm'] == "PM" and alarm['hour'] != 12:
-                alarm_time += datetime.timedelta(hours=12)
-            elif alarm['ampm'] == "AM" and alarm['hour'] == 12:
-                alarm_time = alarm_time.replace(hour=0)
-            
-            # If alarm time is earlier than now, set for tomorrow
-            if alarm_time < now:
-                alarm_time += datetime.timedelta(days=1)
-            
-            # Check if this is the earliest alarm
-            if next_alarm is None or alarm_time < next_alarm['time']:
-                next_alarm = {
-                    'time': alarm_time,
-                    'label': alarm['label']
-                }
-        
-        if next_alarm:
-            alarm_text = next_alarm['time'].strftime("%I:%M %p") + " - " + next_alarm['label']
-            self.next_alarm_label.configure(text=alarm_text)
+        now = self.engine.clock.now()
+        upcoming = self.engine.upcoming(now)
+        
+        # Refresh the upcoming list only when the agenda changed and the
+        # Alarms tab is showing it
+        if (self.engine.agenda.version != self.agenda_version and 
+                self.notebook.select() == str(self.alarm_tab)):
+            self.agenda_version = self.engine.agenda.version
+            self.agenda_tree.delete(*self.agenda_tree.get_children())
+            for when, alarm in upcoming:
+                self.agenda_tree.insert('', 'end', values=(when.strftime("%a %d %b  %I:%M %p"), 
+                                                           alarm.label))
+        
+        if not self.engine.alarms:
+            alarm_text = "No alarms set"
+        elif upcoming:
+            when, alarm = upcoming[0]
+            alarm_text = when.strftime("%I:%M %p") + " - " + alarm.label
+            if when.date() != now.date():
+                alarm_text = when.strftime("%a ") + alarm_text
         else:
-            self.next_alarm_label.configure(text="No active alarms")
+            alarm_text = "No active alarms"
+        self.render(self.next_alarm_label, text=alarm_text)
+        
+        return self.ticker.ms_to_next_second()
+    
+    def configure_agenda(self, *args):
+        try:
+            limit = max(1, self.agenda_size_var.get())
+            days = max(1, self.agenda_days_var.get())
+        except tk.TclError:
+            # Ignore partially typed values
+            return
+        self.engine.agenda.configure(limit, datetime.timedelta(days=days))
     
     def add_alarm(self):
         try:
@@ -507,41 +849,19 @@ class AlarmClock:
             label = self.alarm_label_var.get()
             tone = self.tone_var.get()
             
-            # Validate time
-            if hour < 1 or hour > 12:
-                messagebox.showerror("Invalid Time", "Hour must be between 1 and 12")
-                return
-            if minute < 0 or minute > 59:
-                messagebox.showerror("Invalid Time", "Minute must be between 0 and 59")
-                return
-            
             # Get repeat days
-            repeat_days = []
-            days = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
-            for i, var in enumerate(self.repeat_vars):
-                if var.get():
-                    repeat_days.append(days[i])
-            
-            # Create alarm dictionary
-            alarm = {
-                'hour': hour,
-                'minute': minute,
-                'ampm': ampm,
-                'label': label,
-                'tone': tone,
-                'repeat': repeat_days,
-                'active': True
-            }
-            
-            # Add to alarms list
-            self.alarms.append(alarm)
+            repeat_days = [day for day, var in zip(DAY_NAMES, self.repeat_vars) if var.get()]
             
-            # Add to treeview
-            time_str = f"{hour:02d}:{minute:02d} {ampm}"
-            repeat_str = ", ".join(repeat_days) if repeat_days else "Once"
-            status_str = "Active" if alarm['active'] else "Inactive"
+            if self.editing_alarm is not None:
+                alarm = self.editing_alarm
+                self.engine.edit_alarm(alarm, hour=hour, minute=minute, ampm=ampm, label=label, 
+                                       tone=tone, repeat=repeat_days)
+                self.end_alarm_edit()
+                self.show_alarm(alarm)
+                return
             
-            self.alarm_tree.insert('', 'end', values=(time_str, label, repeat_str, status_str))
+            alarm = self.engine.add_alarm(hour, minute, ampm, label, tone, repeat_days)
+            self.show_alarm(alarm)
             
             # Clear fields
             self.hour_var.set("12")
@@ -549,131 +869,289 @@ class AlarmClock:
             self.ampm_var.set("AM")
             self.alarm_label_var.set("Alarm")
             
+        except InvalidAlarmError as e:
+            messagebox.showerror("Invalid Time", str(e))
         except ValueError:
             messagebox.showerror("Invalid Input", "Please enter valid numbers for time")
     
+    def alarm_row_values(self, alarm):
+        repeat_str = ", ".join(alarm.repeat) or "Once"
+        status_str = "Active" if alarm.active else "Inactive"
+        return (format_alarm_time(alarm), alarm.label, repeat_str, status_str)
+    
+    def schedule_alarm_list(self):
+        # Coalesce changes into one redraw when Tk is next idle
+        if self.alarm_list_after_id is None:
+            self.alarm_list_after_id = self.root.after_idle(self.render_alarm_list)
+    
+    def render_alarm_list(self):
+        self.alarm_list_after_id = None
+        if not self.tab_built(self.alarm_tab):
+            return
+        index = self.engine.index
+        total = len(index)
+        rows = self.alarm_list_rows
+        self.alarm_list_top = max(0, min(self.alarm_list_top, total - rows))
+        top = self.alarm_list_top
+        alarms = index.page(top, rows)
+        
+        # Rows keep their alarm's ID as iid, so a selection follows the alarm
+        # while it stays on screen
+        wanted = {str(alarm.id): alarm for alarm in alarms}
+        stale = [iid for iid in self.alarm_rows if iid not in wanted]
+        if stale:
+            self.alarm_tree.delete(*stale)
+        for position, (iid, alarm) in enumerate(wanted.items()):
+            values = self.alarm_row_values(alarm)
+            if iid in self.alarm_rows:
+                self.alarm_tree.item(iid, values=values)
+                self.alarm_tree.move(iid, '', position)
+            else:
+                self.alarm_tree.insert('', position, iid=iid, values=values)
+        self.alarm_rows = wanted
+        self.alarm_tree.selection_set([iid for iid in wanted if int(iid) in self.selected_alarm_ids])
+        count = len(self.selected_alarm_ids)
+        self.alarm_selection_label.configure(text=f"{count} selected" if count > 1 else "")
+        
+        if total:
+            self.alarm_vsb.set(top / total, min(top + rows, total) / total)
+        else:
+            self.alarm_vsb.set(0, 1)
+    
+    def scroll_alarm_list(self, top):
+        self.alarm_list_top = int(top)
+        self.render_alarm_list()
+    
+    def show_alarm(self, alarm):
+        # Scroll the list so `alarm` is on screen, if the filters let it be
+        position = self.engine.index.position(alarm)
+        if position is None:
+            return
+        if not self.alarm_list_top <= position < self.alarm_list_top + self.alarm_list_rows:
+            self.alarm_list_top = position - self.alarm_list_rows // 2
+        self.selected_alarm_ids = {alarm.id}
+        self.render_alarm_list()
+    
+    # Virtualized list helpers: translate scrollbar, wheel and resize events
+    # into a first row and a row count
+    
+    def scrollbar_top(self, top, rows, total, action, amount, unit=None):
+        if action == 'moveto':
+            return float(amount) * total
+        if unit == 'pages':
+            return top + int(amount) * (rows - 1)
+        return top + int(amount)
+    
+    def wheel_rows(self, event):
+        return -self.LIST_WHEEL_ROWS if event.num == 4 or event.delta > 0 else self.LIST_WHEEL_ROWS
+    
+    def rows_that_fit(self, event):
+        return max(1, (event.height - self.LIST_HEADING_HEIGHT) // self.LIST_ROW_HEIGHT)
+    
+    def on_alarm_scrollbar(self, *args):
+        self.scroll_alarm_list(self.scrollbar_top(self.alarm_list_top, self.alarm_list_rows, 
+                                                  len(self.engine.index), *args))
+    
+    def on_alarm_list_wheel(self, event):
+        self.scroll_alarm_list(self.alarm_list_top + self.wheel_rows(event))
+        return "break"
+    
+    def on_alarm_list_resize(self, event):
+        rows = self.rows_that_fit(event)
+        if rows != self.alarm_list_rows:
+            self.alarm_list_rows = rows
+            self.render_alarm_list()
+    
+    def sort_alarm_list(self, column):
+        # Clicking the sorted column again reverses it
+        index = self.engine.index
+        field = self.ALARM_SORT_COLUMNS[column]
+        descending = field == index.sort_field and not index.descending
+        index.set_sort(field, descending)
+        for name, title in self.ALARM_COLUMN_TITLES.items():
+            if name == column:
+                title += " \u25bc" if descending else " \u25b2"
+            self.alarm_tree.heading(name, text=title)
+        self.alarm_list_top = 0
+        self.render_alarm_list()
+    
+    def filter_alarm_list(self, *args):
+        self.engine.index.set_filters(
+            time=self.ALARM_TIME_FILTERS.get(self.alarm_time_filter_var.get()), 
+            repeat=self.ALARM_REPEAT_FILTERS.get(self.alarm_repeat_filter_var.get()), 
+            status=self.ALARM_STATUS_FILTERS.get(self.alarm_status_filter_var.get()), 
+            label=self.alarm_label_filter_var.get().strip())
+        self.alarm_list_top = 0
+        self.render_alarm_list()
+    
+    def on_alarm_list_click(self, event):
+        # A plain click starts a new selection; Ctrl and Shift extend it
+        if not event.state & 0x0005:
+            self.selected_alarm_ids.clear()
+    
+    def on_alarm_select(self, event=None):
+        # Merge the visible rows' selection into the full selection
+        visible = {int(iid) for iid in self.alarm_rows}
+        selected = {int(iid) for iid in self.alarm_tree.selection()}
+        self.selected_alarm_ids = (self.selected_alarm_ids - visible) | selected
+        count = len(self.selected_alarm_ids)
+        self.alarm_selection_label.configure(text=f"{count} selected" if count > 1 else "")
+    
+    def select_all_alarms(self):
+        # Everything the current filters show, on screen or not
+        self.selected_alarm_ids = {alarm_id for _, alarm_id in self.engine.index.view}
+        self.render_alarm_list()
+        return "break"
+    
+    def selected_alarms(self):
+        alarms = self.engine.alarms
+        return [alarms[alarm_id] for alarm_id in self.selected_alarm_ids if alarm_id in alarms]
+    
+    def import_alarms(self):
+        if self.alarm_import is not None:
+            return
+        path = filedialog.askopenfilename(filetypes=[("Alarm files", "*.csv *.ics"), 
+                                                     ("CSV files", "*.csv"), 
+                                                     ("iCalendar files", "*.ics")])
+        if not path:
+            return
+        try:
+            from clock_io import AlarmImporter
+            self.alarm_import = AlarmImporter.open(self.engine, path)
+        except OSError as e:
+            messagebox.showerror("Import Failed", str(e))
+            return
+        self.import_btn.configure(state=tk.DISABLED)
+        self.continue_import()
+    
+    def continue_import(self):
+        # One batch per idle callback, so the window stays responsive and the
+        # list redraws once per batch. csv is already loaded by clock_io.
+        import csv
+        importer = self.alarm_import
+        try:
+            importer.step()
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            importer.close()
+            self.end_import()
+            messagebox.showerror("Import Failed", 
+                                 f"{e}\n\n{importer.imported} alarms were imported before the error")
+            return
+        if not importer.done:
+            self.alarm_import_label.configure(text=f"Importing... {importer.imported}")
+            self.root.after_idle(self.continue_import)
+            return
+        
+        self.end_import()
+        messagebox.showinfo("Import Alarms", importer.summary())
+    
+    def end_import(self):
+        self.alarm_import = None
+        self.alarm_import_label.configure(text="")
+        self.import_btn.configure(state=tk.NORMAL)
+        self.ticker.refresh('next_alarm')
+    
+    def export_alarms(self):
+        if not self.engine.alarms:
+            messagebox.showinfo("Export Alarms", "There are no alarms to export")
+            return
+        path = filedialog.asksaveasfilename(defaultextension=".csv", 
+                                            filetypes=[("CSV files", "*.csv"), 
+                                                       ("iCalendar files", "*.ics")])
+        if not path:
+            return
+        try:
+            import clock_io
+            clock_io.export_alarms(path, self.engine.alarms.values(), self.engine.clock.now())
+        except OSError as e:
+            messagebox.showerror("Export Failed", str(e))
+    
+    def edit_alarm(self):
+        # Load the selected alarm into the form; Add Alarm then saves it
+        alarms = self.selected_alarms()
+        if len(alarms) != 1:
+            return
+        alarm = self.editing_alarm = alarms[0]
+        self.hour_var.set(str(alarm.hour))
+        self.minute_var.set(f"{alarm.minute:02d}")
+        self.ampm_var.set(alarm.ampm)
+        self.alarm_label_var.set(alarm.label)
+        self.tone_var.set(alarm.tone)
+        for i, var in enumerate(self.repeat_vars):
+            var.set(bool(alarm.repeat_mask >> i & 1))
+        self.add_btn.configure(text="Save Changes")
+        self.cancel_edit_btn.grid()
+    
+    def end_alarm_edit(self):
+        self.editing_alarm = None
+        self.add_btn.configure(text="Add Alarm")
+        self.cancel_edit_btn.grid_remove()
+        self.hour_var.set("12")
+        self.minute_var.set("00")
+        self.ampm_var.set("AM")
+        self.alarm_label_var.set("Alarm")
+        for var in self.repeat_vars:
+            var.set(False)
+    
+    def preview_tone(self):
+        self.audio.play_once(self.tone_var.get(), self.volume_var.get())
+    
     def toggle_alarm(self):
-        selected = self.alarm_tree.selection()
-        if not selected:
+        alarms = self.selected_alarms()
+        if not alarms:
             return
-            
-        # Get selected alarm index
-        index = self.alarm_tree.index(selected[0])
         
         # Toggle active status
-        self.alarms[index]['active'] = not self.alarms[index]['active']
-        
-        # Update treeview
-        time_str = self.alarm_tree.item(selected[0], 'values')[0]
-        label = self.alarm_tree.item(selected[0], 'values')[1]
-        repeat = self.alarm_tree.item(selected[0], 'values')[2]
-        status = "Active" if self.alarms[index]['active'] else "Inactive"
-        
-        self.alarm_tree.item(selected[0], values=(time_str, label, repeat, status))
+        self.engine.toggle_many(alarms)
         
         # Update next alarm display
-        self.update_next_alarm()
+        self.ticker.refresh('next_alarm')
     
     def delete_alarm(self):
-        selected = self.alarm_tree.selection()
-        if not selected:
+        alarms = self.selected_alarms()
+        if not alarms:
+            return
+        if len(alarms) > 1 and not messagebox.askyesno(
+                "Delete Alarms", f"Delete {len(alarms)} selected alarms?"):
             return
-            
-        # Get selected alarm index
-        index = self.alarm_tree.index(selected[0])
         
         # Remove from alarms list
-        del self.alarms[index]
-        
-        # Remove from treeview
-        self.alarm_tree.delete(selected[0])
+        self.engine.delete_many(alarms)
+        self.selected_alarm_ids.clear()
         
         # Update next alarm display
-        self.update_next_alarm()
+        self.ticker.refresh('next_alarm')
     
     def snooze_alarm(self):
-        if not self.alarm_sounding:
-            return
-            
-        # Stop current alarm
-        self.alarm_sounding = False
-        self.alarm_window.destroy()
-        
-        # Calculate snooze time
-        snooze_minutes = self.snooze_var.get()
-        now = datetime.datetime.now()
-        snooze_time = now + datetime.timedelta(minutes=snooze_minutes)
-        
-        # Create snooze alarm
-        hour = snooze_time.hour
-        minute = snooze_time.minute
-        ampm = "AM" if hour < 12 else "PM"
-        
-        if hour > 12:
-            hour -= 12
-        elif hour == 0:
-            hour = 12
-            
-        alarm = {
-            'hour': hour,
-            'minute': minute,
-            'ampm': ampm,
-            'label': "Snooze",
-            'tone': "Classic Alarm",
-            'repeat': [],
-            'active': True
-        }
-        
-        # Add to alarms list
-        self.alarms.append(alarm)
-        
-        # Add to treeview
-        time_str = f"{hour:02d}:{minute:02d} {ampm}"
-        self.alarm_tree.insert('', 'end', values=(time_str, "Snooze", "Once", "Active"))
-        
-        # Update next alarm display
-        self.update_next_alarm()
+        if self.engine.snooze() is not None:
+            # Update next alarm display
+            self.ticker.refresh('next_alarm')
     
-    def check_alarms(self):
-        if self.alarm_sounding:
-            return
-            
-        now = datetime.datetime.now()
-        current_weekday = now.strftime("%a")
-        
-        for alarm in self.alarms:
-            if not alarm['active']:
-                continue
-                
-            # Check if alarm repeats today or is set for today
-            if alarm['repeat']:
-                if current_weekday not in alarm['repeat']:
-                    continue
-            else:
-                # Check if alarm time matches now (within 5 seconds)
-                alarm_time = datetime.datetime(now.year, now.month, now.day, 
-                                              alarm['hour'], alarm['minute'])
-                
-                # Convert to 24h format
-                if alarm['ampm'] == "PM" and alarm['hour'] != 12:
-                    alarm_time = alarm_time.replace(hour=alarm_time.hour + 12)
-                elif alarm['ampm'] == "AM" and alarm['hour'] == 12:
-                    alarm_time = alarm_time.replace(hour=0)
-                
-                time_diff = (now - alarm_time).total_seconds()
-                if 0 <= time_diff < 5:  # Within 5 seconds of alarm time
-                    self.trigger_alarm(alarm)
+    def dismiss_alarm(self):
+        self.engine.dismiss()
     
-    def trigger_alarm(self, alarm):
-        self.alarm_sounding = True
-        self.current_alarm = alarm
-        
-        # Create alarm window
-        self.alarm_window = tk.Toplevel(self.root)
-        self.alarm_window.title("ALARM!")
-        self.alarm_window.geometry("400x300")
-        self.alarm_window.configure(bg='#e74c3c')
-        self.alarm_window.attributes('-topmost', True)
+    # Engine notifications
+    
+    def alarm_added(self, alarm):
+        self.schedule_alarm_list()
+    
+    def alarms_added(self, alarms):
+        self.schedule_alarm_list()
+    
+    def alarm_changed(self, alarm):
+        self.schedule_alarm_list()
+    
+    def alarm_removed(self, alarm):
+        self.selected_alarm_ids.discard(alarm.id)
+        if alarm is self.editing_alarm:
+            self.end_alarm_edit()
+        self.schedule_alarm_list()
+    
+    def alarm_fired(self, alarm):
+        if self.alarm_window is None:
+            self.create_alarm_window()
+        self.alarm_window_time_var.set(format_alarm_time(alarm))
+        self.alarm_window_label_var.set(alarm.label)
         
         # Center window
         window_width = 400
@@ -683,16 +1161,29 @@ class AlarmClock:
         x = (screen_width // 2) - (window_width // 2)
         y = (screen_height // 2) - (window_height // 2)
         self.alarm_window.geometry(f"{window_width}x{window_height}+{x}+{y}")
+        self.alarm_window.deiconify()
+        self.alarm_window.lift()
+    
+    def create_alarm_window(self):
+        # Hidden between alarms rather than destroyed, so a week of alarms
+        # does not leave a trail of Tk windows and variables behind
+        self.alarm_window = tk.Toplevel(self.root)
+        self.alarm_window.withdraw()
+        self.alarm_window.title("ALARM!")
+        self.alarm_window.configure(bg='#e74c3c')
+        self.alarm_window.attributes('-topmost', True)
+        self.alarm_window.protocol("WM_DELETE_WINDOW", self.dismiss_alarm)
+        self.alarm_window_time_var = tk.StringVar()
+        self.alarm_window_label_var = tk.StringVar()
         
         # Alarm content
-        alarm_time = f"{alarm['hour']:02d}:{alarm['minute']:02d} {alarm['ampm']}"
         ttk.Label(self.alarm_window, text="ALARM!", font=('Arial', 36, 'bold'), 
                  background='#e74c3c', foreground='white').pack(pady=30)
         
-        ttk.Label(self.alarm_window, text=alarm_time, font=('Arial', 24), 
+        ttk.Label(self.alarm_window, textvariable=self.alarm_window_time_var, font=('Arial', 24), 
                  background='#e74c3c', foreground='white').pack()
         
-        ttk.Label(self.alarm_window, text=alarm['label'], font=('Arial', 18), 
+        ttk.Label(self.alarm_window, textvariable=self.alarm_window_label_var, font=('Arial', 18), 
                  background='#e74c3c', foreground='white').pack(pady=10)
         
         # Buttons
@@ -704,129 +1195,167 @@ class AlarmClock:
         
         dismiss_btn = ttk.Button(btn_frame, text="Dismiss", command=self.dismiss_alarm)
         dismiss_btn.pack(side='left', padx=20)
-        
-        # Play alarm tone in a separate thread
-        threading.Thread(target=self.play_alarm_tone, daemon=True).start()
     
-    def dismiss_alarm(self):
-        self.alarm_sounding = False
-        self.alarm_window.destroy()
-    
-    def play_alarm_tone(self):
-        # Find the selected tone
-        tone_name = self.current_alarm['tone']
-        for tone in self.alarm_tones:
-            if tone['name'] == tone_name:
-                tone_func = tone['func']
-                break
-        else:
-            tone_func = self.play_classic_alarm
-        
-        # Play for the specified duration
-        duration = self.alarm_duration_var.get()
-        start_time = time.time()
-        
-        while self.alarm_sounding and (time.time() - start_time) < duration:
-            tone_func()
-            time.sleep(0.5)
-    
-    def play_classic_alarm(self):
-        volume = self.volume_var.get() / 100
-        winsound.Beep(int(800 * volume), 500)
-    
-    def play_beep_pattern(self):
-        volume = self.volume_var.get() / 100
-        for freq in [600, 800, 1000]:
-            winsound.Beep(int(freq * volume), 200)
-            time.sleep(0.1)
-    
-    def play_chime(self):
-        volume = self.volume_var.get() / 100
-        for _ in range(3):
-            winsound.Beep(int(880 * volume), 300)
-            time.sleep(0.2)
-    
-    def play_melody(self):
-        volume = self.volume_var.get() / 100
-        notes = [659, 587, 523, 587, 659, 659, 659]
-        durations = [0.3, 0.3, 0.3, 0.3, 0.3, 0.3, 0.6]
-        
-        for freq, dur in zip(notes, durations):
-            winsound.Beep(int(freq * volume), int(dur * 1000))
-            time.sleep(0.05)
-    
-    def play_siren(self):
-        volume = self.volume_var.get() / 100
-        for freq in range(800, 1200, 20):
-            winsound.Beep(int(freq * volume), 50)
-        for freq in range(1200, 800, -20):
-            winsound.Beep(int(freq * volume), 50)
+    def alarm_missed(self, alarm, due):
+        # Alarms missed together, e.g. while the computer was asleep, are
+        # listed in one message
+        if not self.missed_alarms:
+            self.root.after_idle(self.show_missed_alarms)
+        self.missed_alarms.append((alarm, due))
+    
+    def show_missed_alarms(self):
+        lines = [f"{due:%a %H:%M}  {format_alarm_time(alarm)}  {alarm.label}" 
+                 for alarm, due in self.missed_alarms[:20]]
+        if len(self.missed_alarms) > 20:
+            lines.append(f"... and {len(self.missed_alarms) - 20} more")
+        self.missed_alarms = []
+        messagebox.showwarning("Missed Alarms", "These alarms could not ring within the "
+                               "grace period and were skipped:\n\n" + "\n".join(lines))
+    
+    def show_alarm_history(self):
+        messagebox.showinfo("Alarm History", self.engine.lateness_report())
+    
+    def alarm_stopped(self, alarm):
+        self.alarm_window.withdraw()
     
     def start_stopwatch(self):
-        if not self.stopwatch_running:
-            self.stopwatch_running = True
-            self.stopwatch_start_time = time.time() - self.stopwatch_elapsed
+        if not self.stopwatch.running:
+            self.stopwatch.start()
             self.start_btn.configure(text="Stop")
             self.lap_btn.configure(state=tk.NORMAL)
-            self.update_stopwatch()
         else:
-            self.stopwatch_running = False
-            self.stopwatch_elapsed = time.time() - self.stopwatch_start_time
+            self.stopwatch.stop()
             self.start_btn.configure(text="Start")
             self.lap_btn.configure(state=tk.DISABLED)
+        self.refresh_stopwatch()
+    
+    def refresh_stopwatch(self):
+        # Render now and restart the refresh loop
+        self.ticker.refresh('stopwatch')
     
     def update_stopwatch(self):
-        if self.stopwatch_running:
-            elapsed = time.time() - self.stopwatch_start_time
-            hours = int(elapsed // 3600)
-            minutes = int((elapsed % 3600) // 60)
-            seconds = int(elapsed % 60)
-            centiseconds = int((elapsed - int(elapsed)) * 100)
-            
-            time_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}.{centiseconds:02d}"
-            self.stopwatch_var.set(time_str)
-            self.root.after(10, self.update_stopwatch)
+        elapsed = self.stopwatch.elapsed_ns()
+        self.render_var(self.stopwatch_var, format_duration_ns(elapsed, self.stopwatch_digits))
+        
+        # Keep refreshing only while running; the next refresh lands when
+        # the last displayed digit changes, at most once a frame
+        if self.stopwatch.running:
+            unit = 10 ** (9 - self.stopwatch_digits)
+            delay_ms = -(-(unit - elapsed % unit) // 1000000)
+            return max(delay_ms, self.STOPWATCH_FRAME_MS)
+        return None
+    
+    def configure_stopwatch(self, *args):
+        try:
+            self.stopwatch_digits = min(max(self.stopwatch_digits_var.get(), 0), 3)
+        except tk.TclError:
+            # Ignore partially typed values
+            return
+        # A stopwatch tab that is not built yet picks the digits up when it is
+        if self.tab_built(self.stopwatch_tab):
+            self.refresh_stopwatch()
+            self.render_lap_list()
     
     def record_lap(self):
-        if not self.stopwatch_running:
+        if not self.stopwatch.running:
             return
-            
-        elapsed = time.time() - self.stopwatch_start_time
-        lap_time = elapsed - self.lap_times[-1] if self.lap_times else elapsed
-        
-        # Format lap time
-        hours = int(lap_time // 3600)
-        minutes = int((lap_time % 3600) // 60)
-        seconds = int(lap_time % 60)
-        centiseconds = int((lap_time - int(lap_time)) * 100)
-        lap_time_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}.{centiseconds:02d}"
-        
-        # Format total time
-        hours_t = int(elapsed // 3600)
-        minutes_t = int((elapsed % 3600) // 60)
-        seconds_t = int(elapsed % 60)
-        centiseconds_t = int((elapsed - int(elapsed)) * 100)
-        total_time_str = f"{hours_t:02d}:{minutes_t:02d}:{seconds_t:02d}.{centiseconds_t:02d}"
-        
-        # Add to lap times
-        self.lap_times.append(elapsed)
-        
-        # Add to treeview
-        lap_num = len(self.lap_times)
-        self.lap_tree.insert('', 'end', values=(lap_num, total_time_str, lap_time_str))
-        self.lap_tree.yview_moveto(1)  # Scroll to bottom
+        
+        # Keep following the newest lap unless the list was scrolled back
+        following = self.lap_list_top + self.lap_list_rows >= len(self.stopwatch.laps)
+        self.stopwatch.lap()
+        if following:
+            self.lap_list_top = len(self.stopwatch.laps) - self.lap_list_rows
+        self.render_lap_list()
     
     def reset_stopwatch(self):
-        self.stopwatch_running = False
-        self.stopwatch_elapsed = 0
-        self.stopwatch_var.set("00:00:00.00")
+        self.stopwatch.reset()
+        self.refresh_stopwatch()
         self.start_btn.configure(text="Start")
         self.lap_btn.configure(state=tk.DISABLED)
-        self.lap_times = []
-        self.lap_tree.delete(*self.lap_tree.get_children())
+        self.lap_list_top = 0
+        self.render_lap_list()
+    
+    def render_lap_list(self):
+        laps = self.stopwatch.laps
+        total = len(laps)
+        rows = self.lap_list_rows
+        self.lap_list_top = max(0, min(self.lap_list_top, total - rows))
+        top = self.lap_list_top
+        digits = self.stopwatch_digits
+        
+        wanted = {str(number): (number, format_duration_ns(total_ns, digits), 
+                                format_duration_ns(lap_ns, digits))
+                  for number, total_ns, lap_ns in laps.rows(top, rows)}
+        stale = [iid for iid in self.lap_rows if iid not in wanted]
+        if stale:
+            self.lap_tree.delete(*stale)
+        for position, (iid, values) in enumerate(wanted.items()):
+            if iid in self.lap_rows:
+                self.lap_tree.item(iid, values=values)
+                self.lap_tree.move(iid, '', position)
+            else:
+                self.lap_tree.insert('', position, iid=iid, values=values)
+        self.lap_rows = wanted
+        
+        if total:
+            self.lap_vsb.set(top / total, min(top + rows, total) / total)
+        else:
+            self.lap_vsb.set(0, 1)
+        self.lap_stats_var.set(self.lap_stats_text())
+    
+    def lap_stats_text(self):
+        laps = self.stopwatch.laps
+        if not len(laps):
+            return ""
+        digits = self.stopwatch_digits
+        text = (f"Fastest: #{laps.fastest[0]} {format_duration_ns(laps.fastest[1], digits)}   "
+                f"Slowest: #{laps.slowest[0]} {format_duration_ns(laps.slowest[1], digits)}   "
+                f"Mean: {format_duration_ns(laps.mean_ns(), digits)}")
+        if len(laps) > 1:
+            text += f"   Std dev: {format_duration_ns(laps.stddev_ns(), digits)}"
+        return text
+    
+    def scroll_lap_list(self, top):
+        self.lap_list_top = int(top)
+        self.render_lap_list()
+    
+    def on_lap_scrollbar(self, *args):
+        self.scroll_lap_list(self.scrollbar_top(self.lap_list_top, self.lap_list_rows, 
+                                                len(self.stopwatch.laps), *args))
+    
+    def on_lap_list_wheel(self, event):
+        self.scroll_lap_list(self.lap_list_top + self.wheel_rows(event))
+        return "break"
+    
+    def on_lap_list_resize(self, event):
+        rows = self.rows_that_fit(event)
+        if rows != self.lap_list_rows:
+            self.lap_list_rows = rows
+            self.render_lap_list()
+    
+    def export_laps(self, kind):
+        if not len(self.stopwatch.laps):
+            messagebox.showinfo("Export Laps", "There are no laps to export")
+            return
+        path = filedialog.asksaveasfilename(defaultextension="." + kind, 
+                                            filetypes=[(kind.upper() + " files", "*." + kind)])
+        if not path:
+            return
+        try:
+            with open(path, 'w', newline='') as f:
+                if kind == 'csv':
+                    self.stopwatch.laps.write_csv(f, self.stopwatch_digits)
+                else:
+                    self.stopwatch.laps.write_json(f)
+        except OSError as e:
+            messagebox.showerror("Export Failed", str(e))
     
     def start_timer(self):
-        if self.timer_running:
+        # Resume the selected timer if it is paused, otherwise start a new one
+        timer = self.timer_engine.timers.get(self.selected_timer)
+        if timer is not None and not timer.running and not timer.finished:
+            self.timer_engine.resume(timer.name)
+            self.refresh_timers()
             return
             
         try:
@@ -839,82 +1368,160 @@ class AlarmClock:
             if total_seconds <= 0:
                 messagebox.showerror("Invalid Time", "Please enter a positive time value")
                 return
-                
-            self.timer_remaining = total_seconds
-            self.timer_total = total_seconds
-            self.timer_progress['maximum'] = total_seconds
-            self.timer_progress['value'] = total_seconds
             
-            self.timer_running = True
-            self.timer_start_btn.configure(state=tk.DISABLED)
-            self.timer_pause_btn.configure(state=tk.NORMAL)
+            # Keep names unique so several timers can share a label
+            base_name = self.timer_name_var.get().strip() or "Timer"
+            name = base_name
+            count = 2
+            while name in self.timer_engine.timers:
+                name = f"{base_name} ({count})"
+                count += 1
             
-            # Start timer thread
-            self.timer_thread = threading.Thread(target=self.run_timer, daemon=True)
-            self.timer_thread.start()
+            self.timer_engine.start(name, total_seconds * 1000000000)
+            self.timer_tree.insert('', 'end', iid=name, values=(name, "", ""))
+            self.timer_tree.selection_set(name)
+            self.timer_tree.see(name)
+            self.selected_timer = name
+            self.refresh_timers()
             
         except ValueError:
             messagebox.showerror("Invalid Input", "Please enter valid numbers for time")
     
-    def run_timer(self):
-        while self.timer_remaining > 0 and self.timer_running:
-            time.sleep(1)
-            self.timer_remaining -= 1
-            
-            # Update display
-            hours = self.timer_remaining // 3600
-            minutes = (self.timer_remaining % 3600) // 60
-            seconds = self.timer_remaining % 60
-            time_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-            
-            # Update progress bar
-            progress_value = self.timer_total - self.timer_remaining
-            
-            # Update in main thread
-            self.root.after(0, lambda: self.timer_var.set(time_str))
-            self.root.after(0, lambda: self.timer_progress.configure(value=progress_value))
-        
-        # Timer finished
-        if self.timer_remaining == 0:
-            self.root.after(0, self.timer_finished)
-    
     def pause_timer(self):
-        self.timer_running = False
-        self.timer_start_btn.configure(state=tk.NORMAL, text="Resume")
-        self.timer_pause_btn.configure(state=tk.DISABLED)
+        self.timer_engine.pause(self.selected_timer)
+        self.refresh_timers()
     
     def reset_timer(self):
-        self.timer_running = False
-        self.timer_remaining = 0
-        self.timer_var.set("01:00:00")
-        self.timer_start_btn.configure(state=tk.NORMAL, text="Start")
-        self.timer_pause_btn.configure(state=tk.DISABLED)
-        self.timer_progress['value'] = 0
+        # Remove the selected timer and restore the default inputs
+        if self.selected_timer in self.timer_engine.timers:
+            self.timer_engine.cancel(self.selected_timer)
+            self.timer_rows.pop(self.selected_timer, None)
+            self.timer_tree.delete(self.selected_timer)
+        self.selected_timer = None
+        
+        self.render_var(self.timer_var, "01:00:00")
+        self.render(self.timer_progress, value=0)
         
         # Reset spinboxes to default
         self.timer_hours.set("1")
         self.timer_minutes.set("0")
         self.timer_seconds.set("0")
+        
+        self.refresh_timers()
+    
+    def sync_timer_rows(self):
+        # Match the timer list to timers started or stopped elsewhere
+        if self.selected_timer not in self.timer_engine.timers:
+            self.selected_timer = None
+        timers = self.timer_engine.timers
+        for name in self.timer_tree.get_children():
+            if name not in timers:
+                self.timer_rows.pop(name, None)
+                self.timer_tree.delete(name)
+        for name in timers:
+            if not self.timer_tree.exists(name):
+                self.timer_tree.insert('', 'end', iid=name, values=(name, "", ""))
+    
+    def on_timer_selected(self, event=None):
+        selection = self.timer_tree.selection()
+        self.selected_timer = selection[0] if selection else None
+        self.refresh_timers()
+    
+    def check_timers(self):
+        # Called by the timer engine when the earliest deadline is due
+        finished = self.timer_engine.pop_finished()
+        if finished:
+            self.timer_finished(finished)
+    
+    def refresh_timers(self):
+        # Render now and restart the refresh loop
+        self.ticker.refresh('timers')
+    
+    def update_timers(self):
+        now = self.timer_engine.now_ns()
+        
+        # Only touch rows whose text changed
+        for name, timer in self.timer_engine.timers.items():
+            remaining = -(-timer.remaining_ns(now) // 1000000000)
+            if timer.finished:
+                status = "Finished"
+            elif timer.running:
+                status = "Running"
+            else:
+                status = "Paused"
+            row = (name, format_duration_ns(remaining * 1000000000, 0), status)
+            if self.timer_rows.get(name) != row:
+                self.timer_rows[name] = row
+                self.timer_tree.item(name, values=row)
+        
+        # Big display and progress follow the selected timer
+        timer = self.timer_engine.timers.get(self.selected_timer)
+        if timer is not None:
+            remaining = timer.remaining_ns(now)
+            self.render_var(self.timer_var, self.timer_rows[timer.name][1])
+            self.render(self.timer_progress, maximum=timer.total_ns / 1000000000, 
+                        value=(timer.total_ns - remaining) / 1000000000)
+            paused = not timer.running and not timer.finished
+            self.render(self.timer_start_btn, state=tk.NORMAL, text="Resume" if paused else "Start")
+            self.render(self.timer_pause_btn, state=tk.NORMAL if timer.running else tk.DISABLED)
+        else:
+            self.render(self.timer_start_btn, state=tk.NORMAL, text="Start")
+            self.render(self.timer_pause_btn, state=tk.DISABLED)
+        
+        # Keep refreshing only while something is counting down, waking
+        # when the soonest displayed second changes
+        next_change = None
+        for timer in self.timer_engine.timers.values():
+            if timer.running:
+                until = (timer.remaining_ns(now) - 1) % 1000000000 + 1
+                if next_change is None or until < next_change:
+                    next_change = until
+        if next_change is None:
+            return None
+        return -(-next_change // 1000000)
     
-    def timer_finished(self):
-        self.timer_running = False
-        self.timer_var.set("00:00:00")
-        self.timer_start_btn.configure(state=tk.NORMAL, text="Start")
-        self.timer_pause_btn.configure(state=tk.DISABLED)
+    def timer_finished(self, timers):
+        # Timers started through the API can finish before the tab is built
+        if self.tab_built(self.timer_tab):
+            self.sync_timer_rows()
+            self.refresh_timers()
         
         # Play alarm sound
-        threading.Thread(target=self.play_chime, daemon=True).start()
+        self.audio.play_once("Chime", self.volume_var.get())
         
-        # Show message
-        messagebox.showinfo("Timer Complete", "Your timer has finished!")
+        # Show one message for every timer that finished together
+        if len(timers) == 1 and timers[0].name == "Timer":
+            messagebox.showinfo("Timer Complete", "Your timer has finished!")
+        else:
+            names = ", ".join(timer.name for timer in timers)
+            messagebox.showinfo("Timer Complete", f"Finished: {names}")
+    
+    def get_timezone_index(self):
+        if self.tz_index is None:
+            import pytz
+            aliases = []
+            for code, zones in pytz.country_timezones.items():
+                country = pytz.country_names.get(code)
+                if country and len(zones) == 1:
+                    aliases.append((country, zones[0]))
+            self.tz_index = TimezoneIndex(pytz.all_timezones, aliases)
+        return self.tz_index
+    
+    def filter_timezones(self, event=None):
+        # Arrow keys and Return navigate the list rather than edit the query
+        if event is not None and event.keysym in ('Up', 'Down', 'Return', 'Escape'):
+            return
+        self.tz_combo['values'] = self.get_timezone_index().search(self.tz_var.get())
     
     def add_timezone(self):
         tz_name = self.tz_var.get()
         if not tz_name:
             return
-            
-        if tz_name in pytz.all_timezones:
+        
+        tz_name = self.get_timezone_index().resolve(tz_name)
+        if tz_name is not None:
             self.add_clock_display(tz_name)
+            self.store.add_world_clock(tz_name)
             self.tz_var.set("")
     
     def add_clock_display(self, tz_name):
@@ -925,6 +1532,8 @@ class AlarmClock:
         # Location label
         location = tz_name.split('/')[-1].replace('_', ' ')
         ttk.Label(clock_frame, text=location, font=('Arial', 12, 'bold')).pack(anchor='w')
+        remove_btn = ttk.Button(clock_frame, text="Remove")
+        remove_btn.place(relx=1.0, x=0, y=0, anchor='ne')
         
         # Time label
         time_var = tk.StringVar()
@@ -934,39 +1543,119 @@ class AlarmClock:
         date_var = tk.StringVar()
         ttk.Label(clock_frame, textvariable=date_var, font=('Arial', 10)).pack(anchor='w')
         
+        # Resolve the zone once; its offsets are cached until they change.
+        # pytz is only imported once the World Clock tab is built.
+        import pytz
+        try:
+            zone = ZoneOffsetCache(pytz.timezone(tz_name))
+        except pytz.UnknownTimeZoneError:
+            zone = None
+            time_var.set("Error")
+            date_var.set("Invalid timezone")
+        
         # Store for updates
         if not hasattr(self, 'world_clocks'):
             self.world_clocks = []
             
-        self.world_clocks.append({
+        clock = {
             'frame': clock_frame,
             'tz': tz_name,
+            'zone': zone,
+            'day': None,
             'time_var': time_var,
             'date_var': date_var
-        })
+        }
+        self.world_clocks.append(clock)
+        remove_btn.configure(command=lambda: self.remove_clock_display(clock))
+    
+    def remove_clock_display(self, clock):
+        # Destroying the frame takes its widgets along; the variables go
+        # with the entry
+        self.world_clocks.remove(clock)
+        clock['frame'].destroy()
+        self.store.remove_world_clock(clock['tz'])
     
     def update_world_clocks(self):
         if hasattr(self, 'world_clocks'):
+            # Read UTC once for every clock
+            utc_seconds = int(self.engine.clock.time())
+            
+            # Zones sharing an offset share the formatted time
+            time_strings = {}
+            
             for clock in self.world_clocks:
+                zone = clock['zone']
+                if zone is None:
+                    continue
+                
+                offset = zone.offset_at(utc_seconds)
+                local_seconds = utc_seconds + offset
+                
+                time_str = time_strings.get(offset)
+                if time_str is None:
+                    time_str = time_strings[offset] = format_clock_time(local_seconds)
+                clock['time_var'].set(time_str)
+                
+                # The date string only changes when the local date rolls over
+                day = local_seconds // 86400
+                if day != clock['day']:
+                    clock['day'] = day
+                    date = datetime.date.fromordinal(EPOCH_ORDINAL + day)
+                    clock['date_var'].set(date.strftime("%A, %B %d, %Y"))
+        
+        return self.ticker.ms_to_next_second()
+    
+    def settings_vars(self):
+        return {
+            'volume': self.volume_var,
+            'snooze_minutes': self.snooze_var,
+            'alarm_duration': self.alarm_duration_var,
+            'grace_minutes': self.grace_var,
+            'agenda_size': self.agenda_size_var,
+            'agenda_days': self.agenda_days_var,
+            'stopwatch_digits': self.stopwatch_digits_var,
+            'theme': self.theme_var
+        }
+    
+    def load_saved_state(self):
+        saved = self.store.load_settings()
+        for key, var in self.settings_vars().items():
+            if key in saved:
                 try:
-                    tz = pytz.timezone(clock['tz'])
-                    now = datetime.datetime.now(tz)
-                    
-                    time_str = now.strftime("%I:%M:%S %p")
-                    date_str = now.strftime("%A, %B %d, %Y")
-                    
-                    clock['time_var'].set(time_str)
-                    clock['date_var'].set(date_str)
-                except:
-                    # Handle any timezone errors
-                    clock['time_var'].set("Error")
-                    clock['date_var'].set("Invalid timezone")
-        
-        # Schedule next update
-        self.root.after(1000, self.update_world_clocks)
+                    var.set(saved[key])
+                except tk.TclError:
+                    pass
+        
+        self.sync_engine_settings()
+        for var in (self.volume_var, self.snooze_var, self.alarm_duration_var, self.grace_var):
+            var.trace_add('write', self.sync_engine_settings)
+        # Alarms go into the scheduler up front; the list is rendered when
+        # the Alarms tab is first shown
+        self.engine.load()
+    
+    def sync_engine_settings(self, *args):
+        try:
+            self.engine.volume = self.volume_var.get()
+            self.engine.snooze_minutes = self.snooze_var.get()
+            self.engine.alarm_duration = self.alarm_duration_var.get()
+            self.engine.grace_minutes = self.grace_var.get()
+        except tk.TclError:
+            # Ignore partially typed values
+            pass
     
     def save_settings(self):
-        # In a real application, you would save these to a file
+        # Only values that differ from what is stored are written
+        saved = self.store.load_settings()
+        changed = {}
+        for key, var in self.settings_vars().items():
+            try:
+                value = str(var.get())
+            except tk.TclError:
+                continue
+            if saved.get(key) != value:
+                changed[key] = value
+        self.store.save_settings(changed)
+        
         messagebox.showinfo("Settings Saved", "Your settings have been saved successfully")
         
         # For theme change, you would implement theme switching logic here
@@ -976,6 +1665,8 @@ class AlarmClock:
             messagebox.showinfo("Theme Change", "Dark theme will be applied after restart")
 
 if __name__ == "__main__":
+    if os.environ.get('ALARM_CLOCK_STARTUP_REPORT'):
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
     root = tk.Tk()
     app = AlarmClock(root)
     root.mainloop()
\ No newline at end of file
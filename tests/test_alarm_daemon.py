@@ -0,0 +1,100 @@
+import datetime
+import os
+import socket
+
+import pytest
+
+from alarm_daemon import FIRED, AlarmDaemon, AlarmShard, pack, percentile, unpack
+from clock_engine import Alarm, ClockStore, local_seconds, repeat_mask
+
+# 2024-01-01 was a Monday
+MONDAY = local_seconds(datetime.datetime(2024, 1, 1))
+MINUTE = 60
+DAY = 86400
+
+def alarm(alarm_id, hour, minute=0, repeat=(), active=True):
+    return Alarm(hour * 60 + minute, "Alarm", "Classic Alarm", repeat_mask(repeat), active, alarm_id)
+
+class SentCommands:
+    # Stands in for a worker's command pipe
+    def __init__(self):
+        self.sent = []
+
+    def send(self, command):
+        self.sent.append(command)
+
+def fired(shard, now):
+    keys, dues, switched_off = shard.advance(now)
+    return list(zip(keys, dues)), list(switched_off)
+
+def test_pack_round_trip():
+    kind, stamp, count, columns = unpack(pack(FIRED, 123, [4, 5], [60, 120]))
+    assert (kind, stamp, count, list(columns)) == (FIRED, 123, 2, [4, 5, 60, 120])
+
+def test_one_shot_alarm_fires_once_and_switches_off():
+    shard = AlarmShard(MONDAY)
+    shard.add([alarm(1, 7), alarm(2, 8, active=False)])
+    assert fired(shard, MONDAY + 7 * 3600 - 1) == ([], [])
+    assert fired(shard, MONDAY + 9 * 3600) == ([(1, MONDAY + 7 * 3600)], [1])
+    assert not shard.alarms[1].active
+    assert fired(shard, MONDAY + 2 * DAY) == ([], [])
+
+def test_repeating_alarm_fires_on_its_days_only():
+    shard = AlarmShard(MONDAY)
+    shard.add([alarm(1, 6, 30, ["Tue", "Thu"])])
+    dues = []
+    for day in range(7):
+        dues.extend(due for key, due in fired(shard, MONDAY + (day + 1) * DAY)[0])
+    assert dues == [MONDAY + day * DAY + 6 * 3600 + 30 * MINUTE for day in (1, 3)]
+
+def test_snooze_rings_again_without_moving_the_schedule():
+    shard = AlarmShard(MONDAY)
+    shard.add([alarm(1, 7, repeat=["Mon", "Tue"]), alarm(2, 9)])
+    ring = MONDAY + 7 * 3600
+    assert fired(shard, ring)[0] == [(1, ring)]
+    shard.snooze(1, 5)
+    shard.snooze(99, 5)
+    assert fired(shard, ring + 5 * MINUTE)[0] == [(-1, ring + 5 * MINUTE)]
+    assert fired(shard, ring + DAY)[0] == [(2, MONDAY + 9 * 3600), (1, ring + DAY)]
+
+def test_removed_alarms_and_their_snoozes_never_ring():
+    shard = AlarmShard(MONDAY)
+    shard.add([alarm(1, 7, repeat=["Mon"])])
+    fired(shard, MONDAY + 7 * 3600)
+    shard.snooze(1, 10)
+    shard.remove([1, 5])
+    assert fired(shard, MONDAY + 14 * DAY) == ([], [])
+    assert shard.alarms == {}
+
+# Control socket
+
+def test_listen_replaces_a_stale_socket_but_not_a_live_one(tmp_path):
+    path = str(tmp_path / "daemon.sock")
+    stale = socket.socket(socket.AF_UNIX)
+    stale.bind(path)
+    stale.close()
+    daemon = AlarmDaemon(str(tmp_path / "clock.db"), workers=1).listen(path)
+    try:
+        with pytest.raises(OSError):
+            AlarmDaemon(str(tmp_path / "clock.db"), workers=1).listen(path)
+        assert os.path.exists(path)
+    finally:
+        daemon.stop()
+
+def test_snooze_requests_are_validated(tmp_path):
+    daemon = AlarmDaemon(str(tmp_path / "clock.db"), workers=2)
+    daemon.store = ClockStore(daemon.db_path)
+    daemon.store.add_alarm(alarm(None, 7))
+    daemon.commands = [SentCommands(), SentCommands()]
+    assert daemon.control({'op': 'snooze', 'id': 5}) == {'ok': False,
+                                                         'error': "No alarm with id 5"}
+    for minutes in (0, -5, "nan"):
+        reply = daemon.control({'op': 'snooze', 'id': 1, 'minutes': minutes})
+        assert reply == {'ok': False, 'error': "'minutes' must be a positive number"}
+    assert daemon.control({'op': 'snooze', 'id': 1, 'minutes': 10}) == {'ok': True}
+    assert daemon.commands[1].sent == [('snooze', 1, 10.0)]
+    assert daemon.commands[0].sent == []
+
+def test_percentile_of_no_values():
+    assert percentile([], 0.5) is None
+    assert [percentile([1, 2, 3, 4], p) for p in (0, 0.5, 0.99, 1.0)] == [1, 3, 4, 4]
@@ -0,0 +1,148 @@
+import json
+import os
+import socket
+import threading
+
+import pytest
+
+from clock_api import AlarmControl, ApiError, ApiRequest, ControlServer, parse_address
+from clock_engine import AlarmEngine, EventLoop, SystemClock, TimerEngine, VirtualClock
+
+def make_control(clock=None):
+    clock = clock or VirtualClock()
+    loop = EventLoop(clock)
+    engine = AlarmEngine(loop, clock=clock)
+    timers = TimerEngine(loop, lambda: timers.pop_finished(), clock)
+    changed = []
+    control = AlarmControl(loop, engine, timers, lambda: changed.append('alarms'),
+                           lambda: changed.append('timers'))
+    return control, changed
+
+def call(control, body):
+    request = ApiRequest(body, control.OPS)
+    control.submit(request)
+    while control.drain():
+        pass
+    return request.response()
+
+def test_parse_address():
+    assert parse_address("8765") == ('tcp', ('127.0.0.1', 8765))
+    assert parse_address("localhost:9") == ('tcp', ('localhost', 9))
+    assert parse_address("[::1]:9") == ('tcp', ('::1', 9))
+    assert parse_address("unix:/tmp/x.sock") == ('unix', '/tmp/x.sock')
+    for text in ("0.0.0.0:9", "192.168.1.2:80", "example.com:9", "port"):
+        with pytest.raises(ApiError):
+            parse_address(text)
+
+def test_alarm_calls():
+    control, changed = make_control()
+    created = call(control, [{'op': 'alarms.create', 'hour': 7, 'minute': 30, 'ampm': 'am',
+                              'repeat': ['Fri', 'Mon']},
+                             {'op': 'alarms.create', 'hour': 13, 'minute': 0, 'ampm': 'PM'},
+                             {'op': 'alarms.create', 'hour': 8, 'minute': 0, 'ampm': 'PM',
+                              'label': "Tea"}])
+    assert created[0] == {'ok': True, 'result': {
+        'id': 1, 'hour': 7, 'minute': 30, 'ampm': 'AM', 'label': "Alarm", 'tone': "Classic Alarm",
+        'repeat': ['Mon', 'Fri'], 'active': True}}
+    assert created[1] == {'ok': False, 'error': "Hour must be between 1 and 12"}
+    assert created[2]['result']['id'] == 2
+    assert changed == ['alarms']
+    listed = call(control, {'op': 'alarms.list', 'offset': 1})
+    assert [alarm['label'] for alarm in listed['result']] == ["Tea"]
+
+def test_toggle_and_delete_calls():
+    control, changed = make_control()
+    call(control, [{'op': 'alarms.create', 'hour': 7, 'minute': 0, 'ampm': 'AM'}] * 2)
+    toggled = call(control, [{'op': 'alarms.toggle', 'id': 1},
+                             {'op': 'alarms.toggle', 'id': 1},
+                             {'op': 'alarms.toggle', 'id': 2, 'active': False},
+                             {'op': 'alarms.toggle', 'id': 9}])
+    # Toggling the same alarm twice in one request flips it back
+    assert [result['ok'] for result in toggled] == [True, True, True, False]
+    assert control.engine.alarms[1].active
+    assert not control.engine.alarms[2].active
+    deleted = call(control, [{'op': 'alarms.delete', 'id': 2}, {'op': 'alarms.delete', 'id': 2}])
+    assert deleted == [{'ok': True, 'result': {'id': 2}},
+                       {'ok': False, 'error': "No alarm with id 2"}]
+    assert list(control.engine.alarms) == [1]
+
+def test_timer_calls():
+    control, changed = make_control()
+    started = call(control, {'op': 'timers.start', 'name': "tea", 'seconds': 180})
+    assert started['result'] == {'name': "tea", 'seconds': 180, 'remaining': 180,
+                                 'state': 'running'}
+    assert call(control, {'op': 'timers.pause', 'name': "tea"})['result']['state'] == 'paused'
+    assert call(control, {'op': 'timers.start', 'seconds': 0})['ok'] is False
+    assert call(control, {'op': 'timers.stop', 'name': "egg"}) == {
+        'ok': False, 'error': "No timer named 'egg'"}
+    assert call(control, {'op': 'timers.stop', 'name': "tea"})['ok']
+    assert call(control, {'op': 'timers.list'})['result'] == []
+    assert set(changed) == {'timers'}
+
+def test_unknown_ops_and_malformed_bodies():
+    control, changed = make_control()
+    assert call(control, [{'op': 'alarms.explode'}, 5]) == [
+        {'ok': False, 'error': "Unknown op: 'alarms.explode'"},
+        {'ok': False, 'error': "Unknown op: None"}]
+    with pytest.raises(ApiError):
+        ApiRequest("alarms.list", control.OPS)
+
+# ControlServer over a Unix socket
+
+@pytest.fixture
+def server(tmp_path):
+    control, changed = make_control(SystemClock())
+    loop = control.root
+    path = str(tmp_path / "api.sock")
+    server = ControlServer(control, ('unix', path)).start()
+    thread = threading.Thread(target=loop.run, daemon=True)
+    thread.start()
+    yield server
+    server.stop()
+    loop.stop()
+    thread.join(timeout=2)
+
+def http(server, method, body=b"", headers=None):
+    headers = dict({'Content-Type': 'application/json', 'Connection': 'close'}, **(headers or {}))
+    lines = [f"{method} / HTTP/1.1", f"Content-Length: {len(body)}"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    with socket.socket(socket.AF_UNIX) as client:
+        client.settimeout(5)
+        client.connect(server.address)
+        client.sendall(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body)
+        response = b""
+        while True:
+            data = client.recv(65536)
+            if not data:
+                break
+            response += data
+    head, _, payload = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(payload)
+
+def test_server_runs_calls(server):
+    status, result = http(server, 'POST', json.dumps(
+        {'op': 'alarms.create', 'hour': 7, 'minute': 0, 'ampm': 'AM'}).encode())
+    assert status == 200
+    assert result['result']['id'] == 1
+    assert http(server, 'GET') == (200, {'ops': sorted(AlarmControl.OPS)})
+    assert oct(os.stat(server.address).st_mode & 0o777) == oct(0o600)
+
+def test_server_refuses_browsers_and_bad_requests(server):
+    body = b'{"op": "alarms.list"}'
+    assert http(server, 'POST', body, {'Origin': "http://example.com"})[0] == 403
+    assert http(server, 'POST', body, {'Content-Type': "text/plain"})[0] == 415
+    assert http(server, 'POST', b'{"op": ')[0] == 400
+    assert http(server, 'DELETE')[0] == 405
+
+def test_server_rejects_oversized_headers(server):
+    body = b'{"op": "alarms.list"}'
+    many = {f"X-Header-{i}": "1" for i in range(200)}
+    assert http(server, 'POST', body, many) == (431, {'error': "Too many header lines"})
+    assert http(server, 'POST', body, {'X-Long': "a" * 100000}) == (
+        431, {'error': "Header line too long"})
+    # The server is still answering
+    assert http(server, 'POST', body)[0] == 200
+
+def test_second_server_refuses_a_live_socket(server):
+    with pytest.raises(OSError):
+        ControlServer(server.control, ('unix', server.address)).start()
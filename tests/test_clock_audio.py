@@ -0,0 +1,154 @@
+import array
+import time
+import wave
+
+import pytest
+
+from clock_audio import (BUILTIN_TONES, LOOP_GAP_SECONDS, SAMPLE_RATE, BellBackend, DeviceSink,
+                         NullSink, PcmCache, ToneAudioSink, ToneLibrary, WavFileSink, pcm_seconds,
+                         scale_pcm, synthesize, volume_gain)
+
+# PcmCache
+
+def test_cache_evicts_least_recently_used_by_bytes():
+    cache = PcmCache(10)
+    cache.put('a', b'aaaa')
+    cache.put('b', b'bbbb')
+    assert cache.get('a') == b'aaaa'
+    cache.put('c', b'cccc')
+    # 'b' was used least recently
+    assert cache.get('b') is None
+    assert cache.get('a') == b'aaaa'
+    assert cache.bytes == 8
+    assert len(cache) == 2
+
+def test_cache_replaces_and_refuses_oversized_buffers():
+    cache = PcmCache(10)
+    cache.put('a', b'aaaa')
+    cache.put('a', b'aa')
+    assert cache.bytes == 2
+    cache.put('a', b'x' * 11)
+    assert cache.get('a') is None
+    assert cache.bytes == 0
+
+# Rendering and scaling
+
+def test_volume_gain_is_clamped_and_squared():
+    assert volume_gain(100) == 1
+    assert volume_gain(50) == 0.25
+    assert volume_gain(-5) == 0
+    assert volume_gain(150) == 1
+
+def test_synthesize_length_and_silence():
+    samples = synthesize([(800, 800, 0.5), (0, 0, 0.5)])
+    assert len(samples) == SAMPLE_RATE
+    assert max(samples[:SAMPLE_RATE // 2]) > 20000
+    assert not any(samples[SAMPLE_RATE // 2:])
+
+def test_scale_pcm():
+    pcm = scale_pcm(array.array('h', [1000, -1000, 0]), 0.5)
+    assert array.array('h', pcm).tolist() == [500, -500, 0]
+
+# ToneAudioSink
+
+def test_tone_sink_caches_scaled_tones():
+    sink = ToneAudioSink(NullSink(), cache_bytes=10 * 1024 * 1024)
+    pcm = sink.pcm("Chime", 50)
+    assert sink.pcm("Chime", 50.2) is pcm
+    assert sink.pcm("Chime", 80) is not pcm
+    assert len(sink.cache) == 2
+    seconds = sum(seconds for _, _, seconds in BUILTIN_TONES["Chime"]) + LOOP_GAP_SECONDS
+    assert pcm_seconds(pcm) == pytest.approx(seconds, abs=0.001)
+
+def test_tone_sink_falls_back_to_the_default_tone():
+    sink = ToneAudioSink(NullSink())
+    assert sink.pcm("No such tone", 100) == sink.pcm("Classic Alarm", 100)
+
+def test_tone_sink_repeats_for_the_duration():
+    null = NullSink()
+    sink = ToneAudioSink(null)
+    sink.play("Classic Alarm", 100, 10)
+    pcm, loops = null.last
+    assert loops == 10
+    assert null.playing
+    sink.stop()
+    assert not null.playing
+
+def test_wav_file_sink_writes_every_repetition(tmp_path):
+    path = str(tmp_path / "out.wav")
+    sink = ToneAudioSink(WavFileSink(path))
+    sink.play_once("Classic Alarm", 100)
+    sink.sink.wait()
+    with wave.open(path, 'rb') as wav:
+        assert wav.getframerate() == SAMPLE_RATE
+        assert wav.getnframes() == len(sink.pcm("Classic Alarm", 100)) // 2
+
+class BrokenBackend:
+    def start(self, pcm):
+        raise OSError("No such device")
+
+def test_device_sink_falls_back_to_the_bell(capsys, caplog):
+    sink = DeviceSink(BrokenBackend())
+    sink.play(bytes(20), 2)
+    # Rung once per repetition
+    rung = ""
+    deadline = time.monotonic() + 5
+    while rung.count('\a') < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+        rung += capsys.readouterr().err
+    assert rung == '\a\a'
+    assert isinstance(sink.backend, BellBackend)
+    assert "ringing the bell instead" in caplog.text
+
+# ToneLibrary
+
+def write_tone(path, samples, channels=1, width=2, rate=SAMPLE_RATE):
+    with wave.open(str(path), 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(width)
+        wav.setframerate(rate)
+        wav.writeframes(samples)
+
+@pytest.fixture
+def library(tmp_path):
+    write_tone(tmp_path / "Bell.wav", array.array('h', [1000, -1000] * 50).tobytes())
+    # 8-bit stereo at twice the rate: decoded to mono 16-bit on first use
+    write_tone(tmp_path / "Gong.WAV", bytes([128 + 64, 128 + 64] * 200), 2, 1, 2 * SAMPLE_RATE)
+    (tmp_path / "broken.wav").write_bytes(b"RIFF....WAVEjunk")
+    (tmp_path / "notes.txt").write_text("not a tone")
+    write_tone(tmp_path / "Chime.wav", b"\0\0" * 10)
+    library = ToneLibrary(str(tmp_path))
+    library.scan(reserved=BUILTIN_TONES)
+    yield library
+    library.close()
+
+def test_library_indexes_wav_headers_only(library):
+    assert sorted(library.tones) == ["Bell", "Gong"]
+    bell = library.tones["Bell"]
+    assert bell.playable_as_is
+    assert bell.seconds == pytest.approx(100 / SAMPLE_RATE)
+    assert bell._map is None
+    assert not library.tones["Gong"].playable_as_is
+
+def test_library_missing_directory(tmp_path):
+    assert ToneLibrary(str(tmp_path / "none")).scan() == {}
+
+def test_library_tone_decoded_to_mono(library):
+    samples = library.tones["Gong"].samples()
+    # 200 stereo frames at twice the rate
+    assert len(samples) == 100
+    assert set(samples) == {64 * 256}
+
+def test_library_tone_played_from_its_mapping(library):
+    sink = ToneAudioSink(NullSink(), library=library)
+    assert "Bell" in sink.tone_names()
+    full = sink.pcm("Bell", 100)
+    assert isinstance(full, memoryview)
+    assert array.array('h', bytes(full[:4])).tolist() == [1000, -1000]
+    full.release()
+    half = sink.pcm("Bell", 50)
+    assert array.array('h', half[:4]).tolist() == [250, -250]
+    # Scaling let go of the mapping, so it can be unmapped
+    mapping = library.tones["Bell"]._map
+    library.tones["Bell"].close()
+    assert mapping.closed
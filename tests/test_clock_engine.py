@@ -0,0 +1,822 @@
+import csv
+import datetime
+import io
+import json
+import random
+import sqlite3
+import statistics
+import zoneinfo
+
+import pytest
+
+from clock_engine import (Alarm, AlarmAgenda, AlarmEngine, AlarmIndex, AlarmScheduler, ClockStore,
+                          DeadlineQueue, EventLoop, InvalidAlarmError, LapLog, Notifier, Stopwatch,
+                          TickScheduler, TimerEngine, TimezoneIndex, TimingWheel, VirtualClock,
+                          ZoneOffsetCache, format_duration_ns)
+from clock_metrics import Metrics
+
+# 2024-01-01 was a Monday
+MONDAY = datetime.datetime(2024, 1, 1)
+
+EVERY_DAY = (1 << 7) - 1
+
+SECOND_NS = 1000000000
+
+class RecordingNotifier(Notifier):
+    def __init__(self):
+        self.fired = []
+        self.missed = []
+
+    def alarm_fired(self, alarm):
+        self.fired.append(alarm.id)
+
+    def alarm_missed(self, alarm, due):
+        self.missed.append((alarm.id, due))
+
+def make_engine(store=None, start=MONDAY):
+    clock = VirtualClock(start)
+    loop = EventLoop(clock)
+    notifier = RecordingNotifier()
+    engine = AlarmEngine(loop, store, clock, notifier)
+    return engine, loop, notifier
+
+def utc_seconds(when):
+    return (when - datetime.datetime(1970, 1, 1)).total_seconds()
+
+def at(hours, minutes=0, days=0):
+    # Seconds from the start of the virtual clock
+    return days * 86400 + hours * 3600 + minutes * 60
+
+# DeadlineQueue and TimingWheel share an interface and must agree on it
+
+@pytest.fixture(params=[DeadlineQueue, TimingWheel])
+def queue(request):
+    return request.param()
+
+def test_queue_pops_in_deadline_order(queue):
+    queue.push_many([('c', 30), ('a', 10), ('b', 20)])
+    queue.push('d', 5)
+    assert len(queue) == 4
+    assert [key for deadline, key in queue.pop_due(25)] == ['d', 'a', 'b']
+    assert list(queue.pop_due(29)) == []
+    assert list(queue.pop_due(30)) == [(30, 'c')]
+    assert len(queue) == 0
+
+def test_queue_discard_and_reschedule(queue):
+    queue.push('a', 10)
+    queue.push('b', 20)
+    queue.push('c', 30)
+    queue.discard('b')
+    queue.discard('missing')
+    # Pushing a key again moves it rather than adding a second entry
+    queue.push('c', 5)
+    assert 'b' not in queue
+    assert queue.deadline('b') is None
+    assert queue.deadline('c') == 5
+    assert list(queue.pop_due(100)) == [(5, 'c'), (10, 'a')]
+
+def test_queue_overdue_push_is_due_at_once(queue):
+    list(queue.pop_due(100))
+    queue.push('late', 50)
+    assert list(queue.pop_due(100)) == [(50, 'late')]
+
+def test_queue_push_many_replaces_existing_keys(queue):
+    queue.push_many([('a', 10), ('b', 20)])
+    queue.push_many([('a', 30)])
+    assert len(queue) == 2
+    assert list(queue.pop_due(100)) == [(20, 'b'), (30, 'a')]
+
+def test_deadline_queue_peek_skips_discarded():
+    queue = DeadlineQueue()
+    queue.push('a', 1)
+    queue.push('b', 2)
+    queue.discard('a')
+    assert queue.peek() == (2, 'b')
+    assert queue.pop() == (2, 'b')
+    assert queue.pop() is None
+
+def test_deadline_queue_stays_bounded_under_toggling():
+    queue = DeadlineQueue()
+    for i in range(10000):
+        queue.push('a', i)
+        queue.discard('a')
+    assert len(queue._heap) < 100
+
+def test_timing_wheel_cascades_far_deadlines():
+    # Deadlines on every level of the wheel and beyond its span
+    wheel = TimingWheel()
+    deadlines = [1, 63, 64, 65, 4095, 4096, 300000, wheel._span + 12345]
+    wheel.push_many((f"k{deadline}", deadline) for deadline in reversed(deadlines))
+    popped = []
+    for now in range(0, deadlines[-1] + 1, 997):
+        popped.extend(wheel.pop_due(now))
+    popped.extend(wheel.pop_due(deadlines[-1]))
+    assert [deadline for deadline, key in popped] == deadlines
+    assert len(wheel) == 0
+
+# AlarmScheduler
+
+def test_scheduler_waits_only_for_the_earliest_alarm():
+    clock = VirtualClock(MONDAY)
+    loop = EventLoop(clock)
+    fired = []
+
+    def wakeup():
+        fired.extend((due, alarm.id) for due, alarm in scheduler.pop_due(clock.now()))
+    scheduler = AlarmScheduler(loop, wakeup, clock)
+    late = Alarm(9 * 60, id=1)
+    early = Alarm(7 * 60, id=2)
+    scheduler.add_many([late, early])
+    # One after() is armed however many alarms wait
+    assert len(loop.queue) == 1
+    assert scheduler.next_fire_time(early) == MONDAY.replace(hour=7)
+    scheduler.remove(early)
+    assert len(loop.queue) == 1
+    loop.advance(at(8, 59))
+    assert fired == []
+    loop.advance(60)
+    assert fired == [(MONDAY.replace(hour=9), 1)]
+
+def test_scheduler_reschedules_repeating_alarms():
+    clock = VirtualClock(MONDAY)
+    scheduler = AlarmScheduler(EventLoop(clock), lambda: None, clock)
+    daily = Alarm(7 * 60, repeat_mask=(1 << 7) - 1, id=1)
+    once = Alarm(7 * 60, id=2)
+    scheduler.add_many([daily, once])
+    due = list(scheduler.pop_due(MONDAY.replace(hour=8)))
+    assert [alarm.id for when, alarm in due] == [1, 2]
+    assert scheduler.next_fire_time(daily) == datetime.datetime(2024, 1, 2, 7)
+    assert scheduler.next_fire_time(once) is None
+
+def test_scheduler_skips_inactive_alarms():
+    clock = VirtualClock(MONDAY)
+    scheduler = AlarmScheduler(EventLoop(clock), lambda: None, clock)
+    alarm = Alarm(7 * 60, active=False, id=1)
+    scheduler.add(alarm)
+    assert scheduler.next_fire_time(alarm) is None
+    alarm.active = True
+    scheduler.update(alarm)
+    assert scheduler.next_fire_time(alarm) == MONDAY.replace(hour=7)
+
+# AlarmAgenda
+
+def test_agenda_merges_firings_in_order():
+    agenda = AlarmAgenda(limit=5)
+    agenda.add_many([Alarm(21 * 60, "Daily", repeat_mask=EVERY_DAY, id=1),
+                     Alarm(7 * 60, "Once", id=2),
+                     Alarm(6 * 60, "Tuesdays", repeat_mask=1 << 1, id=3)], MONDAY)
+    upcoming = agenda.upcoming(MONDAY)
+    assert [(when.day, when.hour, alarm.label) for when, alarm in upcoming] == [
+        (1, 7, "Once"), (1, 21, "Daily"), (2, 6, "Tuesdays"), (2, 21, "Daily"), (3, 21, "Daily")]
+
+def test_agenda_keeps_to_its_horizon():
+    agenda = AlarmAgenda(limit=20, horizon=datetime.timedelta(days=2))
+    agenda.add(Alarm(12 * 60, repeat_mask=EVERY_DAY, id=1), MONDAY)
+    assert [when.day for when, alarm in agenda.upcoming(MONDAY)] == [1, 2]
+    agenda.configure(20, datetime.timedelta(days=3))
+    assert [when.day for when, alarm in agenda.upcoming(MONDAY)] == [1, 2, 3]
+
+def test_agenda_follows_adds_removes_and_passing_time():
+    agenda = AlarmAgenda(limit=3)
+    daily = Alarm(8 * 60, repeat_mask=EVERY_DAY, id=1)
+    agenda.add(daily, MONDAY)
+    agenda.upcoming(MONDAY)
+    version = agenda.version
+    early = Alarm(7 * 60, id=2)
+    agenda.add(early, MONDAY)
+    assert agenda.version != version
+    assert [alarm.id for when, alarm in agenda.upcoming(MONDAY)] == [2, 1, 1]
+    agenda.remove(early)
+    assert [alarm.id for when, alarm in agenda.upcoming(MONDAY)] == [1, 1, 1]
+    later = MONDAY.replace(hour=9)
+    assert [when.day for when, alarm in agenda.upcoming(later)] == [2, 3, 4]
+
+def test_agenda_leaves_out_inactive_alarms():
+    agenda = AlarmAgenda()
+    agenda.add(Alarm(7 * 60, active=False, id=1), MONDAY)
+    assert agenda.upcoming(MONDAY) == []
+    version = agenda.version
+    assert agenda.upcoming(MONDAY) == []
+    assert agenda.version == version
+
+def test_agenda_patched_in_place_matches_a_rebuild():
+    # Repeating alarms only: the engine removes one-shot alarms as they ring
+    rng = random.Random(1)
+    now = MONDAY
+    alarms = [Alarm(rng.randrange(1440), repeat_mask=rng.choice((1, 31, 96, 127)), id=alarm_id)
+              for alarm_id in range(1, 201)]
+    agenda = AlarmAgenda(limit=10)
+    agenda.add_many(alarms, now)
+    agenda.upcoming(now)
+    for step in range(300):
+        alarm = rng.choice(alarms)
+        agenda.remove(alarm)
+        alarm.minute_of_day = rng.randrange(1440)
+        alarm.repeat_mask = rng.choice((1, 31, 96, 127))
+        agenda.add(alarm, now)
+        now += datetime.timedelta(minutes=rng.randrange(30))
+        rebuilt = AlarmAgenda(limit=10)
+        rebuilt.add_many(alarms, now)
+        assert ([when for when, alarm in agenda.upcoming(now)] == 
+                [when for when, alarm in rebuilt.upcoming(now)])
+
+# TimerEngine
+
+def make_timers():
+    clock = VirtualClock(MONDAY)
+    loop = EventLoop(clock)
+    finished = []
+    timers = TimerEngine(loop, lambda: finished.extend(t.name for t in timers.pop_finished()),
+                         clock)
+    return timers, loop, finished
+
+def test_timers_finish_at_their_deadlines():
+    timers, loop, finished = make_timers()
+    timers.start('tea', 180 * SECOND_NS)
+    timers.start('egg', 60 * SECOND_NS)
+    loop.advance(59.999)
+    assert finished == []
+    loop.advance(0.001)
+    assert finished == ['egg']
+    loop.advance(120)
+    assert finished == ['egg', 'tea']
+    assert timers.timers['tea'].finished
+    assert timers.timers['tea'].remaining_ns(timers.now_ns()) == 0
+
+def test_timer_pause_keeps_the_exact_remainder():
+    timers, loop, finished = make_timers()
+    timer = timers.start('tea', 60 * SECOND_NS)
+    loop.advance(20.5)
+    timers.pause('tea')
+    assert not timer.running
+    assert timer.remaining_ns(timers.now_ns()) == 39500000000
+    # Time spent paused does not count
+    loop.advance(3600)
+    assert finished == []
+    assert timer.remaining_ns(timers.now_ns()) == 39500000000
+    timers.resume('tea')
+    loop.advance(39.499)
+    assert finished == []
+    loop.advance(0.001)
+    assert finished == ['tea']
+
+def test_timer_pause_resume_and_cancel_are_idempotent():
+    timers, loop, finished = make_timers()
+    timers.start('tea', 10 * SECOND_NS)
+    timers.resume('tea')
+    timers.pause('tea')
+    timers.pause('tea')
+    timers.resume('missing')
+    timers.cancel('tea')
+    timers.cancel('tea')
+    loop.advance(60)
+    assert finished == []
+    assert timers.timers == {}
+    assert len(loop.queue) == 0
+
+def test_restarting_a_timer_replaces_it():
+    timers, loop, finished = make_timers()
+    timers.start('tea', 10 * SECOND_NS)
+    loop.advance(5)
+    timers.start('tea', 10 * SECOND_NS)
+    loop.advance(9)
+    assert finished == []
+    loop.advance(1)
+    assert finished == ['tea']
+
+def test_finished_timers_are_bounded():
+    timers, loop, finished = make_timers()
+    for i in range(TimerEngine.FINISHED_LIMIT + 5):
+        timers.start(f't{i}', SECOND_NS)
+        loop.advance(1)
+    assert len(timers.timers) == TimerEngine.FINISHED_LIMIT
+    assert 't0' not in timers.timers
+
+# ZoneOffsetCache
+
+class CountingCache(ZoneOffsetCache):
+    loads = 0
+
+    def _load(self, utc_seconds):
+        self.loads += 1
+        ZoneOffsetCache._load(self, utc_seconds)
+
+# 2024-03-31 01:00 UTC, when the UK moves to summer time
+BST_STARTS = datetime.datetime(2024, 3, 31, 1)
+
+def test_zone_offset_cache_follows_pytz_transitions():
+    pytz = pytest.importorskip('pytz')
+    cache = CountingCache(pytz.timezone('Europe/London'))
+    change = utc_seconds(BST_STARTS)
+    assert cache.offset_at(change - 86400) == 0
+    # The whole span up to the transition is answered from the cache
+    assert cache.offset_at(change - 1) == 0
+    assert cache.loads == 1
+    assert cache.valid_until == change
+    assert cache.offset_at(change) == 3600
+    assert cache.loads == 2
+    assert cache.valid_from == change
+
+def test_zone_offset_cache_rechecks_other_zones_periodically():
+    cache = CountingCache(zoneinfo.ZoneInfo('Europe/London'))
+    change = utc_seconds(BST_STARTS)
+    assert cache.offset_at(change - 600) == 0
+    assert cache.offset_at(change - 1) == 0
+    assert cache.loads == 1
+    assert cache.offset_at(change) == 3600
+    assert cache.loads == 2
+
+def test_zone_offset_cache_fixed_offset():
+    cache = ZoneOffsetCache(datetime.timezone(datetime.timedelta(hours=5, minutes=30)))
+    assert cache.offset_at(utc_seconds(MONDAY)) == 19800
+
+# TimezoneIndex
+
+ZONES = ['America/New_York', 'America/Los_Angeles', 'America/Argentina/Buenos_Aires',
+         'Europe/London', 'Europe/Lisbon', 'Asia/Kolkata', 'Asia/Tokyo', 'UTC']
+
+def test_timezone_search_matches_word_prefixes():
+    index = TimezoneIndex(ZONES)
+    assert index.search("new") == ['America/New_York']
+    assert index.search("buenos a") == ['America/Argentina/Buenos_Aires']
+    assert index.search("europe/l") == ['Europe/Lisbon', 'Europe/London']
+    assert index.search("") == sorted(ZONES)
+    assert index.search("america", limit=2) == ['America/Argentina/Buenos_Aires',
+                                                'America/Los_Angeles']
+
+def test_timezone_search_narrows_while_typing():
+    index = TimezoneIndex(ZONES)
+    index.search("l")
+    query, lo, hi = index._last
+    assert index.search("lo") == ['Europe/London', 'America/Los_Angeles']
+    query, narrowed_lo, narrowed_hi = index._last
+    assert lo <= narrowed_lo <= narrowed_hi <= hi
+    assert index.search("lon") == ['Europe/London']
+    # A query that is not an extension of the last one searches everything
+    assert index.search("tok") == ['Asia/Tokyo']
+
+def test_timezone_search_aliases_and_typos():
+    index = TimezoneIndex(ZONES, aliases=[("Mumbai", 'Asia/Kolkata'), ("GMT", 'Europe/London')])
+    assert index.search("mumb") == ['Asia/Kolkata']
+    assert index.search("gmt") == ['Europe/London']
+    assert index.search("tokyp") == ['Asia/Tokyo']
+    assert index.search("xyzzy") == []
+
+def test_timezone_resolve():
+    index = TimezoneIndex(ZONES, aliases=[("Mumbai", 'Asia/Kolkata')])
+    assert index.resolve('Asia/Tokyo') == 'Asia/Tokyo'
+    assert index.resolve('los angeles') == 'America/Los_Angeles'
+    assert index.resolve('Mumbai') == 'Asia/Kolkata'
+    assert index.resolve('Atlantis') is None
+
+# ClockStore and loading from it
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / "clock.db")
+
+def test_store_round_trips_alarms(store_path):
+    store = ClockStore(store_path)
+    tea = Alarm.from_12h(6, 5, "PM", "Tea", "Chime", ["Sat", "Sun"], False)
+    wake = Alarm.from_12h(12, 0, "AM", "Wake")
+    store.add_alarms([tea, wake])
+    assert (tea.id, wake.id) == (1, 2)
+    wake.label = "Up"
+    wake.repeat_mask = EVERY_DAY
+    store.update_alarm(wake)
+    loaded = ClockStore(store_path).load_alarms()
+    assert [(alarm.id, alarm.minute_of_day, alarm.label, alarm.tone, alarm.repeat, alarm.active)
+            for alarm in loaded] == [
+        (1, 18 * 60 + 5, "Tea", "Chime", ["Sat", "Sun"], False),
+        (2, 0, "Up", "Classic Alarm", ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"], True)]
+
+def test_store_migrates_12_hour_rows(store_path):
+    conn = sqlite3.connect(store_path)
+    conn.execute("CREATE TABLE alarms (id INTEGER PRIMARY KEY, hour INTEGER NOT NULL, "
+                 "minute INTEGER NOT NULL, ampm TEXT NOT NULL, label TEXT NOT NULL, "
+                 "tone TEXT NOT NULL, repeat TEXT NOT NULL, active INTEGER NOT NULL)")
+    conn.executemany("INSERT INTO alarms VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+        (3, 6, 5, "PM", "Tea", "Chime", "Sat,Sun", 0),
+        (7, 12, 30, "AM", "Late", "Classic Alarm", "", 1)])
+    conn.commit()
+    conn.close()
+    store = ClockStore(store_path)
+    assert [(alarm.id, alarm.minute_of_day, alarm.label, alarm.repeat, alarm.active)
+            for alarm in store.load_alarms()] == [(3, 18 * 60 + 5, "Tea", ["Sat", "Sun"], False),
+                                                  (7, 30, "Late", [], True)]
+    store.add_alarm(Alarm(60))
+    assert [alarm.id for alarm in ClockStore(store_path).load_alarms()] == [3, 7, 8]
+
+def test_store_bulk_changes(store_path):
+    store = ClockStore(store_path)
+    alarms = [Alarm(minute) for minute in range(10)]
+    store.add_alarms(alarms)
+    store.set_alarms_active([1, 2, 3], False)
+    store.delete_alarm_ids([4, 5])
+    store.delete_alarm(alarms[0])
+    loaded = store.load_alarms()
+    assert [alarm.id for alarm in loaded] == [2, 3, 6, 7, 8, 9, 10]
+    assert [alarm.active for alarm in loaded[:3]] == [False, False, True]
+    # Shards split the alarms by ID
+    assert [alarm.id for alarm in store.load_alarms(3, 0)] == [3, 6, 9]
+
+def test_store_rolls_back_a_failed_transaction(store_path):
+    store = ClockStore(store_path)
+    with pytest.raises(RuntimeError):
+        with store.transaction():
+            store.add_alarm(Alarm(60))
+            raise RuntimeError
+    assert store.load_alarms() == []
+
+def test_store_world_clocks_and_settings(store_path):
+    store = ClockStore(store_path)
+    for tz_name in ('Asia/Tokyo', 'UTC', 'Asia/Tokyo'):
+        store.add_world_clock(tz_name)
+    store.remove_world_clock('Asia/Tokyo')
+    store.save_settings({'volume': 30, 'theme': "dark"})
+    store.save_settings({'volume': 40})
+    store = ClockStore(store_path)
+    assert store.load_world_clocks() == ['UTC', 'Asia/Tokyo']
+    assert store.load_settings() == {'volume': '40', 'theme': "dark"}
+
+def test_cold_start_schedules_stored_alarms(store_path):
+    store = ClockStore(store_path)
+    store.add_alarms([Alarm(7 * 60, "Once"), Alarm(6 * 60, "Daily", repeat_mask=EVERY_DAY),
+                      Alarm(5 * 60, "Off", active=False)])
+    clock = VirtualClock(MONDAY)
+    engine = AlarmEngine(EventLoop(clock), ClockStore(store_path), clock)
+    engine.load()
+    assert sorted(engine.alarms) == [1, 2, 3]
+    assert [(when.hour, alarm.label) for when, alarm in engine.upcoming(MONDAY)[:3]] == [
+        (6, "Daily"), (7, "Once"), (6, "Daily")]
+    assert engine.scheduler.next_fire_time(engine.alarms[3]) is None
+    # New alarms continue the stored IDs
+    assert engine.add_alarm(9, 0, "AM").id == 4
+
+# AlarmEngine against a VirtualClock and EventLoop
+
+def test_one_shot_alarm_fires_once_and_switches_off():
+    engine, loop, notifier = make_engine()
+    alarm = engine.add_alarm(7, 0, "AM", "Wake up")
+    loop.advance(at(6, 59))
+    assert notifier.fired == []
+    loop.advance(60)
+    assert notifier.fired == [alarm.id]
+    assert not alarm.active
+    assert engine.history[-1].late < 1
+    engine.dismiss()
+    loop.advance(at(0, days=3))
+    assert notifier.fired == [alarm.id]
+
+def test_repeating_alarm_fires_on_its_days_only():
+    engine, loop, notifier = make_engine()
+    alarm = engine.add_alarm(6, 30, "AM", "Gym", repeat=["Wed", "Fri"])
+    for day in range(14):
+        loop.advance(at(24))
+        engine.dismiss()
+    dues = [firing.due for firing in engine.history]
+    assert [due.strftime('%a %d') for due in dues] == ['Wed 03', 'Fri 05', 'Wed 10', 'Fri 12']
+    assert all(due.hour == 6 and due.minute == 30 for due in dues)
+    assert notifier.fired == [alarm.id] * 4
+    assert alarm.active
+
+def test_alarms_due_together_ring_in_turn():
+    engine, loop, notifier = make_engine()
+    first = engine.add_alarm(8, 0, "AM", "First")
+    second = engine.add_alarm(8, 0, "AM", "Second")
+    loop.advance(at(8, 1))
+    assert notifier.fired == [first.id]
+    engine.dismiss()
+    assert notifier.fired == [first.id, second.id]
+
+def test_inactive_alarm_does_not_fire():
+    engine, loop, notifier = make_engine()
+    engine.add_alarm(7, 0, "AM", active=False)
+    loop.advance(at(0, days=2))
+    assert notifier.fired == []
+
+def test_edited_alarm_fires_at_its_new_time():
+    engine, loop, notifier = make_engine()
+    alarm = engine.add_alarm(7, 0, "AM")
+    engine.edit_alarm(alarm, hour=9, repeat=["Mon"])
+    loop.advance(at(8))
+    assert notifier.fired == []
+    loop.advance(at(1))
+    assert notifier.fired == [alarm.id]
+    assert alarm.active
+    with pytest.raises(InvalidAlarmError):
+        engine.edit_alarm(alarm, hour=13)
+
+def test_deleted_alarm_does_not_fire():
+    engine, loop, notifier = make_engine()
+    alarm = engine.add_alarm(7, 0, "AM")
+    engine.delete(alarm)
+    loop.advance(at(8))
+    assert notifier.fired == []
+    assert engine.alarms == {}
+
+def test_snooze_rings_again_later():
+    engine, loop, notifier = make_engine()
+    alarm = engine.add_alarm(7, 0, "AM")
+    loop.advance(at(7, 0) + 1)
+    snoozed = engine.snooze(minutes=10)
+    assert not engine.sounding
+    loop.advance(at(0, 10))
+    assert notifier.fired == [alarm.id, snoozed.id]
+    engine.dismiss()
+    # The spent snooze alarm does not stay in the list
+    assert list(engine.alarms) == [alarm.id]
+
+def test_engine_agenda_lists_next_firings():
+    engine, loop, notifier = make_engine()
+    engine.add_alarm(9, 0, "PM", "Daily", repeat=["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"])
+    engine.add_alarm(7, 0, "AM", "Once")
+    upcoming = engine.upcoming()
+    assert [(when.day, when.hour, alarm.label) for when, alarm in upcoming[:3]] == [
+        (1, 7, "Once"), (1, 21, "Daily"), (2, 21, "Daily")]
+
+# Catch-up from the watermark after a stall or a restart
+
+def test_stall_within_grace_rings_late():
+    engine, loop, notifier = make_engine()
+    alarm = engine.add_alarm(8, 0, "AM")
+    # The clock jumps without the loop getting to run, as in a suspend
+    engine.clock.advance(at(8, 30))
+    engine.check_alarms()
+    assert notifier.fired == [alarm.id]
+    assert notifier.missed == []
+    assert engine.history[-1].late == pytest.approx(1800)
+
+def test_stall_beyond_grace_is_missed():
+    engine, loop, notifier = make_engine()
+    alarm = engine.add_alarm(8, 0, "AM")
+    engine.clock.advance(at(9, 30))
+    engine.check_alarms()
+    assert notifier.fired == []
+    assert notifier.missed == [(alarm.id, MONDAY.replace(hour=8))]
+    assert engine.history[-1].missed
+    assert not alarm.active
+
+def test_changes_during_a_stall_leave_firing_to_the_wakeup(store_path):
+    engine, loop, notifier = make_engine(ClockStore(store_path))
+    overdue = engine.add_alarm(8, 0, "AM")
+    other = engine.add_alarm(9, 0, "AM", repeat=["Mon"])
+    loop.advance(at(7))
+    watermark = engine.store.load_settings()[engine.WATERMARK_KEY]
+    engine.clock.advance(at(1, 30))
+    new = engine.add_alarm(8, 15, "AM")
+    engine.edit_alarm(other, label="Standup")
+    engine.toggle(new)
+    engine.toggle(new)
+    assert notifier.fired == notifier.missed == []
+    assert engine.store.load_settings()[engine.WATERMARK_KEY] == watermark
+    # Changed alarms are scheduled from now, not from the watermark
+    assert engine.scheduler.next_fire_time(new) == MONDAY.replace(hour=8, minute=15, day=2)
+    engine.check_alarms()
+    assert notifier.fired == [overdue.id]
+    assert engine.watermark == MONDAY.replace(hour=8, minute=30)
+
+def test_long_stall_reports_each_skipped_occurrence():
+    engine, loop, notifier = make_engine()
+    metrics = Metrics().attach(engine)
+    alarm = engine.add_alarm(8, 0, "AM", repeat=["Mon", "Tue", "Wed", "Thu", "Fri"])
+    engine.clock.advance(at(8, 10, days=3))
+    engine.check_alarms()
+    # Only Thursday's ring is within grace; the days before it are missed
+    skipped = [datetime.datetime(2024, 1, day, 8) for day in (1, 2, 3)]
+    assert notifier.missed == [(alarm.id, due) for due in skipped]
+    assert notifier.fired == [alarm.id]
+    assert [(firing.due, firing.missed) for firing in engine.history] == [
+        (due, True) for due in skipped] + [(datetime.datetime(2024, 1, 4, 8), False)]
+    assert metrics.counters == {('alarms_missed_total', 'repeating'): 3}
+
+def restart(store_path, start):
+    engine, loop, notifier = make_engine(ClockStore(store_path), start)
+    engine.load()
+    loop.run_due()
+    return engine, loop, notifier
+
+def test_restart_catches_up_within_grace(store_path):
+    engine, loop, notifier = make_engine(ClockStore(store_path))
+    alarm = engine.add_alarm(8, 0, "AM")
+    loop.advance(at(7, 50))
+    engine.store.conn.close()
+
+    engine, loop, notifier = restart(store_path, MONDAY.replace(hour=8, minute=20))
+    assert notifier.fired == [alarm.id]
+    assert not engine.alarms[alarm.id].active
+    assert engine.history[-1].late == pytest.approx(1200)
+
+def test_restart_beyond_grace_reports_missed(store_path):
+    engine, loop, notifier = make_engine(ClockStore(store_path))
+    alarm = engine.add_alarm(8, 0, "AM")
+    engine.grace_minutes = 15
+    loop.advance(at(7, 50))
+    engine.store.conn.close()
+
+    start = MONDAY.replace(hour=8, minute=20)
+    engine, loop, notifier = make_engine(ClockStore(store_path), start)
+    engine.grace_minutes = 15
+    engine.load()
+    loop.run_due()
+    assert notifier.fired == []
+    assert notifier.missed == [(alarm.id, MONDAY.replace(hour=8))]
+    # Handled alarms are not caught up a second time
+    engine.store.conn.close()
+    engine, loop, notifier = restart(store_path, start)
+    assert notifier.fired == notifier.missed == []
+
+def test_restart_ignores_watermark_ahead_of_now(store_path):
+    engine, loop, notifier = make_engine(ClockStore(store_path), MONDAY.replace(hour=9))
+    engine.add_alarm(8, 0, "AM", repeat=["Mon"])
+    loop.advance(60)
+    engine.store.conn.close()
+
+    # The clock was set back: nothing between now and the watermark rings twice
+    engine, loop, notifier = restart(store_path, MONDAY.replace(hour=7))
+    assert notifier.fired == []
+    loop.advance(at(1, 1))
+    assert len(notifier.fired) == 1
+
+# AlarmIndex
+
+def sample_alarms():
+    return [Alarm(7 * 60, "Wake", repeat_mask=31, id=1),
+            Alarm(6 * 60, "gym", id=2),
+            Alarm(22 * 60, "Bed", repeat_mask=EVERY_DAY, id=3),
+            Alarm(12 * 60, "Lunch", active=False, id=4),
+            Alarm(7 * 60, "Walk", active=False, id=5)]
+
+def ids(alarms):
+    return [alarm.id for alarm in alarms]
+
+def test_index_pages_in_sort_order():
+    index = AlarmIndex(sample_alarms())
+    assert len(index) == 5
+    assert ids(index.page(0, 2)) == [2, 1]
+    assert ids(index.page(2, 10)) == [5, 4, 3]
+    assert index.page(5, 10) == []
+    index.set_sort('label')
+    assert ids(index.page(0, 5)) == [3, 2, 4, 1, 5]
+    index.set_sort('label', descending=True)
+    assert ids(index.page(0, 2)) == [5, 1]
+    assert ids(index.page(4, 2)) == [3]
+    assert index.position(index.alarms[3]) == 4
+
+def test_index_filters_combine():
+    index = AlarmIndex(sample_alarms())
+    index.set_filters(status='active')
+    assert ids(index.page(0, 10)) == [2, 1, 3]
+    index.set_filters(status='active', repeat='repeating')
+    assert ids(index.page(0, 10)) == [1, 3]
+    index.set_filters(time=(6 * 60, 7 * 60), label="w")
+    assert ids(index.page(0, 10)) == [1, 5]
+    assert index.position(index.alarms[3]) is None
+    index.set_filters(label=None)
+    assert len(index) == 5
+
+def test_index_patched_on_changes():
+    alarms = sample_alarms()
+    index = AlarmIndex(alarms)
+    index.set_filters(status='active')
+    assert len(index) == 3
+    version = index.version
+    index.add(Alarm(5 * 60, "Early", id=6))
+    assert ids(index.page(0, 2)) == [6, 2]
+    alarms[0].active = False
+    index.update(alarms[0])
+    assert ids(index.page(0, 10)) == [6, 2, 3]
+    index.remove(alarms[2])
+    index.remove(alarms[2])
+    assert ids(index.page(0, 10)) == [6, 2]
+    assert index.version > version
+    # The patched view is what a rebuild would give
+    assert index.view == index._build_view()
+
+def test_index_views_match_a_plain_sort():
+    rng = random.Random(2)
+    alarms = [Alarm(rng.randrange(1440), rng.choice(["Wake", "walk", "Gym", "Tea"]),
+                    repeat_mask=rng.choice((0, 31, 127)), active=rng.random() < 0.7, id=alarm_id)
+              for alarm_id in range(1, 501)]
+    index = AlarmIndex(alarms)
+    for step in range(50):
+        filters = {'time': rng.choice((None, (0, 59), (360, 720))),
+                   'label': rng.choice((None, "w", "wa", "tea")),
+                   'repeat': rng.choice((None, 'once', 'repeating')),
+                   'status': rng.choice((None, 'active', 'inactive'))}
+        field = rng.choice(AlarmIndex.FIELDS)
+        index.set_filters(**filters)
+        index.set_sort(field)
+        expected = sorted((AlarmIndex.key_of(alarm)[AlarmIndex.FIELDS.index(field)], alarm.id)
+                          for alarm in alarms
+                          if index._matches(AlarmIndex.key_of(alarm), index._ranges()))
+        assert ids(index.page(0, len(alarms))) == [alarm_id for key, alarm_id in expected]
+
+# LapLog and Stopwatch
+
+LAPS_NS = [61500000000, 59250000000, 63000000001, 60000000000]
+
+def make_laps():
+    laps = LapLog()
+    total = 0
+    for lap_ns in LAPS_NS:
+        total += lap_ns
+        assert laps.append(total) == lap_ns
+    return laps
+
+def test_lap_log_stats_are_exact():
+    stats = make_laps().stats()
+    assert stats['laps'] == 4
+    assert stats['fastest'] == (2, 59250000000)
+    assert stats['slowest'] == (3, 63000000001)
+    assert stats['mean_ns'] == sum(LAPS_NS) // 4
+    assert stats['stddev_ns'] == int(statistics.stdev(LAPS_NS))
+    assert LapLog().stats()['mean_ns'] is None
+    assert LapLog().stddev_ns() is None
+
+def test_lap_log_rows_window():
+    laps = make_laps()
+    assert list(laps.rows(1, 2)) == [(2, 120750000000, 59250000000),
+                                     (3, 183750000001, 63000000001)]
+    assert [laps.lap_ns(i) for i in range(4)] == LAPS_NS
+
+def test_lap_log_exports():
+    laps = make_laps()
+    f = io.StringIO()
+    laps.write_csv(f)
+    rows = list(csv.reader(io.StringIO(f.getvalue())))
+    assert rows[0] == ["lap", "total", "lap_time", "total_ns", "lap_ns"]
+    assert rows[2] == ["2", "00:02:00.75", "00:00:59.25", "120750000000", "59250000000"]
+    assert len(rows) == 5
+    f = io.StringIO()
+    laps.write_json(f)
+    exported = json.loads(f.getvalue())
+    assert [lap['lap_ns'] for lap in exported['laps']] == LAPS_NS
+    assert exported['stats']['fastest'] == [2, 59250000000]
+
+def test_format_duration_ns():
+    assert format_duration_ns(3723456789012) == "01:02:03.45"
+    assert format_duration_ns(3723456789012, 0) == "01:02:03"
+    assert format_duration_ns(999999999, 3) == "00:00:00.999"
+
+def test_stopwatch_counts_only_while_running():
+    now = [0]
+    watch = Stopwatch(clock=lambda: now[0])
+    watch.start()
+    now[0] = 5000
+    watch.stop()
+    now[0] = 9000
+    assert watch.elapsed_ns() == 5000
+    watch.start()
+    now[0] = 10000
+    assert watch.lap() == (6000, 6000)
+    now[0] = 12000
+    assert watch.lap() == (8000, 2000)
+    watch.reset()
+    assert watch.elapsed_ns() == 0
+    assert len(watch.laps) == 0
+
+# TickScheduler
+
+def test_ticks_due_close_together_share_a_wakeup():
+    clock = VirtualClock(MONDAY)
+    loop = EventLoop(clock)
+    ticker = TickScheduler(loop, clock)
+    ticks = []
+
+    def every(name, ms):
+        def tick():
+            ticks.append((name, clock.monotonic_ns() // 1000000))
+            return ms
+        return tick
+    ticker.add('clock', every('clock', 1000))
+    # 3 ms apart from the clock tick: within BATCH_NS, so run with it
+    clock.advance(0.003)
+    ticker.add('world', every('world', 1000))
+    ticks.clear()
+    ticker.wakeups = 0
+    loop.advance(10)
+    assert ticker.wakeups == 10
+    assert sorted(name for name, ms in ticks) == ['clock'] * 10 + ['world'] * 10
+
+def test_idle_tick_waits_for_refresh():
+    clock = VirtualClock(MONDAY)
+    loop = EventLoop(clock)
+    ticker = TickScheduler(loop, clock)
+    calls = []
+    ticker.add('next_alarm', lambda: calls.append(clock.monotonic_ns()))
+    loop.advance(60)
+    assert len(calls) == 1
+    ticker.refresh('next_alarm')
+    assert len(calls) == 2
+    ticker.add('fast', lambda: 100)
+    ticker.remove('fast')
+    loop.advance(60)
+    assert len(calls) == 2
+    assert len(loop.queue) == 0
+
+def test_ticks_land_just_after_the_second():
+    clock = VirtualClock(MONDAY)
+    clock.advance(0.25)
+    ticker = TickScheduler(EventLoop(clock), clock)
+    assert ticker.ms_to_next_second() == 750 + TickScheduler.SECOND_MARGIN_MS
@@ -0,0 +1,214 @@
+import datetime
+import io
+import os
+import time
+
+import pytest
+
+from clock_engine import Alarm, AlarmEngine, EventLoop, InvalidAlarmError, VirtualClock
+from clock_io import (AlarmImporter, parse_datetime, read_csv, read_icalendar, shift_mask,
+                      write_csv, write_icalendar)
+
+def read(reader, text):
+    return list(reader(io.StringIO(text)))
+
+def alarms(results):
+    return [(alarm.minute_of_day, alarm.label, alarm.repeat, alarm.active)
+            for line, alarm in results]
+
+@pytest.fixture
+def local_zone():
+    # Run with the process timezone set to the zone the test asks for
+    saved = os.environ.get('TZ')
+
+    def use(name):
+        os.environ['TZ'] = name
+        time.tzset()
+    yield use
+    if saved is None:
+        os.environ.pop('TZ', None)
+    else:
+        os.environ['TZ'] = saved
+    time.tzset()
+
+def calendar(*lines):
+    return "\r\n".join(("BEGIN:VCALENDAR", "VERSION:2.0") + lines + ("END:VCALENDAR", ""))
+
+# CSV
+
+def test_csv_columns_in_any_order_and_case():
+    results = read(read_csv, "Label,Repeat,TIME,active\n"
+                             "Wake,weekdays,7:30 AM,yes\n"
+                             "Tea,Sat;Sun,17:05,0\n"
+                             ",,12:00 am,\n")
+    assert [line for line, alarm in results] == [2, 3, 4]
+    assert alarms(results) == [
+        (450, "Wake", ["Mon", "Tue", "Wed", "Thu", "Fri"], True),
+        (1025, "Tea", ["Sat", "Sun"], False),
+        (0, "Alarm", [], True)]
+
+def test_csv_hour_minute_columns():
+    results = read(read_csv, "hour,minute,ampm,repeat\n9,5,PM,daily\n")
+    assert alarms(results) == [(21 * 60 + 5, "Alarm", ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat",
+                                                         "Sun"], True)]
+
+def test_csv_bad_rows_are_reported_by_line():
+    results = read(read_csv, "time,repeat\n"
+                             "7:00,Mon\n"
+                             "\n"
+                             "25:00,\n"
+                             "7:00,Someday\n"
+                             "noon,\n"
+                             "8:00,Tue\n")
+    errors = [(line, str(result)) for line, result in results
+              if isinstance(result, InvalidAlarmError)]
+    assert errors == [(4, "Hour must be between 0 and 23"), (5, "Unknown repeat day: Someday"),
+                      (6, "Unrecognised time: 'noon'")]
+    assert [alarm.minute_of_day for line, alarm in results
+            if not isinstance(alarm, InvalidAlarmError)] == [420, 480]
+
+def test_csv_without_time_column_is_rejected():
+    (line, error), = read(read_csv, "label,tone\nWake,Chime\n")
+    assert isinstance(error, InvalidAlarmError)
+
+def test_csv_round_trip():
+    original = [alarm for line, alarm in read(read_csv, "time,label,repeat,active\n"
+                                                        "6:45 AM,\"Gym, early\",Mon;Thu,1\n"
+                                                        "11:59 PM,Late,,0\n")]
+    f = io.StringIO()
+    write_csv(f, original)
+    assert alarms(read(read_csv, f.getvalue())) == alarms((0, alarm) for alarm in original)
+
+# iCalendar
+
+def test_icalendar_event_with_weekly_rule(local_zone):
+    local_zone('UTC')
+    results = read(read_icalendar, calendar(
+        "BEGIN:VEVENT",
+        "DTSTART:20240101T063000",
+        "RRULE:FREQ=WEEKLY;BYDAY=MO,WE,FR",
+        "SUMMARY:Run\\, then coffee",
+        "END:VEVENT"))
+    assert alarms(results) == [(390, "Run, then coffee", ["Mon", "Wed", "Fri"], True)]
+
+def test_icalendar_valarm_triggers(local_zone):
+    local_zone('UTC')
+    results = read(read_icalendar, calendar(
+        "BEGIN:VEVENT",
+        "DTSTART:20240101T090000",
+        "DTEND:20240101T100000",
+        "BEGIN:VALARM",
+        "TRIGGER:-PT15M",
+        "END:VALARM",
+        "BEGIN:VALARM",
+        "TRIGGER;RELATED=END:PT5M",
+        "END:VALARM",
+        "END:VEVENT"))
+    assert [alarm.minute_of_day for line, alarm in results] == [8 * 60 + 45, 10 * 60 + 5]
+
+def test_icalendar_trigger_before_midnight_moves_repeat_days(local_zone):
+    local_zone('UTC')
+    results = read(read_icalendar, calendar(
+        "BEGIN:VEVENT",
+        "DTSTART:20240102T000500",
+        "RRULE:FREQ=WEEKLY;BYDAY=TU",
+        "BEGIN:VALARM",
+        "TRIGGER:-PT10M",
+        "END:VALARM",
+        "END:VEVENT"))
+    assert alarms(results) == [(23 * 60 + 55, "Alarm", ["Mon"], True)]
+
+def test_icalendar_tzid_shifts_repeat_days_back(local_zone):
+    # Monday 08:30 in Tokyo is Sunday 18:30 in New York
+    local_zone('America/New_York')
+    results = read(read_icalendar, calendar(
+        "BEGIN:VEVENT",
+        "DTSTART;TZID=Asia/Tokyo:20240108T083000",
+        "RRULE:FREQ=WEEKLY;BYDAY=MO,WE",
+        "SUMMARY:Standup",
+        "END:VEVENT"))
+    assert alarms(results) == [(18 * 60 + 30, "Standup", ["Tue", "Sun"], True)]
+
+def test_icalendar_tzid_shifts_repeat_days_forward(local_zone):
+    # Friday 22:00 in Los Angeles is Saturday 06:00 in London
+    local_zone('Europe/London')
+    results = read(read_icalendar, calendar(
+        "BEGIN:VEVENT",
+        "DTSTART;TZID=\"America/Los_Angeles\":20240105T220000",
+        "RRULE:FREQ=WEEKLY;BYDAY=FR,SU",
+        "END:VEVENT"))
+    assert alarms(results) == [(6 * 60, "Alarm", ["Mon", "Sat"], True)]
+
+def test_icalendar_utc_and_unknown_zones(local_zone):
+    local_zone('America/New_York')
+    assert parse_datetime("20240101T120000Z", {}).hour == 7
+    # Zones only the sending calendar knows are taken as local time
+    assert parse_datetime("20240101T120000", {'TZID': 'Custom/Office'}).hour == 12
+    assert parse_datetime("20240101T120000", {}).hour == 12
+
+def test_icalendar_bad_events_are_reported_by_begin_line(local_zone):
+    local_zone('UTC')
+    results = read(read_icalendar, calendar(
+        "BEGIN:VEVENT",
+        "DTSTART:20240101T070000",
+        "RRULE:FREQ=MONTHLY",
+        "END:VEVENT",
+        "BEGIN:VEVENT",
+        "SUMMARY:No start",
+        "END:VEVENT",
+        "BEGIN:VEVENT",
+        "DTSTART:20240101T080000",
+        "STATUS:CANCELLED",
+        "END:VEVENT"))
+    assert [(line, str(result)) for line, result in results[:2]] == [
+        (3, "Unsupported recurrence: FREQ=MONTHLY"), (7, "Event has no DTSTART")]
+    assert alarms(results[2:]) == [(480, "Alarm", [], False)]
+
+def test_icalendar_folded_lines(local_zone):
+    local_zone('UTC')
+    results = read(read_icalendar, calendar(
+        "BEGIN:VEVENT",
+        "DTSTART:2024010",
+        " 1T070000",
+        "SUMMARY:A very",
+        "  long label",
+        "END:VEVENT"))
+    assert alarms(results) == [(420, "A very long label", [], True)]
+
+def test_icalendar_round_trip(local_zone):
+    local_zone('UTC')
+    original = [alarm for line, alarm in read(read_csv, "time,label,repeat,active\n"
+                                                        "6:45 AM,Gym,Mon;Thu,1\n"
+                                                        "11:59 PM,\"Late; very\",,0\n")]
+    f = io.StringIO()
+    write_icalendar(f, original, datetime.datetime(2024, 1, 1, 12))
+    assert alarms(read(read_icalendar, f.getvalue())) == alarms((0, alarm) for alarm in original)
+
+def test_icalendar_output_depends_only_on_now(local_zone):
+    local_zone('Asia/Tokyo')
+    f = io.StringIO()
+    write_icalendar(f, [Alarm(7 * 60, "Wake", id=1)], datetime.datetime(2024, 1, 1, 9, 30))
+    # DTSTAMP is the given local time in UTC, not the time of the export
+    assert "DTSTAMP:20240101T003000Z\r\n" in f.getvalue()
+    assert "DTSTART:20240102T070000\r\n" in f.getvalue()
+
+def test_shift_mask_wraps_around_the_week():
+    monday, sunday = 1, 1 << 6
+    assert shift_mask(sunday, 1) == monday
+    assert shift_mask(monday, -1) == sunday
+    assert shift_mask(monday | sunday, 7) == monday | sunday
+
+# Importing into an engine
+
+def test_importer_adds_in_batches(tmp_path):
+    path = tmp_path / "alarms.csv"
+    path.write_text("\ufefftime,label\n" + "".join(f"{hour}:00,A{hour}\n" for hour in range(24))
+                    + "bad,row\n", encoding='utf-8')
+    clock = VirtualClock()
+    engine = AlarmEngine(EventLoop(clock), clock=clock)
+    importer = AlarmImporter.open(engine, str(path), batch_size=10)
+    assert len(importer.step()) == 10
+    importer.run()
+    assert importer.imported == len(engine.alarms) == 24
+    assert importer.errors == [(26, "Unrecognised time: 'bad'")]
+    assert importer.summary().startswith("Imported 24 alarms, skipped 1 invalid rows")
@@ -0,0 +1,79 @@
+import datetime
+import json
+
+import pytest
+
+from clock_engine import AlarmEngine, EventLoop, VirtualClock
+from clock_metrics import BUCKETS, Histogram, Metrics
+
+def test_histogram_buckets_and_quantiles():
+    histogram = Histogram()
+    for value in (0.0001, 0.003, 0.003, 0.04, 500.0):
+        histogram.observe(value)
+    assert histogram.count == 5
+    assert histogram.sum == pytest.approx(500.0461)
+    assert histogram.counts[BUCKETS.index(0.0005)] == 1
+    assert histogram.counts[BUCKETS.index(0.005)] == 2
+    assert histogram.counts[-1] == 1
+    assert histogram.quantile(0.5) == 0.005
+    assert histogram.quantile(0.2) == 0.0005
+    # The +Inf bucket reports the largest value seen
+    assert histogram.quantile(1.0) == 500.0
+    assert Histogram().quantile(0.5) == 0.0
+
+def test_timed_records_callback_duration():
+    ticks = iter([1000, 3001000])
+    metrics = Metrics(clock=lambda: next(ticks))
+    assert metrics.timed('redraw', lambda x: x * 2, 21) == 42
+    histogram = metrics.histograms['callback_seconds', 'redraw']
+    assert (histogram.count, histogram.max) == (1, 0.003)
+
+def test_negative_latencies_count_as_zero():
+    metrics = Metrics()
+    metrics.observe('tick_lag_seconds', 'clock', -0.25)
+    assert metrics.histograms['tick_lag_seconds', 'clock'].max == 0.0
+
+def test_prometheus_text():
+    metrics = Metrics(prefix="test")
+    metrics.observe('tick_lag_seconds', 'clock', 0.0015)
+    metrics.observe('tick_lag_seconds', 'clock', 0.3)
+    metrics.count('alarms_missed_total', 'once', 2)
+    lines = metrics.prometheus().splitlines()
+    assert "# TYPE test_alarms_missed_total counter" in lines
+    assert 'test_alarms_missed_total{kind="once"} 2' in lines
+    assert "# TYPE test_tick_lag_seconds histogram" in lines
+    # Buckets are cumulative
+    assert 'test_tick_lag_seconds_bucket{loop="clock",le="0.001"} 0' in lines
+    assert 'test_tick_lag_seconds_bucket{loop="clock",le="0.002"} 1' in lines
+    assert 'test_tick_lag_seconds_bucket{loop="clock",le="+Inf"} 2' in lines
+    assert 'test_tick_lag_seconds_count{loop="clock"} 2' in lines
+
+def test_dump_writes_json_or_prometheus(tmp_path):
+    metrics = Metrics()
+    metrics.observe('callback_seconds', 'check_alarms', 0.004)
+    metrics.dump(str(tmp_path / "metrics.json"))
+    metrics.dump(str(tmp_path / "metrics.prom"))
+    dumped = json.loads((tmp_path / "metrics.json").read_text())
+    entry = dumped['metrics']['callback_seconds']['check_alarms']
+    assert (entry['count'], entry['p50']) == (1, 0.004)
+    assert (tmp_path / "metrics.prom").read_text().startswith(
+        "# HELP alarm_clock_callback_seconds")
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["metrics.json", "metrics.prom"]
+
+def test_engine_reports_fire_latency_and_missed_alarms():
+    clock = VirtualClock(datetime.datetime(2024, 1, 1))
+    loop = EventLoop(clock)
+    engine = AlarmEngine(loop, clock=clock)
+    metrics = Metrics().attach(engine, engine.scheduler)
+    engine.add_alarm(7, 0, "AM")
+    engine.add_alarm(8, 0, "AM", repeat=["Mon"])
+    loop.advance(7 * 3600 + 30)
+    engine.dismiss()
+    # Suspended past the second alarm's grace window
+    clock.advance(3 * 3600)
+    engine.check_alarms()
+    latency = metrics.histograms['alarm_fire_latency_seconds', 'once']
+    assert latency.count == 1
+    assert latency.max < 1
+    assert metrics.counters == {('alarms_missed_total', 'repeating'): 1}
+    assert metrics.histograms['callback_seconds', 'check_alarms'].count >= 1